@@ -0,0 +1,94 @@
+"""
+Compare table export throughput of the streaming engine in `export.py`
+against the original row-by-row writer.
+
+    python benchmarks/bench_export.py [--rows N] [--format csv|tsv|tex]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from export import escape_latex, export_table  # noqa: E402
+
+
+def make_table(nrows: int):
+    rng = np.random.default_rng(0)
+    cols = [
+        fits.Column(name="ID", format="K", array=np.arange(nrows)),
+        fits.Column(name="RA", format="D", array=rng.uniform(0, 360, nrows)),
+        fits.Column(name="DEC", format="D", array=rng.uniform(-90, 90, nrows)),
+        fits.Column(name="MAG", format="E", array=rng.normal(18, 2, nrows)),
+        fits.Column(name="FLAG", format="J", array=rng.integers(0, 4, nrows)),
+        fits.Column(name="NAME", format="12A", array=np.char.add("src_", np.arange(nrows).astype(str))),
+    ]
+    return fits.BinTableHDU.from_columns(cols).data
+
+
+def legacy_export(data, path: str, fmt: str) -> None:
+    """
+    The row-wise writer `MainWindow._exportTable` used before the export engine
+    """
+    col_names = data.names
+    sep = "\t" if fmt == "tsv" else ","
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "tex":
+            f.write("\\begin{tabular}{" + " | ".join(["l"] * len(col_names)) + "}\n")
+            f.write("\\hline\n")
+            f.write(" & ".join(escape_latex(s) for s in col_names) + " \\\\\n\\hline\n")
+        else:
+            f.write(sep.join(col_names) + "\n")
+        for row in range(len(data)):
+            row_data = []
+            for col in col_names:
+                val = data[col][row]
+                if isinstance(val, bytes):
+                    val = val.decode(errors="ignore")
+                row_data.append(escape_latex(str(val)) if fmt == "tex" else str(val))
+            if fmt == "tex":
+                f.write(" & ".join(row_data) + " \\\\\n")
+            else:
+                f.write(sep.join(row_data) + "\n")
+        if fmt == "tex":
+            f.write("\\hline\n\\end{tabular}\n")
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--format", default="csv", choices=["csv", "tsv", "tex"])
+    args = parser.parse_args()
+
+    data = make_table(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        new_path = os.path.join(tmp, "new." + args.format)
+        old_path = os.path.join(tmp, "old." + args.format)
+
+        t_new = timed(export_table, data, new_path, args.format)
+        t_old = timed(legacy_export, data, old_path, args.format)
+
+        with open(new_path, encoding="utf-8") as a, open(old_path, encoding="utf-8") as b:
+            identical = a.read() == b.read()
+
+    print(f"rows:      {args.rows}")
+    print(f"legacy:    {t_old:8.3f} s  {args.rows / t_old:12,.0f} rows/s")
+    print(f"streaming: {t_new:8.3f} s  {args.rows / t_new:12,.0f} rows/s")
+    print(f"speedup:   {t_old / t_new:8.1f}x")
+    print(f"identical output: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+"""
+Headless benchmark suite for the viewer's hot paths.
+
+Synthetic FITS files are generated once, then every case runs in its own
+process under QT_QPA_PLATFORM=offscreen so that wall time and peak RSS are
+measured in isolation.
+
+    python benchmarks/suite.py                       # run everything
+    python benchmarks/suite.py -k table --scale 0.5  # subset, smaller data
+    python benchmarks/suite.py --save baseline.json
+    python benchmarks/suite.py --compare baseline.json --threshold 1.25
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from queue import Empty
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+
+
+def _setup():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, SRC_DIR)
+    sys.path.insert(0, BENCH_DIR)
+
+    from PyQt6.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+# Views a case waited on and their application, kept until `_drain` so that
+# jobs still running can report back to them
+_waited = []
+
+
+def _wait_render(app, view) -> None:
+    """
+    Wait until `view` has opened its file and finished rendering
+    """
+    from PyQt6.QtCore import QEventLoop
+
+    def busy() -> bool:
+        # A WCS job of an HDU no longer shown only reports to be dropped
+        sky = view._sky_job
+        return view._render_job is not None or (
+            sky is not None and sky.job_id == view._sky_id
+        )
+
+    # Jobs report back through queued signals; waiting for those rather than
+    # for the pools leaves out jobs the view has cancelled
+    _waited.append((app, view))
+    while not view.isOpen or busy():
+        app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+
+
+def _drain() -> None:
+    """
+    Let pool jobs a case left running finish before its process exits
+    """
+    if "opener" not in sys.modules:
+        return
+    from PyQt6.QtCore import QThreadPool
+
+    from opener import io_pool
+
+    io_pool().waitForDone()
+    QThreadPool.globalInstance().waitForDone()
+    _waited.clear()
+
+
+def _quiet_dialogs(save_path: str = "") -> None:
+    """
+    Replace modal dialogs with no-ops so GUI entry points run unattended
+    """
+    from PyQt6.QtWidgets import QDialog, QFileDialog, QMessageBox
+
+    QFileDialog.getSaveFileName = staticmethod(lambda *a, **k: (save_path, ""))
+    QMessageBox.information = staticmethod(lambda *a, **k: None)
+    QMessageBox.critical = staticmethod(lambda *a, **k: None)
+    QMessageBox.warning = staticmethod(lambda *a, **k: None)
+    QDialog.exec = lambda self: 0
+
+
+# Each case takes the generated files and returns (seconds, items, unit)
+
+
+def case_open_many_extensions(files, tmp):
+    app = _setup()  # noqa: F841
+    from astropy.io import fits
+
+    from hduindex import build_hdu_index
+
+    start = time.perf_counter()
+    with fits.open(files["many_ext"]) as hdul:
+        index = build_hdu_index(hdul)
+    return time.perf_counter() - start, len(index), "HDU"
+
+
+def case_view_first_frame(files, tmp):
+    app = _setup()
+    from gui import View
+
+    start = time.perf_counter()
+    view = View(files["many_ext"])
+    _wait_render(app, view)
+    return time.perf_counter() - start, 1, "file"
+
+
+def _case_load_pixmap(key):
+    def case(files, tmp):
+        app = _setup()
+        from gui import View
+        from rendercache import render_cache
+
+        view = View(files[key])
+        _wait_render(app, view)
+        render_cache.clear()
+        view._stretch_engine = None
+
+        start = time.perf_counter()
+        view._loadPixmap(view.hdul[0])
+        _wait_render(app, view)
+        elapsed = time.perf_counter() - start
+        return elapsed, view.hdul[0].data.size, "px"
+
+    return case
+
+
+def _case_load_table(key):
+    def case(files, tmp):
+        app = _setup()
+        from PyQt6.QtCore import Qt
+
+        from gui import View
+
+        view = View(files[key])
+        _wait_render(app, view)
+        data = view.hdul[1].data
+
+        start = time.perf_counter()
+        view._loadTable(data)
+        model = view._table.model()
+        # Format one screenful, as the view would on first paint
+        for row in range(min(50, model.rowCount())):
+            for col in range(min(20, model.columnCount())):
+                model.data(model.index(row, col), Qt.ItemDataRole.DisplayRole)
+        app.processEvents()
+        return time.perf_counter() - start, len(data), "rows"
+
+    return case
+
+
+def case_cube_playback(files, tmp):
+    app = _setup()
+    from PyQt6.QtCore import QEventLoop
+
+    from gui import View
+
+    view = View(files["cube"])
+    _wait_render(app, view)
+    cube = view._cube
+    shown = []
+    cube.planeReady.connect(lambda plane, frame, image: shown.append(plane))
+
+    # Every plane once, as fast as the planes are rendered
+    start = time.perf_counter()
+    cube.play(fps=1000)
+    while len(shown) < cube.count:
+        app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+    cube.stop()
+    elapsed = time.perf_counter() - start
+    print(f"  {cube.stalledTicks} ticks found no plane ready", flush=True)
+    return elapsed, len(shown), "plane"
+
+
+def case_sort_filter_table(files, tmp):
+    app = _setup()
+    from PyQt6.QtCore import Qt
+
+    from gui import View
+
+    view = View(files["table"])
+    _wait_render(app, view)
+    view._loadTable(view.hdul[1].data)
+    model = view._table_model
+
+    start = time.perf_counter()
+    model.sort(2, Qt.SortOrder.AscendingOrder)
+    model.setFilter("MAG2 < 18 & FLAG4 == 0")
+    model.data(model.index(0, 0), Qt.ItemDataRole.DisplayRole)
+    return time.perf_counter() - start, model.totalRows, "rows"
+
+
+def case_stack_images(files, tmp):
+    _setup()
+    from astropy.io import fits
+
+    from imagemath import image_math
+    from strips import ImageSource
+
+    header = fits.getheader(files["image_f32"])
+    shape = header["NAXIS2"], header["NAXIS1"]
+    sources = [ImageSource(files["image_f32"], 0, shape) for _ in range(8)]
+
+    start = time.perf_counter()
+    image_math("sigmaclip", sources, os.path.join(tmp, "stack.fits"))
+    return time.perf_counter() - start, len(sources) * shape[0] * shape[1], "px"
+
+
+def case_wcs_readout(files, tmp):
+    _setup()
+    import numpy as np
+    from astropy.io import fits
+
+    from skygrid import VIEW_SAMPLE_SCREEN_PX, SkyWcs
+
+    header = fits.Header()
+    header["CTYPE1"], header["CTYPE2"] = "RA---TAN-SIP", "DEC--TAN-SIP"
+    header["CRPIX1"], header["CRPIX2"] = 2048, 2048
+    header["CRVAL1"], header["CRVAL2"] = 150.0, 2.2
+    header["CD1_1"], header["CD2_2"] = -1e-4, 1e-4
+    header["A_ORDER"], header["B_ORDER"], header["A_2_0"] = 2, 2, 1e-6
+    sky = SkyWcs(header, (4096, 4096))
+    points = np.random.default_rng(0).uniform(0, 4095, (10_000, 2)).tolist()
+
+    # One view's samples and grid, then a hover readout per point
+    start = time.perf_counter()
+    samples = sky.sample(0, 0, 2047, 2047, VIEW_SAMPLE_SCREEN_PX * 2)
+    sky.gridLines(samples, 1024 * sky.pixelScale)
+    for x, y in points:
+        sky.format(*(samples.interpolate(x, y) or sky.exact(x, y)))
+    return time.perf_counter() - start, len(points), "points"
+
+
+def case_fits_to_qpixmap(files, tmp):
+    app = _setup()  # noqa: F841
+    import utils
+
+    start = time.perf_counter()
+    pix = utils.fits_to_qpixmap(files["image_f32"])
+    return time.perf_counter() - start, pix.width() * pix.height(), "px"
+
+
+def case_export_table(files, tmp):
+    app = _setup()
+    from gui import MainWindow
+    from hduindex import HDUType
+
+    _quiet_dialogs(os.path.join(tmp, "export.csv"))
+    window = MainWindow([files["table"]])
+    view = window._currentView
+    _wait_render(app, view)
+    view._hdulist_combo.setCurrentIndex(1)
+    window.handleHDUTypeChanged(HDUType.TABLE)
+    nrows = len(view.hdul[1].data)
+
+    start = time.perf_counter()
+    window._exportTable()
+    window._exportWorker.wait()
+    app.processEvents()
+    return time.perf_counter() - start, nrows, "rows"
+
+
+def case_export_image(files, tmp):
+    _setup()
+    from astropy.io import fits
+
+    from export import export_image
+    from strips import ImageSource
+
+    header = fits.getheader(files["image_f32"])
+    shape = header["NAXIS2"], header["NAXIS1"]
+    source = ImageSource(files["image_f32"], 0, shape)
+
+    start = time.perf_counter()
+    export_image(source, os.path.join(tmp, "export.png"), "png")
+    return time.perf_counter() - start, shape[0] * shape[1], "px"
+
+
+def case_histogram(files, tmp):
+    app = _setup()
+    from gui import MainWindow
+
+    _quiet_dialogs()
+    window = MainWindow([files["image_f32"]])
+    _wait_render(app, window._currentView)
+
+    start = time.perf_counter()
+    window._histogram()
+    app.processEvents()
+    elapsed = time.perf_counter() - start
+    return elapsed, window._currentView.getRawImageData().size, "px"
+
+
+def case_open_many_files(files, tmp):
+    app = _setup()
+    from PyQt6.QtCore import QEventLoop
+
+    from gui import MainWindow
+
+    _quiet_dialogs()
+    paths = [files[k] for k in ("image_u8", "image_i16", "image_f32", "image_f64")]
+    paths = (paths * 8)[:32]
+
+    start = time.perf_counter()
+    window = MainWindow(paths)
+    tabs = time.perf_counter() - start
+    views = [window._tabWidget.widget(i) for i in range(window._tabWidget.count())]
+    _waited.append((app, window))
+    while not all(v.isOpen and v._render_job is None for v in views):
+        app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+    elapsed = time.perf_counter() - start
+    print(f"  tabs created after {tabs * 1000:.0f} ms", flush=True)
+    return elapsed, len(paths), "file"
+
+
+def _launch(path, tmp) -> tuple:
+    """
+    Start the viewer on `path` in a fresh interpreter, exiting as soon as
+    its window is up. Returns the wall time and the recorded trace events.
+    """
+    trace = os.path.join(tmp, "startup.json")
+    env = dict(
+        os.environ,
+        QT_QPA_PLATFORM="offscreen",
+        PYFITSEXPLORER_EXIT_AFTER_START="1",
+        PYFITSEXPLORER_TRACE=trace,
+    )
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(SRC_DIR, "main.py"), path],
+        env=env,
+        check=True,
+        stderr=subprocess.DEVNULL,
+    )
+    elapsed = time.perf_counter() - start
+    with open(trace) as f:
+        return elapsed, json.load(f)["traceEvents"]
+
+
+def case_startup_launch(files, tmp):
+    # Whole cold start, interpreter startup included
+    elapsed, _ = _launch(files["image_f32"], tmp)
+    return elapsed, 1, "launch"
+
+
+def case_startup_import(files, tmp):
+    _, events = _launch(files["image_f32"], tmp)
+    span = next(e for e in events if e["name"] == "import gui")
+    return span["dur"] / 1e6, 1, "import"
+
+
+def case_startup_first_window(files, tmp):
+    _, events = _launch(files["image_f32"], tmp)
+    counter = next(e for e in events if e["name"] == "startup")
+    return counter["args"]["first_window_ms"] / 1000, 1, "window"
+
+
+CASES = {
+    "startup_launch": case_startup_launch,
+    "startup_import": case_startup_import,
+    "startup_first_window": case_startup_first_window,
+    "open_many_extensions": case_open_many_extensions,
+    "view_first_frame": case_view_first_frame,
+    "load_pixmap_u8": _case_load_pixmap("image_u8"),
+    "load_pixmap_i16": _case_load_pixmap("image_i16"),
+    "load_pixmap_f32": _case_load_pixmap("image_f32"),
+    "load_pixmap_f64": _case_load_pixmap("image_f64"),
+    "load_table_long": _case_load_table("table"),
+    "load_table_wide": _case_load_table("wide_table"),
+    "sort_filter_table": case_sort_filter_table,
+    "cube_playback": case_cube_playback,
+    "stack_images": case_stack_images,
+    "wcs_readout": case_wcs_readout,
+    "fits_to_qpixmap": case_fits_to_qpixmap,
+    "open_many_files": case_open_many_files,
+    "export_table": case_export_table,
+    "export_image": case_export_image,
+    "histogram": case_histogram,
+}
+
+
+def generate(tmp: str, scale: float) -> dict:
+    from synthetic import write_cube, write_image, write_many_extensions, write_table
+
+    size = max(256, int(4096 * scale))
+    files = {
+        "image_u8": write_image(os.path.join(tmp, "u8.fits"), size, 8),
+        "image_i16": write_image(os.path.join(tmp, "i16.fits"), size, 16),
+        "image_f32": write_image(os.path.join(tmp, "f32.fits"), size, -32),
+        "image_f64": write_image(os.path.join(tmp, "f64.fits"), size, -64),
+        "many_ext": write_many_extensions(os.path.join(tmp, "mef.fits"), 64),
+        "cube": write_cube(os.path.join(tmp, "cube.fits"), max(256, int(1024 * scale))),
+        "table": write_table(os.path.join(tmp, "table.fits"), int(1_000_000 * scale)),
+        "wide_table": write_table(os.path.join(tmp, "wide.fits"), 10_000, 200),
+    }
+    return files
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of this process. VmHWM is preferred because, unlike
+    ru_maxrss, it is not inherited from the parent across exec.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _child(name, files, tmp, queue):
+    try:
+        seconds, items, unit = CASES[name](files, tmp)
+        rss = peak_rss_mb()
+        _drain()
+        queue.put(
+            {"seconds": seconds, "items": items, "unit": unit, "peak_rss_mb": rss}
+        )
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_case(name: str, files: dict, tmp: str) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, files, tmp, queue))
+    proc.start()
+    # A case that crashes the interpreter never reports back
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if not proc.is_alive():
+                result = {"error": f"exited with code {proc.exitcode}"}
+                break
+    proc.join()
+    if "error" not in result:
+        result["throughput"] = result["items"] / result["seconds"]
+    return result
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Return the names of cases that got slower than `threshold` x baseline
+    """
+    regressions = []
+    print(f"\n{'case':24} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base or "seconds" not in base or "seconds" not in res:
+            continue
+        ratio = res["seconds"] / base["seconds"]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(
+            f"{name:24} {base['seconds']:10.3f} {res['seconds']:10.3f} "
+            f"{ratio:7.2f}{flag}"
+        )
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="pyfitsexplorer benchmark suite")
+    parser.add_argument("-k", dest="pattern", default="", help="run cases containing this")
+    parser.add_argument("--scale", type=float, default=1.0, help="data size factor")
+    parser.add_argument("--save", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCH_DIR)
+    names = [n for n in CASES if args.pattern in n]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("generating synthetic data...", flush=True)
+        files = generate(tmp, args.scale)
+
+        print(f"\n{'case':24} {'wall s':>9} {'peak MB':>9} {'throughput':>18}")
+        for name in names:
+            res = run_case(name, files, tmp)
+            results[name] = res
+            if "error" in res:
+                print(f"{name:24} ERROR {res['error']}")
+                continue
+            rate = f"{res['throughput']:,.0f} {res['unit']}/s"
+            print(f"{name:24} {res['seconds']:9.3f} {res['peak_rss_mb']:9.1f} {rate:>18}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
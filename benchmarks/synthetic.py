@@ -0,0 +1,75 @@
+"""
+Synthetic FITS files for the benchmark suite
+"""
+
+import numpy as np
+from astropy.io import fits
+
+BITPIX_DTYPES = {
+    8: np.uint8,
+    16: np.int16,
+    32: np.int32,
+    -32: np.float32,
+    -64: np.float64,
+}
+
+
+def _image(shape, bitpix: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    dtype = BITPIX_DTYPES[bitpix]
+    # Sky background plus a few bright sources and a hot pixel
+    data = rng.normal(1000, 30, size=shape).astype(np.float32)
+    for _ in range(20):
+        y, x = (rng.integers(0, n) for n in shape[-2:])
+        data[..., y, x] += 20000
+    data[..., 0, 0] = 60000
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        data = np.clip(data, info.min, info.max)
+    return data.astype(dtype)
+
+
+def write_image(path: str, size: int = 4096, bitpix: int = -32) -> str:
+    fits.PrimaryHDU(_image((size, size), bitpix)).writeto(path, overwrite=True)
+    return path
+
+
+def write_cube(path: str, size: int = 1024, planes: int = 32, bitpix: int = -32) -> str:
+    fits.PrimaryHDU(_image((planes, size, size), bitpix)).writeto(path, overwrite=True)
+    return path
+
+
+def write_many_extensions(path: str, count: int = 64, size: int = 512) -> str:
+    hdus = [fits.PrimaryHDU()]
+    for i in range(count):
+        hdus.append(fits.ImageHDU(_image((size, size), -32, seed=i), name=f"SCI{i}"))
+    fits.HDUList(hdus).writeto(path, overwrite=True)
+    return path
+
+
+def write_table(path: str, rows: int = 1_000_000, cols: int = 8) -> str:
+    """
+    Binary table with a mix of integer, float and string columns. Use many
+    rows for a long table or many columns for a wide one.
+    """
+    rng = np.random.default_rng(0)
+    columns = [fits.Column(name="ID", format="K", array=np.arange(rows))]
+    for i in range(1, cols):
+        match i % 4:
+            case 0:
+                columns.append(
+                    fits.Column(name=f"FLAG{i}", format="J", array=rng.integers(0, 8, rows))
+                )
+            case 1:
+                columns.append(
+                    fits.Column(name=f"RA{i}", format="D", array=rng.uniform(0, 360, rows))
+                )
+            case 2:
+                columns.append(
+                    fits.Column(name=f"MAG{i}", format="E", array=rng.normal(18, 2, rows))
+                )
+            case 3:
+                names = np.char.add("src_", (np.arange(rows) % 100000).astype(str))
+                columns.append(fits.Column(name=f"NAME{i}", format="12A", array=names))
+    fits.BinTableHDU.from_columns(columns).writeto(path, overwrite=True)
+    return path
@@ -1,10 +1,47 @@
-from PyQt6.QtWidgets import QGraphicsView, QGraphicsPixmapItem, QGraphicsScene, QWidget
-from PyQt6.QtGui import QPixmap, QWheelEvent, QPainter, QCursor
-from PyQt6.QtCore import Qt
-from typing import Optional
+from PyQt6.QtWidgets import (
+    QGraphicsItem,
+    QGraphicsView,
+    QGraphicsPathItem,
+    QGraphicsPixmapItem,
+    QGraphicsRectItem,
+    QGraphicsScene,
+    QGraphicsSimpleTextItem,
+    QWidget,
+)
+from PyQt6.QtGui import (
+    QColor,
+    QImage,
+    QMouseEvent,
+    QPainterPath,
+    QPen,
+    QPixmap,
+    QTransform,
+    QWheelEvent,
+    QPainter,
+    QCursor,
+)
+from PyQt6.QtCore import QPointF, QRectF, Qt, pyqtSignal
+from typing import Callable, List, Optional, Tuple
+import math
+
+import numpy as np
+
+from TiledImageItem import TiledImageItem, gray8_to_qimage
 
 
 class GraphicsView(QGraphicsView):
+    # Image pixel under the cursor, (-1, -1) when off the image
+    cursorMoved = pyqtSignal(int, int)
+    # Selected region in image pixels as x0, y0, x1, y1 (exclusive), emitted
+    # continuously while it is dragged
+    regionChanged = pyqtSignal(int, int, int, int)
+    # The part of the image on screen may have changed: zoom, pan, rotation,
+    # resize or a new image
+    viewChanged = pyqtSignal()
+
+    # Images with a side longer than this are drawn through a tile pyramid
+    TILING_THRESHOLD = 4096
+
     def __init__(self, parent: Optional[QWidget] = None):
         super().__init__(parent=parent)
 
@@ -18,14 +55,301 @@ class GraphicsView(QGraphicsView):
         self.scene.addItem(self.pix_item)
         self.setScene(self.scene)
 
+        self.tile_item: Optional[TiledImageItem] = None
+
+        # None picks tiling automatically from TILING_THRESHOLD
+        self.tiled: Optional[bool] = None
+
+        # Set while the next image should keep the current zoom and pan, e.g.
+        # when it replaces its own preview or is a re-stretch of the same HDU
+        self._keep_view = False
+
         self._zoom = 0
 
+        self.setMouseTracking(True)
+        # In region mode left-dragging selects a rectangle instead of panning
+        self._region_mode = False
+        self._region_start: Optional[QPointF] = None
+        pen = QPen(QColor(255, 200, 0))
+        pen.setCosmetic(True)
+        self.region_item = QGraphicsRectItem()
+        self.region_item.setPen(pen)
+        self.region_item.setZValue(1)
+        self.region_item.setVisible(False)
+        self.scene.addItem(self.region_item)
+
+        # Lines drawn over the image in image pixels, such as a coordinate
+        # grid, with their text labels as children
+        pen = QPen(QColor(80, 220, 120, 200))
+        pen.setCosmetic(True)
+        self.overlay_item = QGraphicsPathItem()
+        self.overlay_item.setPen(pen)
+        self.overlay_item.setZValue(1)
+        self.scene.addItem(self.overlay_item)
+
+    def _imageItem(self) -> QGraphicsItem:
+        if self.tile_item is not None:
+            return self.tile_item
+        return self.pix_item
+
+    def _clearTiles(self) -> None:
+        if self.tile_item is not None:
+            self.tile_item.cancel()
+            self.scene.removeItem(self.tile_item)
+            self.tile_item = None
+        self.pix_item.setVisible(True)
+
+    def _fitUnlessKeepingView(self, item: QGraphicsItem) -> None:
+        if self._keep_view:
+            self._keep_view = False
+            return
+        self.resetTransform()
+        self.fitInView(item, Qt.AspectRatioMode.KeepAspectRatio)
+        self._zoom = 0
+        self.viewChanged.emit()
+
+    def clearImage(self) -> None:
+        self._clearTiles()
+        self.clearRegion()
+        self.clearOverlay()
+        self.pix_item.setPixmap(QPixmap())
+        self.pix_item.setScale(1)
+
     def setPixmap(self, pixmap: QPixmap) -> None:
         if pixmap.isNull():
             return
+        self._clearTiles()
+        self.pix_item.setScale(1)
         self.pix_item.setPixmap(pixmap)
+        self._syncOverlay()
+        self._fitUnlessKeepingView(self.pix_item)
+
+    def setPreview(self, image: QImage, stride: int) -> None:
+        """
+        Show a subsampled image scaled up by `stride` so that it covers the
+        same scene area as the full image that will replace it
+        """
+        if image.isNull():
+            return
+        self._clearTiles()
+        self._keep_view = False
+        self.pix_item.setPixmap(QPixmap.fromImage(image))
+        self.pix_item.setScale(stride)
+        self._syncOverlay()
+        self.resetTransform()
         self.fitInView(self.pix_item, Qt.AspectRatioMode.KeepAspectRatio)
         self._zoom = 0
+        self._keep_view = True
+        self.viewChanged.emit()
+
+    def wantsTiles(self, shape) -> bool:
+        if self.tiled is not None:
+            return self.tiled
+        return max(shape) > self.TILING_THRESHOLD
+
+    def setImageData(
+        self,
+        data: np.ndarray,
+        pixmap: Optional[QPixmap] = None,
+        keepView: bool = False,
+    ) -> None:
+        """
+        Display a 2D uint8 image, through the tile pyramid if it is large.
+
+        `pixmap` may carry an already converted pixmap of `data`. With
+        `keepView` the zoom, pan and rotation of the current image are kept.
+        """
+        if not self.wantsTiles(data.shape):
+            if keepView:
+                self._keep_view = True
+            if pixmap is None or pixmap.isNull():
+                pixmap = QPixmap.fromImage(gray8_to_qimage(data))
+            self.setPixmap(pixmap)
+            return
+
+        self.setTileSource(data, keepView)
+
+    def setTileSource(self, source, keepView: bool = False) -> None:
+        """
+        Display a tile source (see `TiledImageItem`) such as an 8-bit array or
+        a source that renders tiles from compressed data on demand
+        """
+        rotation = self._imageItem().rotation()
+        if keepView:
+            self._keep_view = True
+
+        self._clearTiles()
+        self.pix_item.setPixmap(QPixmap())
+        self.pix_item.setScale(1)
+        self.pix_item.setVisible(False)
+        self.tile_item = TiledImageItem(source)
+        self.scene.addItem(self.tile_item)
+        if self._keep_view:
+            self.tile_item.setTransformOriginPoint(self.tile_item.boundingRect().center())
+            self.tile_item.setRotation(rotation)
+        self._syncOverlay()
+        self._fitUnlessKeepingView(self.tile_item)
+
+    def pixmap(self) -> Optional[QPixmap]:
+        """
+        Return the displayed image as a single pixmap, assembling it from the
+        tiled source if needed, or None if the source makes its tiles on the
+        thread pool; `requestPixmap` assembles those there
+        """
+        if self.tile_item is not None:
+            if self.tile_item.source.previewLevel > 0:
+                return None
+            return QPixmap.fromImage(gray8_to_qimage(self.tile_item.data))
+        return self.pix_item.pixmap()
+
+    def requestPixmap(self, callback: Callable[[Optional[QPixmap]], None]) -> None:
+        """
+        Call `callback` with the displayed image as a single pixmap, or None
+        if it could not be made. Tiled images are assembled the way their
+        tiles are made, on the thread pool for e.g. compressed data.
+        """
+        if self.tile_item is None:
+            callback(self.pix_item.pixmap())
+            return
+
+        def ready(data: Optional[np.ndarray]) -> None:
+            callback(None if data is None else QPixmap.fromImage(gray8_to_qimage(data)))
+
+        self.tile_item.requestData(ready)
+
+    def setRegionMode(self, state: bool) -> None:
+        self._region_mode = state
+        self._region_start = None
+        self.region_item.setVisible(False)
+        if state:
+            self.setDragMode(QGraphicsView.DragMode.NoDrag)
+            self.viewport().setCursor(Qt.CursorShape.CrossCursor)
+        else:
+            self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
+            self.viewport().unsetCursor()
+
+    def _imagePoint(self, event: QMouseEvent) -> QPointF:
+        """
+        Position of the event in full resolution image pixels, following the
+        item's rotation and a preview's scale
+        """
+        item = self._imageItem()
+        point = item.mapFromScene(self.mapToScene(event.position().toPoint()))
+        return point * item.scale()
+
+    def _imageRect(self) -> QRectF:
+        item = self._imageItem()
+        rect = item.boundingRect()
+        return QRectF(0, 0, rect.width() * item.scale(), rect.height() * item.scale())
+
+    def visibleImageRect(self) -> QRectF:
+        """
+        The part of the image on screen, in full resolution image pixels
+        """
+        item = self._imageItem()
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        rect = item.mapRectFromScene(visible)
+        scale = item.scale()
+        rect = QRectF(
+            rect.x() * scale, rect.y() * scale, rect.width() * scale, rect.height() * scale
+        )
+        return rect.intersected(self._imageRect())
+
+    def levelOfDetail(self) -> int:
+        """
+        Image pixels per screen pixel as a power of two: 0 at 1:1, positive
+        when zoomed out, negative when zoomed in
+        """
+        transform = self.transform()
+        scale = math.hypot(transform.m11(), transform.m12())
+        return round(math.log2(1 / scale)) if scale > 0 else 0
+
+    def _syncOverlay(self) -> None:
+        """
+        Keep the overlay on the image item, through a preview's scale and
+        the item's rotation
+        """
+        item = self._imageItem()
+        scale = item.scale()
+        self.overlay_item.setTransform(
+            QTransform.fromScale(1 / scale, 1 / scale) * item.sceneTransform()
+        )
+
+    def setOverlay(
+        self, path: QPainterPath, labels: List[Tuple[QPointF, str]] = ()
+    ) -> None:
+        """
+        Draw `path` over the image, in image pixels, with text `labels`
+        whose bottom left corner is at an image pixel position and which
+        keep their size at any zoom
+        """
+        self.clearOverlay()
+        self.overlay_item.setPath(path)
+        color = self.overlay_item.pen().color()
+        for position, text in labels:
+            label = QGraphicsSimpleTextItem(text, self.overlay_item)
+            label.setBrush(color)
+            label.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIgnoresTransformations)
+            label.setPos(position)
+            # Label coordinates are screen pixels
+            height = label.boundingRect().height()
+            label.setTransform(QTransform.fromTranslate(2, -height - 2))
+        self._syncOverlay()
+
+    def clearOverlay(self) -> None:
+        for label in self.overlay_item.childItems():
+            self.scene.removeItem(label)
+        self.overlay_item.setPath(QPainterPath())
+
+    def _updateRegion(self, end: QPointF) -> None:
+        rect = QRectF(self._region_start, end).normalized()
+        rect = rect.intersected(self._imageRect())
+        x0, y0 = int(rect.left()), int(rect.top())
+        x1, y1 = int(rect.right()) + 1, int(rect.bottom()) + 1
+
+        # The rectangle is drawn in the image item's coordinates so it turns
+        # with a rotated image
+        item = self._imageItem()
+        scale = item.scale()
+        outline = QRectF(x0 / scale, y0 / scale, (x1 - x0) / scale, (y1 - y0) / scale)
+        self.region_item.setRect(item.mapRectToScene(outline))
+        self.region_item.setVisible(True)
+        self.regionChanged.emit(x0, y0, x1, y1)
+
+    def mousePressEvent(self, event: QMouseEvent) -> None:
+        if self._region_mode and event.button() == Qt.MouseButton.LeftButton:
+            point = self._imagePoint(event)
+            if self._imageRect().contains(point):
+                self._region_start = point
+                self._updateRegion(point)
+            return
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event: QMouseEvent) -> None:
+        point = self._imagePoint(event)
+        if self._imageRect().contains(point):
+            self.cursorMoved.emit(int(point.x()), int(point.y()))
+        else:
+            self.cursorMoved.emit(-1, -1)
+        if self._region_start is not None:
+            self._updateRegion(point)
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event: QMouseEvent) -> None:
+        if self._region_start is not None:
+            self._updateRegion(self._imagePoint(event))
+            self._region_start = None
+            return
+        super().mouseReleaseEvent(event)
+
+    def leaveEvent(self, event) -> None:
+        self.cursorMoved.emit(-1, -1)
+        super().leaveEvent(event)
+
+    def clearRegion(self) -> None:
+        self._region_start = None
+        self.region_item.setVisible(False)
 
     def wheelEvent(self, event: QWheelEvent) -> bool:
         # Zoom with Ctrl+Scroll
@@ -43,18 +367,34 @@ class GraphicsView(QGraphicsView):
         elif not zoom_in and self._zoom > -10:
             self._zoom -= 1
             self.scale(factor, factor)
+        self.viewChanged.emit()
 
     def rotateClock(self) -> None:
-        center = self.pix_item.boundingRect().center()
-        self.pix_item.setTransformOriginPoint(center)
-        self.pix_item.setRotation(self.pix_item.rotation() + 90)
+        item = self._imageItem()
+        center = item.boundingRect().center()
+        item.setTransformOriginPoint(center)
+        item.setRotation(item.rotation() + 90)
+        self._syncOverlay()
+        self.viewChanged.emit()
 
     def rotateAnticlock(self) -> None:
-        center = self.pix_item.boundingRect().center()
-        self.pix_item.setTransformOriginPoint(center)
-        self.pix_item.setRotation(self.pix_item.rotation() - 90)
+        item = self._imageItem()
+        center = item.boundingRect().center()
+        item.setTransformOriginPoint(center)
+        item.setRotation(item.rotation() - 90)
+        self._syncOverlay()
+        self.viewChanged.emit()
 
     def resetZoom(self) -> None:
         self.resetTransform()
-        self.fitInView(self.pix_item, Qt.AspectRatioMode.KeepAspectRatio)
+        self.fitInView(self._imageItem(), Qt.AspectRatioMode.KeepAspectRatio)
         self._zoom = 0
+        self.viewChanged.emit()
+
+    def scrollContentsBy(self, dx: int, dy: int) -> None:
+        super().scrollContentsBy(dx, dy)
+        self.viewChanged.emit()
+
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        self.viewChanged.emit()
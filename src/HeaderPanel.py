@@ -0,0 +1,128 @@
+from typing import List, Optional
+
+from PyQt6.QtCore import QTimer, pyqtSignal
+from PyQt6.QtWidgets import (
+    QAbstractItemView,
+    QHeaderView,
+    QLabel,
+    QLineEdit,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from headerindex import HeaderDocument, HeaderIndex, HeaderMatch
+
+
+class HeaderPanel(QWidget):
+    """
+    Header viewer and search over the headers of every open file.
+
+    With an empty search box it lists the cards of the current HDU. Typing
+    searches all HDUs of all files through a `HeaderIndex`; activating a
+    match asks for its file and HDU to be shown.
+    """
+
+    # document id, HDU index
+    matchActivated = pyqtSignal(int, int)
+
+    SEARCH_DELAY_MS = 150
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.index = HeaderIndex()
+        self._labels = {}
+        self._current: Optional[tuple] = None
+        self._matches: List[HeaderMatch] = []
+
+        self._search = QLineEdit()
+        self._search.setPlaceholderText("Search, e.g. FILTER='r' or DATE-OBS")
+        self._search.setClearButtonEnabled(True)
+        self._status = QLabel()
+
+        self._table = QTableWidget(0, 5)
+        self._table.setHorizontalHeaderLabels(
+            ["File", "HDU", "Keyword", "Value", "Comment"]
+        )
+        self._table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self._table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self._table.verticalHeader().setVisible(False)
+        self._table.horizontalHeader().setSectionResizeMode(
+            4, QHeaderView.ResizeMode.Stretch
+        )
+
+        layout = QVBoxLayout()
+        layout.addWidget(self._search)
+        layout.addWidget(self._table)
+        layout.addWidget(self._status)
+        self.setLayout(layout)
+
+        self._searchTimer = QTimer(self)
+        self._searchTimer.setSingleShot(True)
+        self._searchTimer.setInterval(self.SEARCH_DELAY_MS)
+        self._searchTimer.timeout.connect(self.refresh)
+        self._search.textChanged.connect(lambda _: self._searchTimer.start())
+        self._search.returnPressed.connect(self.refresh)
+        self._table.cellActivated.connect(self._onCellActivated)
+
+    def addDocument(self, doc: int, label: str, document: HeaderDocument) -> None:
+        self._labels[doc] = label
+        self.index.add(doc, document)
+        self._refreshIfShowing(doc)
+
+    def removeDocument(self, doc: int) -> None:
+        self._labels.pop(doc, None)
+        self.index.remove(doc)
+        self._refreshIfShowing(doc)
+
+    def setCurrent(self, doc: Optional[int], hdu: int = 0) -> None:
+        """
+        Set the file and HDU whose header is listed while not searching
+        """
+        self._current = None if doc is None else (doc, hdu)
+        if not self._search.text().strip():
+            self.refresh()
+
+    def _refreshIfShowing(self, doc: int) -> None:
+        searching = bool(self._search.text().strip())
+        if searching or (self._current is not None and self._current[0] == doc):
+            self.refresh()
+
+    def refresh(self) -> None:
+        self._searchTimer.stop()
+        query = self._search.text()
+        if query.strip():
+            self._matches = self.index.search(query)
+            self._status.setText(
+                f"{len(self._matches)} matches in {len(self.index):,} cards "
+                f"of {self.index.documents} files"
+            )
+        elif self._current is not None:
+            doc, hdu = self._current
+            self._matches = [
+                HeaderMatch(doc, card) for card in self.index.headerCards(doc, hdu)
+            ]
+            self._status.setText(f"{len(self._matches)} cards")
+        else:
+            self._matches = []
+            self._status.clear()
+        self._fill()
+
+    def _fill(self) -> None:
+        self._table.setRowCount(len(self._matches))
+        for row, match in enumerate(self._matches):
+            values = (
+                self._labels.get(match.doc, ""),
+                str(match.hdu),
+                match.keyword,
+                match.value,
+                match.comment,
+            )
+            for col, text in enumerate(values):
+                self._table.setItem(row, col, QTableWidgetItem(text))
+        self._table.resizeColumnsToContents()
+
+    def _onCellActivated(self, row: int, col: int) -> None:
+        match = self._matches[row]
+        self.matchActivated.emit(match.doc, match.hdu)
@@ -0,0 +1,86 @@
+from PyQt6.QtWidgets import (
+    QCheckBox,
+    QHBoxLayout,
+    QLabel,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.widgets import SpanSelector
+
+from histogram import histogram_cache
+
+
+class HistogramWidget(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.canvas = FigureCanvas(Figure())
+        self._logCheck = QCheckBox("Log scale")
+        self._resetButton = QPushButton("Full range")
+        self._info = QLabel()
+
+        controls = QHBoxLayout()
+        controls.addWidget(self._logCheck)
+        controls.addWidget(self._resetButton)
+        controls.addStretch()
+        controls.addWidget(self._info)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.canvas)
+        layout.addLayout(controls)
+        self.setLayout(layout)
+
+        self.ax = self.canvas.figure.add_subplot(111)
+        self.ax.set_title("Pixel Intensity Histogram")
+        self.ax.set_xlabel("Pixel Value")
+        self.ax.set_ylabel("Frequency")
+        self._stairs = None
+
+        # Dragging across the plot rebins just the selected value range
+        self._selector = SpanSelector(
+            self.ax, self._onRangeSelected, "horizontal", useblit=True
+        )
+
+        self._data = None
+        self._key = None
+        self._bins = 256
+        self._range = None
+
+        self._logCheck.toggled.connect(self._onLogToggled)
+        self._resetButton.clicked.connect(lambda: self._setRange(None))
+
+    def plotHistogram(self, data, bins=256, key=None):
+        """
+        Plot the histogram of `data`. With a `key` the binned counts are
+        cached and reused the next time the same key is plotted.
+        """
+        self._data = data
+        self._bins = bins
+        self._key = key
+        self._setRange(None)
+
+    def _setRange(self, value_range) -> None:
+        self._range = value_range
+        hist = histogram_cache.get(self._key, self._data, self._bins, value_range)
+
+        if self._stairs is None:
+            self._stairs = self.ax.stairs(hist.counts, hist.edges, color="black")
+        else:
+            self._stairs.set_data(hist.counts, hist.edges)
+        self.ax.set_xlim(*hist.range)
+        bottom = 0.5 if self._logCheck.isChecked() else 0
+        self.ax.set_ylim(bottom, max(1, hist.counts.max()) * 1.05)
+        self._info.setText(f"Non-finite: {hist.nan_count}")
+        self.canvas.draw_idle()
+
+    def _onRangeSelected(self, lo: float, hi: float) -> None:
+        if hi > lo:
+            self._setRange((lo, hi))
+
+    def _onLogToggled(self, state: bool) -> None:
+        self.ax.set_yscale("log" if state else "linear")
+        self._setRange(self._range)
@@ -0,0 +1,138 @@
+from typing import List, Optional
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import (
+    QComboBox,
+    QDialog,
+    QDialogButtonBox,
+    QDoubleSpinBox,
+    QFormLayout,
+    QListWidget,
+    QListWidgetItem,
+    QMessageBox,
+    QSpinBox,
+    QVBoxLayout,
+)
+
+from imagemath import OPERATIONS, PAIR_OPERATIONS
+from strips import ImageSource
+
+
+class ImageMathDialog(QDialog):
+    """
+    Pick an operation and the images of open tabs to combine. Pairs are
+    chosen as A and B; stacks from a checklist of the images sharing the
+    first checked one's size.
+    """
+
+    def __init__(self, sources: List[ImageSource], parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Image Arithmetic")
+        self._sources = sources
+
+        self._operation = QComboBox()
+        for key, label in OPERATIONS.items():
+            self._operation.addItem(label, key)
+        self._a = QComboBox()
+        self._b = QComboBox()
+        for source in sources:
+            text = f"{source.label} ({source.shape[1]}x{source.shape[0]})"
+            self._a.addItem(text)
+            self._b.addItem(text)
+        self._b.setCurrentIndex(min(1, len(sources) - 1))
+
+        self._stack = QListWidget()
+        for source in sources:
+            item = QListWidgetItem(
+                f"{source.label} ({source.shape[1]}x{source.shape[0]})"
+            )
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            same = source.shape == sources[0].shape
+            item.setCheckState(
+                Qt.CheckState.Checked if same else Qt.CheckState.Unchecked
+            )
+            self._stack.addItem(item)
+
+        self._sigma = QDoubleSpinBox()
+        self._sigma.setRange(0.5, 20.0)
+        self._sigma.setSingleStep(0.5)
+        self._sigma.setValue(3.0)
+        self._iterations = QSpinBox()
+        self._iterations.setRange(1, 20)
+        self._iterations.setValue(5)
+
+        self._form = QFormLayout()
+        self._form.addRow("Operation", self._operation)
+        self._form.addRow("A", self._a)
+        self._form.addRow("B", self._b)
+        self._form.addRow("Images", self._stack)
+        self._form.addRow("Sigma", self._sigma)
+        self._form.addRow("Iterations", self._iterations)
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout()
+        layout.addLayout(self._form)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+        self._operation.currentIndexChanged.connect(self._updateRows)
+        self._updateRows()
+
+    @property
+    def operation(self) -> str:
+        return self._operation.currentData()
+
+    @property
+    def sigma(self) -> float:
+        return self._sigma.value()
+
+    @property
+    def iterations(self) -> int:
+        return self._iterations.value()
+
+    def _updateRows(self) -> None:
+        pair = self.operation in PAIR_OPERATIONS
+        clip = self.operation == "sigmaclip"
+        for widget, visible in (
+            (self._a, pair),
+            (self._b, pair),
+            (self._stack, not pair),
+            (self._sigma, clip),
+            (self._iterations, clip),
+        ):
+            self._form.setRowVisible(widget, visible)
+
+    def selection(self) -> List[ImageSource]:
+        if self.operation in PAIR_OPERATIONS:
+            return [
+                self._sources[self._a.currentIndex()],
+                self._sources[self._b.currentIndex()],
+            ]
+        return [
+            source
+            for row, source in enumerate(self._sources)
+            if self._stack.item(row).checkState() == Qt.CheckState.Checked
+        ]
+
+    def _problem(self) -> Optional[str]:
+        sources = self.selection()
+        if self.operation in PAIR_OPERATIONS:
+            if sources[0] is sources[1]:
+                return "A and B are the same image."
+        elif len(sources) < 2:
+            return "Check at least two images to stack."
+        if any(source.shape != sources[0].shape for source in sources):
+            return "The images differ in size."
+        return None
+
+    def accept(self) -> None:
+        problem = self._problem()
+        if problem is not None:
+            QMessageBox.warning(self, "Image Arithmetic", problem)
+            return
+        super().accept()
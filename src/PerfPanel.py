@@ -0,0 +1,119 @@
+import threading
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import (
+    QFileDialog,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QMessageBox,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from profiling import rss_bytes, tracer
+from rendercache import render_cache
+
+
+class PerfPanel(QWidget):
+    """
+    Shows the most recent timing spans, process memory and render cache
+    usage, and dumps the collected trace as Chrome trace JSON
+    """
+
+    ROWS = 100
+    REFRESH_MS = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self._table = QTableWidget(0, 5)
+        self._table.setHorizontalHeaderLabels(
+            ["Span", "Category", "ms", "Thread", "RSS MB"]
+        )
+        self._table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self._table.verticalHeader().setVisible(False)
+        self._table.horizontalHeader().setSectionResizeMode(
+            0, QHeaderView.ResizeMode.Stretch
+        )
+
+        self._memLabel = QLabel()
+        self._cacheLabel = QLabel()
+        dumpButton = QPushButton("Dump trace...")
+        clearButton = QPushButton("Clear")
+        dumpButton.clicked.connect(self._dumpTrace)
+        clearButton.clicked.connect(self._clear)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(dumpButton)
+        buttons.addWidget(clearButton)
+        buttons.addStretch()
+
+        layout = QVBoxLayout()
+        layout.addWidget(self._memLabel)
+        layout.addWidget(self._cacheLabel)
+        layout.addWidget(self._table)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self._main_thread = threading.main_thread().ident
+        self._shown = None
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.REFRESH_MS)
+        self._timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event) -> None:
+        self.refresh()
+        self._timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event) -> None:
+        self._timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self) -> None:
+        self._memLabel.setText(f"Resident memory: {rss_bytes() / 2**20:.1f} MB")
+        stats = render_cache.stats()
+        self._cacheLabel.setText(
+            f"Render cache: {stats['entries']} frames, "
+            f"{stats['bytes'] / 2**20:.1f} / {stats['max_bytes'] / 2**20:.0f} MB, "
+            f"{stats['hits']} hits, {stats['misses']} misses"
+        )
+
+        spans = tracer.spans(self.ROWS)
+        latest = (len(spans), spans[-1]["ts"] if spans else None)
+        if latest == self._shown:
+            return
+        self._shown = latest
+
+        self._table.setRowCount(len(spans))
+        for row, span in enumerate(reversed(spans)):
+            thread = "GUI" if span["tid"] == self._main_thread else "worker"
+            values = [
+                span["name"],
+                span["cat"],
+                f"{span['dur'] / 1000:.2f}",
+                thread,
+                str(span["args"].get("rss_mb", "")),
+            ]
+            for col, value in enumerate(values):
+                self._table.setItem(row, col, QTableWidgetItem(value))
+
+    def _clear(self) -> None:
+        tracer.clear()
+        self.refresh()
+
+    def _dumpTrace(self) -> None:
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save Trace As", "trace.json", "Chrome Trace (*.json)"
+        )
+        if not path:
+            return
+        try:
+            tracer.dump(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Trace", f"Could not save trace:\n{str(e)}")
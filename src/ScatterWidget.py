@@ -0,0 +1,190 @@
+from typing import Optional
+
+import numpy as np
+from PyQt6.QtCore import QThreadPool, QTimer
+from PyQt6.QtWidgets import (
+    QComboBox,
+    QHBoxLayout,
+    QLabel,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qtagg import NavigationToolbar2QT
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+from density import DensityGrid, DensityJob
+from tablequery import QueryError, TableQuery
+
+
+class ScatterWidget(QWidget):
+    """
+    Column-vs-column plot of a table drawn as a 2D density image.
+
+    Points are never drawn one by one. They are binned into a grid with one
+    cell per screen pixel of the axes, and the grid is binned again on a pool
+    thread whenever the axes are zoomed, panned or resized, so the plot costs
+    the same to draw and hold in memory for any number of rows.
+    """
+
+    # Delay after the last zoom, pan or resize before rebinning
+    REBIN_DELAY_MS = 60
+    MAX_BINS = 2048
+
+    def __init__(
+        self, query: TableQuery, mask: Optional[np.ndarray] = None, parent=None
+    ):
+        super().__init__(parent)
+        self._query = query
+        self._mask = mask
+        self._rows = len(query) if mask is None else int(np.count_nonzero(mask))
+        self._generation = 0
+        self._job: DensityJob = None
+        self._image = None
+
+        self.canvas = FigureCanvas(Figure())
+        self._toolbar = NavigationToolbar2QT(self.canvas, self)
+        self._xCombo = QComboBox()
+        self._yCombo = QComboBox()
+        self._resetButton = QPushButton("Full range")
+        self._info = QLabel()
+
+        names = query.numericColumns()
+        self._xCombo.addItems(names)
+        self._yCombo.addItems(names)
+        if len(names) > 1:
+            self._yCombo.setCurrentIndex(1)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("X"))
+        controls.addWidget(self._xCombo)
+        controls.addWidget(QLabel("Y"))
+        controls.addWidget(self._yCombo)
+        controls.addWidget(self._resetButton)
+        controls.addStretch()
+        controls.addWidget(self._info)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self._toolbar)
+        layout.addWidget(self.canvas)
+        layout.addLayout(controls)
+        self.setLayout(layout)
+
+        self.ax = self.canvas.figure.add_subplot(111)
+        # Limits are only ever set here or by the navigation toolbar; the
+        # image extent must not move them
+        self.ax.set_autoscale_on(False)
+
+        self._rebinTimer = QTimer(self)
+        self._rebinTimer.setSingleShot(True)
+        self._rebinTimer.setInterval(self.REBIN_DELAY_MS)
+        self._rebinTimer.timeout.connect(self._rebin)
+
+        self.ax.callbacks.connect("xlim_changed", self._onLimitsChanged)
+        self.ax.callbacks.connect("ylim_changed", self._onLimitsChanged)
+        self.canvas.mpl_connect("resize_event", self._onLimitsChanged)
+        self._xCombo.currentTextChanged.connect(self._onColumnsChanged)
+        self._yCombo.currentTextChanged.connect(self._onColumnsChanged)
+        self._resetButton.clicked.connect(self._resetRange)
+
+        if names:
+            self._onColumnsChanged()
+        else:
+            self._info.setText("No numeric columns")
+
+    def _onColumnsChanged(self, *_) -> None:
+        self.ax.set_xlabel(self._xCombo.currentText())
+        self.ax.set_ylabel(self._yCombo.currentText())
+        self._resetRange()
+
+    def _resetRange(self) -> None:
+        """
+        Show the full finite range of both columns
+        """
+        try:
+            xstats = self._query.stats(self._xCombo.currentText())
+            ystats = self._query.stats(self._yCombo.currentText())
+        except QueryError as e:
+            self._info.setText(str(e))
+            return
+        self.ax.set_xlim(*_padded(xstats.finite_min, xstats.finite_max))
+        self.ax.set_ylim(*_padded(ystats.finite_min, ystats.finite_max))
+        self._toolbar.update()
+        self._rebin()
+
+    def _onLimitsChanged(self, *_) -> None:
+        self._rebinTimer.start()
+
+    def _gridShape(self) -> tuple:
+        bbox = self.ax.bbox
+        return (
+            int(np.clip(bbox.height, 1, self.MAX_BINS)),
+            int(np.clip(bbox.width, 1, self.MAX_BINS)),
+        )
+
+    def _rebin(self) -> None:
+        self._rebinTimer.stop()
+        if self._job is not None:
+            self._job.cancel()
+        self._generation += 1
+
+        x = self._query.column(self._xCombo.currentText())
+        y = self._query.column(self._yCombo.currentText())
+        self._job = DensityJob(
+            self._generation,
+            x,
+            y,
+            tuple(sorted(self.ax.get_xlim())),
+            tuple(sorted(self.ax.get_ylim())),
+            self._gridShape(),
+            self._mask,
+        )
+        self._job.signals.binned.connect(self._onBinned)
+        QThreadPool.globalInstance().start(self._job)
+
+    def _onBinned(self, generation: int, grid: DensityGrid) -> None:
+        if generation != self._generation:
+            return
+        if grid.step == 1:
+            self._job = None
+
+        # Empty cells stay transparent; counts are shown on a log scale
+        counts = np.ma.masked_equal(grid.counts, 0)
+        vmax = max(2, int(grid.counts.max()))
+        if self._image is None:
+            self._image = self.ax.imshow(
+                counts,
+                origin="lower",
+                extent=grid.extent,
+                aspect="auto",
+                interpolation="nearest",
+                norm=LogNorm(1, vmax),
+                cmap="viridis",
+            )
+            self.canvas.figure.colorbar(self._image, ax=self.ax, label="Count")
+        else:
+            self._image.set_data(counts)
+            self._image.set_extent(grid.extent)
+            self._image.set_clim(1, vmax)
+
+        text = f"{grid.points:,} of {self._rows:,} rows in view"
+        if grid.step > 1:
+            text = f"~{text} (sampled)"
+        self._info.setText(text)
+        self.canvas.draw_idle()
+
+    def closeEvent(self, event) -> None:
+        if self._job is not None:
+            self._job.cancel()
+        super().closeEvent(event)
+
+
+def _padded(lo, hi) -> tuple:
+    lo, hi = float(lo), float(hi)
+    if not np.isfinite(lo) or not np.isfinite(hi):
+        return 0.0, 1.0
+    pad = (hi - lo) * 0.02 or 0.5
+    return lo - pad, hi + pad
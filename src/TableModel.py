@@ -0,0 +1,217 @@
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt
+
+from profiling import tracer
+from tablequery import QueryError, TableQuery
+
+
+def format_column(values: np.ndarray) -> List[str]:
+    """
+    Format a slice of a table column into display strings.
+
+    Scalar columns are converted in one vectorized pass; vector (array)
+    columns fall back to per-cell `str()`.
+    """
+    if values.ndim == 1:
+        if values.dtype.kind == "S":
+            return np.char.decode(values, "utf-8", errors="ignore").tolist()
+        return values.astype(str).tolist()
+
+    out = []
+    for value in values:
+        if isinstance(value, bytes):
+            value = value.decode(errors="ignore")
+        out.append(str(value))
+    return out
+
+
+class FitsTableModel(QAbstractTableModel):
+    """
+    Read-only model over a FITS_rec.
+
+    Only the cells requested by the view are formatted. Formatted strings are
+    cached in blocks of `BLOCK_SIZE` rows per column, and rows are exposed to
+    the view in batches of `FETCH_SIZE` through `canFetchMore`/`fetchMore`, so
+    opening a table costs the same no matter how many rows it has.
+
+    Sorting and filtering (see `TableQuery`) only replace a map from shown
+    rows to table rows; the table is never copied, and the vertical header
+    keeps showing each row's number in the file.
+    """
+
+    BLOCK_SIZE = 256
+    FETCH_SIZE = 1024
+    MAX_BLOCKS = 512
+    MAX_SLICES = 16
+
+    def __init__(self, data, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._data = data
+        self._query = TableQuery(data)
+        self._col_names: List[str] = list(data.names)
+        self._total_rows: int = len(data)
+        self._loaded_rows: int = min(self.FETCH_SIZE, self._total_rows)
+        self._blocks: OrderedDict = OrderedDict()
+        self._slices: OrderedDict = OrderedDict()
+        # Shown row -> table row, None while unsorted and unfiltered
+        self._rows: Optional[np.ndarray] = None
+        self._sort_column = -1
+        self._descending = False
+        self._filter = ""
+
+    @property
+    def totalRows(self) -> int:
+        return len(self._data)
+
+    @property
+    def shownRows(self) -> int:
+        return self._total_rows
+
+    @property
+    def query(self) -> TableQuery:
+        return self._query
+
+    def filterMask(self) -> Optional[np.ndarray]:
+        """
+        Boolean mask of the rows passing the current filter, or None
+        """
+        return self._query.mask(self._filter) if self._filter else None
+
+    def sourceRow(self, row: int) -> int:
+        return row if self._rows is None else int(self._rows[row])
+
+    def sort(
+        self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder
+    ) -> None:
+        self._sort_column = column
+        self._descending = order == Qt.SortOrder.DescendingOrder
+        try:
+            self._applyView()
+        except QueryError:
+            # Array columns cannot be sorted; keep the current order
+            self._sort_column = -1
+            self._applyView()
+
+    def setFilter(self, expression: str) -> None:
+        """
+        Show only the rows matching `expression`. Raises `QueryError` for an
+        invalid expression and leaves the view unchanged.
+        """
+        previous = self._filter
+        self._filter = expression.strip()
+        try:
+            self._applyView()
+        except QueryError:
+            self._filter = previous
+            raise
+
+    def _applyView(self) -> None:
+        sort = self._col_names[self._sort_column] if self._sort_column >= 0 else None
+        with tracer.span("table view", "table", sort=str(sort), filter=self._filter):
+            rows = self._query.rows(sort, self._descending, self._filter)
+
+        self.beginResetModel()
+        self._rows = rows
+        self._total_rows = len(self._data) if rows is None else len(rows)
+        self._loaded_rows = min(self.FETCH_SIZE, self._total_rows)
+        self._blocks.clear()
+        self._slices.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return self._loaded_rows
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._col_names)
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        if parent.isValid():
+            return False
+        return self._loaded_rows < self._total_rows
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()) -> None:
+        if parent.isValid():
+            return
+        count = min(self.FETCH_SIZE, self._total_rows - self._loaded_rows)
+        if count <= 0:
+            return
+        self.beginInsertRows(
+            QModelIndex(), self._loaded_rows, self._loaded_rows + count - 1
+        )
+        self._loaded_rows += count
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        row = index.row()
+        block = self._block(index.column(), row // self.BLOCK_SIZE)
+        return block[row % self.BLOCK_SIZE]
+
+    def headerData(
+        self,
+        section: int,
+        orientation: Qt.Orientation,
+        role: int = Qt.ItemDataRole.DisplayRole,
+    ):
+        if orientation == Qt.Orientation.Horizontal:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self._col_names[section]
+            if role == Qt.ItemDataRole.ToolTipRole:
+                try:
+                    return str(self._query.stats(self._col_names[section]))
+                except QueryError:
+                    return None
+            return None
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return str(self.sourceRow(section) + 1)
+
+    def _rowSlice(self, block: int):
+        """
+        Return the FITS_rec rows of one block. Rows are sliced before taking a
+        field because FITS_rec.field converts (decodes strings, applies
+        scaling to) every row it is given. Slicing a wide table is itself
+        costly, so the last few slices are shared by all columns.
+        """
+        rows = self._slices.get(block)
+        if rows is not None:
+            self._slices.move_to_end(block)
+            return rows
+
+        start = block * self.BLOCK_SIZE
+        if self._rows is None:
+            rows = self._data[start : start + self.BLOCK_SIZE]
+        else:
+            rows = self._data[self._rows[start : start + self.BLOCK_SIZE]]
+        self._slices[block] = rows
+        if len(self._slices) > self.MAX_SLICES:
+            self._slices.popitem(last=False)
+        return rows
+
+    def _block(self, col: int, block: int) -> List[str]:
+        """
+        Return the formatted strings for one column block, formatting it on
+        first access and evicting the least recently used block when full.
+        """
+        key = (col, block)
+        cached = self._blocks.get(key)
+        if cached is not None:
+            self._blocks.move_to_end(key)
+            return cached
+
+        with tracer.span("format block", "table", col=col, block=block):
+            values = self._rowSlice(block).field(col)
+            formatted = format_column(np.asarray(values))
+
+        self._blocks[key] = formatted
+        if len(self._blocks) > self.MAX_BLOCKS:
+            self._blocks.popitem(last=False)
+        return formatted
@@ -0,0 +1,214 @@
+import os
+import threading
+from typing import List, Optional
+
+from PyQt6.QtCore import QObject, QRunnable, QSize, Qt, pyqtSignal
+from PyQt6.QtGui import QIcon, QImage, QPixmap
+from PyQt6.QtWidgets import (
+    QFileDialog,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QListView,
+    QListWidget,
+    QListWidgetItem,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+from opener import io_pool
+from profiling import tracer
+from stretch import Stretch
+from thumbcache import ThumbnailCache
+from utils import FITS_SUFFIXES, fits_to_preview
+
+THUMB_SIZE = 160
+
+
+class ThumbnailSignals(QObject):
+    # generation, row, thumbnail (null on failure)
+    ready = pyqtSignal(int, int, QImage)
+
+
+class ThumbnailJob(QRunnable):
+    """
+    Load one thumbnail from the disk cache, rendering and storing it on a miss
+    """
+
+    def __init__(
+        self,
+        generation: int,
+        row: int,
+        path: str,
+        size: int,
+        stretch: Stretch,
+        cache: ThumbnailCache,
+        cancelled: threading.Event,
+    ):
+        super().__init__()
+        self.signals = ThumbnailSignals()
+        self._generation = generation
+        self._row = row
+        self._path = path
+        self._size = size
+        self._stretch = stretch
+        self._cache = cache
+        self._cancelled = cancelled
+
+    def run(self) -> None:
+        # Jobs of a directory the browser has left still report back, so
+        # their owner can let go of them, but skip all work
+        if self._cancelled.is_set():
+            self.signals.ready.emit(self._generation, self._row, QImage())
+            return
+        image = self._cache.get(self._path, self._size, self._stretch.key)
+        if image is None:
+            try:
+                with tracer.span("thumbnail", "browser", path=self._path):
+                    image = fits_to_preview(
+                        self._path, stretch=self._stretch, size=self._size
+                    )
+                self._cache.put(self._path, self._size, image, self._stretch.key)
+            except Exception:
+                image = QImage()
+        self.signals.ready.emit(self._generation, self._row, image)
+
+
+class ThumbnailBrowser(QWidget):
+    """
+    Grid of thumbnails for the FITS files of one directory.
+
+    Thumbnails are produced on a private thread pool and kept in a persistent
+    `ThumbnailCache`, so a directory seen before fills in from cached PNGs
+    without decoding any FITS data. Changing directory drops queued work.
+    Activating a thumbnail emits `fileActivated` with its path.
+    """
+
+    fileActivated = pyqtSignal(str)
+
+    def __init__(
+        self,
+        cache: Optional[ThumbnailCache] = None,
+        size: int = THUMB_SIZE,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self._cache = cache or ThumbnailCache()
+        self._size = size
+        self._stretch = Stretch("zscale")
+        self._generation = 0
+        self._remaining = 0
+        self._jobs: dict = {}
+        self._cancelled = threading.Event()
+
+
+        self._pathEdit = QLineEdit()
+        self._pathEdit.returnPressed.connect(
+            lambda: self.setDirectory(self._pathEdit.text())
+        )
+        browseButton = QPushButton("Browse...")
+        browseButton.clicked.connect(self._browse)
+
+        self._list = QListWidget()
+        self._list.setViewMode(QListView.ViewMode.IconMode)
+        self._list.setResizeMode(QListView.ResizeMode.Adjust)
+        self._list.setMovement(QListView.Movement.Static)
+        self._list.setUniformItemSizes(True)
+        self._list.setIconSize(QSize(size, size))
+        self._list.setGridSize(QSize(size + 24, size + 36))
+        self._list.itemActivated.connect(
+            lambda item: self.fileActivated.emit(item.data(Qt.ItemDataRole.UserRole))
+        )
+
+        self._statusLabel = QLabel()
+
+        top = QHBoxLayout()
+        top.addWidget(self._pathEdit)
+        top.addWidget(browseButton)
+
+        layout = QVBoxLayout()
+        layout.addLayout(top)
+        layout.addWidget(self._list)
+        layout.addWidget(self._statusLabel)
+        self.setLayout(layout)
+
+        placeholder = QPixmap(size, size)
+        placeholder.fill(Qt.GlobalColor.darkGray)
+        self._placeholder = QIcon(placeholder)
+
+    def _browse(self) -> None:
+        directory = QFileDialog.getExistingDirectory(
+            self, "Browse Directory", self._pathEdit.text()
+        )
+        if directory:
+            self.setDirectory(directory)
+
+    def files(self) -> List[str]:
+        return [
+            self._list.item(row).data(Qt.ItemDataRole.UserRole)
+            for row in range(self._list.count())
+        ]
+
+    def setDirectory(self, directory: str) -> None:
+        directory = os.path.expanduser(directory)
+        self._pathEdit.setText(directory)
+
+        self._generation += 1
+        self._cancelled.set()
+        self._cancelled = threading.Event()
+        self._list.clear()
+
+        try:
+            names = sorted(
+                name
+                for name in os.listdir(directory)
+                if name.lower().endswith(FITS_SUFFIXES)
+            )
+        except OSError as e:
+            self._statusLabel.setText(str(e))
+            return
+
+        self._remaining = len(names)
+        for row, name in enumerate(names):
+            path = os.path.join(directory, name)
+            item = QListWidgetItem(self._placeholder, name)
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setToolTip(path)
+            self._list.addItem(item)
+
+            job = ThumbnailJob(
+                self._generation,
+                row,
+                path,
+                self._size,
+                self._stretch,
+                self._cache,
+                self._cancelled,
+            )
+            job.signals.ready.connect(self._onThumbnailReady)
+            # Keep the job (and its signals) alive until it reports back
+            self._jobs[self._generation, row] = job
+            io_pool().start(job)
+        self._updateStatus()
+
+    def _onThumbnailReady(self, generation: int, row: int, image: QImage) -> None:
+        self._jobs.pop((generation, row), None)
+        if generation != self._generation:
+            return
+        self._remaining -= 1
+        item = self._list.item(row)
+        if item is not None and not image.isNull():
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+        elif item is not None:
+            item.setText(f"{item.text()} (unreadable)")
+        self._updateStatus()
+
+    def _updateStatus(self) -> None:
+        count = self._list.count()
+        if self._remaining:
+            self._statusLabel.setText(
+                f"{count} files, {self._remaining} thumbnails pending"
+            )
+        else:
+            self._statusLabel.setText(f"{count} files")
@@ -0,0 +1,305 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from PyQt6.QtCore import QObject, QRectF, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QPainter, QPixmap
+from PyQt6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+
+
+def gray8_to_qimage(data: np.ndarray) -> QImage:
+    """
+    Wrap a 2D uint8 array as a grayscale QImage that owns its own copy
+    """
+    data = np.ascontiguousarray(data, dtype=np.uint8)
+    height, width = data.shape
+    return QImage(
+        data.data, width, height, width, QImage.Format.Format_Grayscale8
+    ).copy()
+
+
+def downsample2x(data: np.ndarray) -> np.ndarray:
+    """
+    Halve a uint8 image by averaging 2x2 blocks. Odd edges are padded by
+    repeating the last row/column.
+    """
+    height, width = data.shape
+    if height % 2 or width % 2:
+        data = np.pad(data, ((0, height % 2), (0, width % 2)), mode="edge")
+    acc = data[0::2, 0::2].astype(np.uint16)
+    acc += data[1::2, 0::2]
+    acc += data[0::2, 1::2]
+    acc += data[1::2, 1::2]
+    acc += 2
+    acc >>= 2
+    return acc.astype(np.uint8)
+
+
+class ArrayTiles:
+    """
+    Tile source over an in-memory 8-bit image. Level 0 is the image itself
+    and every further level halves it; levels are built on first use.
+
+    A tile source has a `shape`, a full resolution `data` array and a
+    `tile(level, tx, ty, size)` method returning one uint8 tile. Tiles of
+    levels below its `previewLevel` are slow to make, and are made on the
+    thread pool while the covering tile of `previewLevel` stands in.
+    """
+
+    previewLevel = 0
+
+    def __init__(self, data: np.ndarray):
+        self._levels: List[np.ndarray] = [data]
+        self.shape = data.shape
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._levels[0]
+
+    def _level(self, level: int) -> np.ndarray:
+        while len(self._levels) <= level:
+            self._levels.append(downsample2x(self._levels[-1]))
+        return self._levels[level]
+
+    def tile(self, level: int, tx: int, ty: int, size: int) -> np.ndarray:
+        data = self._level(level)
+        return data[ty * size : (ty + 1) * size, tx * size : (tx + 1) * size]
+
+
+class _TileSignals(QObject):
+    # (level, tx, ty), uint8 tile or None when it could not be made
+    ready = pyqtSignal(tuple, object)
+    # Full resolution uint8 image or None when it could not be made
+    frame = pyqtSignal(object)
+
+
+class _TileJob(QRunnable):
+    """
+    Make one slow tile of a tile source on a pool thread
+    """
+
+    def __init__(
+        self,
+        source,
+        key: Tuple[int, int, int],
+        size: int,
+        signals: _TileSignals,
+        cancelled: threading.Event,
+    ):
+        super().__init__()
+        self._source = source
+        self._key = key
+        self._size = size
+        # Shared by the item's jobs and held by each, so it outlives the item
+        self._signals = signals
+        self._cancelled = cancelled
+
+    def run(self) -> None:
+        if self._cancelled.is_set():
+            return
+        try:
+            block = self._source.tile(*self._key, self._size)
+        except Exception:
+            block = None
+        if not self._cancelled.is_set():
+            self._signals.ready.emit(self._key, block)
+
+
+class _FrameJob(QRunnable):
+    """
+    Assemble the full resolution image of a tile source on a pool thread
+    """
+
+    def __init__(self, source, signals: _TileSignals):
+        super().__init__()
+        self._source = source
+        self._signals = signals
+
+    def run(self) -> None:
+        try:
+            data = self._source.data
+        except Exception:
+            data = None
+        self._signals.frame.emit(data)
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    Graphics item that draws a large 8-bit image as a pyramid of tiles.
+
+    Level 0 is the full resolution image and every further level halves it.
+    Tiles come from a tile source: an `ArrayTiles` for a plain array, or a
+    source that produces tiles on demand, e.g. from compressed data. On each
+    paint only the tiles that intersect the exposed rect are drawn, from the
+    level that matches the current zoom, and the tile pixmaps live in a
+    bounded LRU cache. The pixmap memory therefore follows the viewport, not
+    the image size.
+
+    Tiles finer than the source's `previewLevel` are made on the thread
+    pool, so painting never waits for them; the part of the covering
+    preview level tile is drawn, scaled up, until they arrive.
+    """
+
+    TILE_SIZE = 512
+    MAX_TILES = 128
+
+    def __init__(self, source, parent: Optional[QGraphicsItem] = None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+        if isinstance(source, np.ndarray):
+            source = ArrayTiles(source)
+        self._source = source
+        self._height, self._width = source.shape
+        self._max_level = max(
+            0, math.ceil(math.log2(max(self._width, self._height) / self.TILE_SIZE))
+        )
+        self._tiles: OrderedDict = OrderedDict()
+        self._preview_level = min(source.previewLevel, self._max_level)
+        self._pending: set = set()
+        self._cancelled = threading.Event()
+        self._frame_callbacks: List[Callable[[Optional[np.ndarray]], None]] = []
+        self._signals = _TileSignals()
+        self._signals.ready.connect(self._onTileReady)
+        self._signals.frame.connect(self._onFrameReady)
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._source.data
+
+    def requestData(self, callback: Callable[[Optional[np.ndarray]], None]) -> None:
+        """
+        Call `callback` with the full resolution image, or None if it could
+        not be made. A source with slow tiles assembles it on the thread
+        pool; others at once.
+        """
+        if self._source.previewLevel == 0:
+            callback(self._source.data)
+            return
+        self._frame_callbacks.append(callback)
+        if len(self._frame_callbacks) == 1:
+            QThreadPool.globalInstance().start(_FrameJob(self._source, self._signals))
+
+    @property
+    def source(self):
+        return self._source
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, self._width, self._height)
+
+    def clearCache(self) -> None:
+        self._tiles.clear()
+
+    def cancel(self) -> None:
+        """
+        Drop the tiles still being made, when the item is taken down
+        """
+        self._cancelled.set()
+
+    def levelForScale(self, scale: float) -> int:
+        """
+        Return the coarsest pyramid level that still has at least one source
+        pixel per screen pixel at `scale`
+        """
+        if scale <= 0 or scale >= 1:
+            return 0
+        return min(self._max_level, int(math.floor(math.log2(1 / scale))))
+
+    def _store(self, key: Tuple[int, int, int], block: np.ndarray) -> QPixmap:
+        pix = QPixmap.fromImage(gray8_to_qimage(block))
+        self._tiles[key] = pix
+        while len(self._tiles) > self.MAX_TILES:
+            self._tiles.popitem(last=False)
+        return pix
+
+    def _tile(self, level: int, tx: int, ty: int) -> Optional[QPixmap]:
+        """
+        The pixmap of a tile, or None while a slow tile is being made
+        """
+        key = (level, tx, ty)
+        pix = self._tiles.get(key)
+        if pix is not None:
+            self._tiles.move_to_end(key)
+            return pix
+
+        if level < self._preview_level:
+            if key not in self._pending:
+                self._pending.add(key)
+                job = _TileJob(
+                    self._source, key, self.TILE_SIZE, self._signals, self._cancelled
+                )
+                QThreadPool.globalInstance().start(job)
+            return None
+        return self._store(key, self._source.tile(level, tx, ty, self.TILE_SIZE))
+
+    def _onTileReady(self, key: tuple, block: Optional[np.ndarray]) -> None:
+        self._pending.discard(key)
+        if block is None or self._cancelled.is_set():
+            return
+        level, tx, ty = key
+        self._store(key, block)
+        span = self.TILE_SIZE << level
+        self.update(QRectF(tx * span, ty * span, span, span))
+
+    def _onFrameReady(self, data: Optional[np.ndarray]) -> None:
+        callbacks, self._frame_callbacks = self._frame_callbacks, []
+        for callback in callbacks:
+            callback(data)
+
+    def _drawPlaceholder(
+        self, painter: QPainter, level: int, tx: int, ty: int
+    ) -> None:
+        """
+        Draw the part of the covering preview level tile that tile (tx, ty)
+        of `level` shows
+        """
+        shift = self._preview_level - level
+        pix = self._tile(self._preview_level, tx >> shift, ty >> shift)
+        size = self.TILE_SIZE >> shift
+        mask = (1 << shift) - 1
+        source = QRectF((tx & mask) * size, (ty & mask) * size, size, size)
+        source = source.intersected(QRectF(pix.rect()))
+        if source.isEmpty():
+            return
+        factor = 1 << self._preview_level
+        span = self.TILE_SIZE << level
+        target = QRectF(
+            tx * span, ty * span, source.width() * factor, source.height() * factor
+        )
+        painter.drawPixmap(target, pix, source)
+
+    def paint(
+        self,
+        painter: QPainter,
+        option: QStyleOptionGraphicsItem,
+        widget: Optional[QWidget] = None,
+    ) -> None:
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.levelForScale(scale)
+        factor = 1 << level
+        span = self.TILE_SIZE * factor
+
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+
+        x0 = int(exposed.left() // span)
+        y0 = int(exposed.top() // span)
+        x1 = int(math.ceil(exposed.right() / span))
+        y1 = int(math.ceil(exposed.bottom() / span))
+
+        painter.save()
+        painter.setClipRect(self.boundingRect())
+        for ty in range(y0, y1):
+            for tx in range(x0, x1):
+                pix = self._tile(level, tx, ty)
+                if pix is None:
+                    self._drawPlaceholder(painter, level, tx, ty)
+                    continue
+                target = QRectF(
+                    tx * span, ty * span, pix.width() * factor, pix.height() * factor
+                )
+                painter.drawPixmap(target, pix, QRectF(pix.rect()))
+        painter.restore()
@@ -0,0 +1,194 @@
+"""
+Headless batch rendering of FITS files to PNG/JPEG previews.
+
+    python main.py batch [options] INPUT [INPUT ...]
+
+INPUT may be a file, a glob or a directory. Work is spread over a process
+pool and no display or QApplication is needed.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from stretch import INTERVALS, TRANSFERS, Stretch
+from utils import FITS_SUFFIXES, fits_to_preview
+
+
+def find_inputs(patterns: List[str], recursive: bool = False) -> List[Tuple[str, str]]:
+    """
+    Expand files, globs and directories into (path, root) pairs. `root` is the
+    directory the output layout is mirrored from.
+    """
+    found = []
+    for pattern in patterns:
+        pattern = os.path.expanduser(pattern)
+        if os.path.isdir(pattern):
+            walker = os.walk(pattern) if recursive else [next(os.walk(pattern))]
+            for dirpath, _, names in walker:
+                for name in sorted(names):
+                    if name.lower().endswith(FITS_SUFFIXES):
+                        found.append((os.path.join(dirpath, name), pattern))
+        else:
+            for path in sorted(glob.glob(pattern, recursive=recursive)):
+                if os.path.isfile(path):
+                    found.append((path, os.path.dirname(path)))
+    return found
+
+
+def output_path(path: str, root: str, out_dir: str, fmt: str) -> str:
+    rel = os.path.relpath(path, root)
+    for suffix in FITS_SUFFIXES:
+        if rel.lower().endswith(suffix):
+            rel = rel[: -len(suffix)]
+            break
+    return os.path.join(out_dir, f"{rel}.{fmt}")
+
+
+def plan_outputs(
+    inputs: List[Tuple[str, str]], out_dir: str, fmt: str
+) -> List[Tuple[str, str]]:
+    """
+    (path, output) pairs for the inputs of `find_inputs`, each file once.
+    Files from different inputs that would share an output, e.g. a.fits
+    from two directories, are laid out from the directory they have in
+    common instead. Raises ValueError if outputs still collide.
+    """
+    sources: Dict[str, Tuple[str, str]] = {}
+    for path, root in inputs:
+        sources.setdefault(os.path.realpath(path), (path, root))
+
+    by_output: Dict[str, List[str]] = {}
+    for real, (path, root) in sources.items():
+        dst = output_path(path, root, out_dir, fmt)
+        by_output.setdefault(dst, []).append(real)
+
+    planned: Dict[str, str] = {}
+    for dst, reals in by_output.items():
+        if len(reals) == 1:
+            planned[reals[0]] = dst
+            continue
+        common = os.path.commonpath([os.path.dirname(real) for real in reals])
+        for real in reals:
+            planned[real] = output_path(real, common, out_dir, fmt)
+
+    outputs: Dict[str, str] = {}
+    for real, dst in planned.items():
+        if dst in outputs:
+            raise ValueError(
+                f"{sources[outputs[dst]][0]} and {sources[real][0]} would both "
+                f"be written to {dst}"
+            )
+        outputs[dst] = real
+    return [(sources[real][0], dst) for real, dst in planned.items()]
+
+
+def is_up_to_date(src: str, dst: str) -> bool:
+    try:
+        return os.stat(dst).st_mtime >= os.stat(src).st_mtime
+    except OSError:
+        return False
+
+
+def render_file(
+    path: str,
+    dst: str,
+    hdu: Optional[str],
+    interval: str,
+    transfer: str,
+    size: int,
+    fmt: str,
+    quality: int,
+) -> str:
+    """
+    Render one file to `dst`. Runs in a pool worker, so it takes only
+    picklable arguments.
+    """
+    image = fits_to_preview(path, hdu, Stretch(interval, transfer), size)
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    if not image.save(dst, "JPEG" if fmt == "jpg" else "PNG", quality):
+        raise IOError(f"could not write {dst}")
+    return dst
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="pyfitsexplorer batch", description="Render FITS files to images"
+    )
+    parser.add_argument("inputs", nargs="+", help="files, globs or directories")
+    parser.add_argument("-o", "--out", default="previews", help="output directory")
+    parser.add_argument("-r", "--recursive", action="store_true")
+    parser.add_argument("--hdu", help="HDU index or EXTNAME (default: first image)")
+    parser.add_argument("--interval", default="zscale", choices=INTERVALS)
+    parser.add_argument("--transfer", default="linear", choices=TRANSFERS)
+    parser.add_argument("--size", type=int, default=512, help="max side, 0 = full")
+    parser.add_argument("--format", default="png", choices=["png", "jpg"])
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="re-render up-to-date files")
+    args = parser.parse_args(argv)
+
+    try:
+        planned = plan_outputs(
+            find_inputs(args.inputs, args.recursive), args.out, args.format
+        )
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    todo = []
+    skipped = 0
+    for path, dst in planned:
+        if not args.force and is_up_to_date(path, dst):
+            skipped += 1
+            continue
+        todo.append((path, dst))
+
+    total = len(todo)
+    print(f"{total} to render, {skipped} up to date", flush=True)
+    if total == 0:
+        return 0
+
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(
+                render_file,
+                path,
+                dst,
+                args.hdu,
+                args.interval,
+                args.transfer,
+                args.size,
+                args.format,
+                args.quality,
+            ): path
+            for path, dst in todo
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                future.result()
+                status = "ok"
+            except Exception as e:
+                failed += 1
+                status = f"FAILED: {e}"
+            print(f"[{done}/{total}] {path} {status}", flush=True)
+
+    elapsed = time.perf_counter() - start
+    rendered = total - failed
+    print(
+        f"rendered {rendered} files in {elapsed:.2f} s "
+        f"({rendered / elapsed:.1f} files/s), {failed} failed",
+        flush=True,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
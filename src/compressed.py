@@ -0,0 +1,318 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from profiling import tracer
+from render import PREVIEW_SIZE
+from stretch import Stretch, StretchEngine, compute_limits
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Every `hdu.section` call re-validates the compression header, which costs
+# about as much as decompressing this many pixels. Runs of needed tiles with
+# gaps smaller than that are read in one call, gap tiles included.
+MERGE_PIXELS = 100_000
+
+# Upper bound on the pixels decompressed by one merged read
+MAX_READ_PIXELS = 8 * 1024 * 1024
+
+
+def _runs(indices: np.ndarray, gap: int, length: int) -> list:
+    """
+    Group sorted tile indices into (start, stop) runs, bridging gaps of up to
+    `gap` tiles and splitting runs longer than `length`
+    """
+    runs = []
+    for i in indices.tolist():
+        if runs and i - runs[-1][1] <= gap and i + 1 - runs[-1][0] <= length:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+
+class CompressedImage:
+    """
+    Region access to a 2D tile-compressed image (`fits.CompImageHDU`).
+
+    Regions are assembled from the image's own compression tiles. Each tile
+    is decompressed on its own through `hdu.section` the first time it is
+    needed and kept in an LRU cache of up to `max_bytes`, so reading a
+    region only decompresses the tiles it overlaps. Strided reads skip tiles
+    that hold none of the sampled rows or columns, which makes coarse reads
+    of row-tiled images (the default ZTILE) proportionally cheaper.
+    """
+
+    def __init__(
+        self,
+        hdu: fits.CompImageHDU,
+        shape: Tuple[int, int],
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self._hdu = hdu
+        self.shape = tuple(shape[-2:])
+        tile_shape = tuple(int(n) for n in (hdu.tile_shape or ())[-2:])
+        if len(tile_shape) < 2:
+            tile_shape = (1, *tile_shape) if tile_shape else (1, self.shape[1])
+        # A tile size of 0 or larger than the image means the whole axis
+        self.tileShape = tuple(
+            n if 0 < n <= size else size for n, size in zip(tile_shape, self.shape)
+        )
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._tiles: OrderedDict = OrderedDict()
+        # hdu.section seeks and reads on a shared file handle
+        self._lock = threading.Lock()
+        self.decompressed = 0
+
+    def _store(self, key: Tuple[int, int], tile: np.ndarray) -> None:
+        if key in self._tiles:
+            return
+        self._tiles[key] = tile
+        self._bytes += tile.nbytes
+        while self._bytes > self._max_bytes and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self._bytes -= old.nbytes
+
+    def _read(self, ty0: int, ty1: int, tx0: int, tx1: int) -> None:
+        """
+        Decompress the block of tiles [ty0, ty1) x [tx0, tx1) in one call and
+        cache it tile by tile
+        """
+        th, tw = self.tileShape
+        block = self._hdu.section[ty0 * th : ty1 * th, tx0 * tw : tx1 * tw]
+        self.decompressed += (ty1 - ty0) * (tx1 - tx0)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                y, x = (ty - ty0) * th, (tx - tx0) * tw
+                self._store((ty, tx), block[y : y + th, x : x + tw].copy())
+
+    def _tile(self, ty: int, tx: int) -> np.ndarray:
+        key = (ty, tx)
+        tile = self._tiles.get(key)
+        if tile is None:
+            self._read(ty, ty + 1, tx, tx + 1)
+            tile = self._tiles[key]
+        self._tiles.move_to_end(key)
+        return tile
+
+    def _prefetch(self, tys: np.ndarray, txs: np.ndarray) -> None:
+        """
+        Decompress the missing tiles of the grid `tys` x `txs` in as few
+        section calls as the merge rules allow
+        """
+        th, tw = self.tileShape
+        tile_pixels = th * tw
+        gap = MERGE_PIXELS // tile_pixels
+        length = max(1, MAX_READ_PIXELS // tile_pixels)
+        x_runs = _runs(txs, gap, length)
+        for x0, x1 in x_runs:
+            y_length = max(1, length // (x1 - x0))
+            for y0, y1 in _runs(tys, gap, y_length):
+                missing = [
+                    (ty, tx)
+                    for ty in tys[(tys >= y0) & (tys < y1)].tolist()
+                    for tx in txs[(txs >= x0) & (txs < x1)].tolist()
+                    if (ty, tx) not in self._tiles
+                ]
+                if missing:
+                    ys, xs = zip(*missing)
+                    self._read(min(ys), max(ys) + 1, min(xs), max(xs) + 1)
+
+    def region(
+        self, y0: int, y1: int, x0: int, x1: int, step: int = 1
+    ) -> np.ndarray:
+        """
+        Return `data[y0:y1:step, x0:x1:step]`, decompressing only the tiles
+        that hold sampled pixels
+        """
+        height, width = self.shape
+        y1, x1 = min(y1, height), min(x1, width)
+        rows = np.arange(y0, y1, step)
+        cols = np.arange(x0, x1, step)
+        th, tw = self.tileShape
+
+        with self._lock:
+            out = None
+            self._prefetch(np.unique(rows // th), np.unique(cols // tw))
+            for ty in np.unique(rows // th):
+                r = np.nonzero(rows // th == ty)[0]
+                ly = slice(rows[r[0]] - ty * th, rows[r[-1]] - ty * th + 1, step)
+                for tx in np.unique(cols // tw):
+                    c = np.nonzero(cols // tw == tx)[0]
+                    lx = slice(cols[c[0]] - tx * tw, cols[c[-1]] - tx * tw + 1, step)
+                    tile = self._tile(int(ty), int(tx))
+                    if out is None:
+                        out = np.empty((len(rows), len(cols)), dtype=tile.dtype)
+                    out[r[0] : r[-1] + 1, c[0] : c[-1] + 1] = tile[ly, lx]
+        if out is None:
+            out = np.empty((len(rows), len(cols)), dtype=np.float32)
+        return out
+
+    def cachedValue(self, y: int, x: int) -> Optional[float]:
+        """
+        Value of pixel (x, y) if its tile is already decompressed, without
+        waiting for the lock a decompression on the pool holds
+        """
+        th, tw = self.tileShape
+        tile = self._tiles.get((y // th, x // tw))
+        if tile is None:
+            return None
+        return float(tile[y % th, x % tw])
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+            self._bytes = 0
+
+
+class CompressedTiles:
+    """
+    Tile source (see `TiledImageItem`) rendering a `CompressedImage` with a
+    fixed stretch.
+
+    Display tiles are cut from an 8-bit preview of the whole image where
+    the preview is fine enough for the level, and otherwise decompressed and
+    stretched on demand from the regions they cover. Levels below
+    `previewLevel` are the decompressed ones, which `TiledImageItem` makes on
+    the thread pool.
+    """
+
+    def __init__(
+        self,
+        image: CompressedImage,
+        stretch: Stretch,
+        limits: Tuple[float, float],
+        preview: np.ndarray,
+        stride: int,
+    ):
+        self._image = image
+        self._stretch = stretch
+        self._limits = limits
+        self._preview = preview
+        self._stride = stride
+        self.shape = image.shape
+        # The stride is a power of two; levels from this one map onto the
+        # preview exactly
+        self.previewLevel = stride.bit_length() - 1
+
+    @property
+    def limits(self) -> Tuple[float, float]:
+        return self._limits
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        The full resolution 8-bit image. This decompresses every tile.
+        """
+        height, width = self.shape
+        return self._render(self._image.region(0, height, 0, width))
+
+    def _render(self, raw: np.ndarray) -> np.ndarray:
+        return StretchEngine(raw).render(self._stretch, self._limits)
+
+    def tile(self, level: int, tx: int, ty: int, size: int) -> np.ndarray:
+        factor = 1 << level
+        span = size * factor
+        if factor >= self._stride and factor % self._stride == 0:
+            k = factor // self._stride
+            p = span // self._stride
+            return self._preview[ty * p : (ty + 1) * p : k, tx * p : (tx + 1) * p : k]
+
+        with tracer.span("decompress tile", "render", level=level, tx=tx, ty=ty):
+            raw = self._image.region(
+                ty * span, (ty + 1) * span, tx * span, (tx + 1) * span, factor
+            )
+            return self._render(raw)
+
+
+def preview_stride(shape: Tuple[int, int]) -> int:
+    """
+    Power-of-two stride that brings the longest side down to about
+    `PREVIEW_SIZE`, so that pyramid levels at or above it map onto the
+    preview exactly
+    """
+    ratio = max(shape) / PREVIEW_SIZE
+    return 1 << max(0, int(math.floor(math.log2(ratio)))) if ratio > 1 else 1
+
+
+class PixelSignals(QObject):
+    # x, y, value
+    ready = pyqtSignal(int, int, float)
+    failed = pyqtSignal(int, int, str)
+
+
+class PixelJob(QRunnable):
+    """
+    Decompress the tile holding pixel (x, y) on a pool thread and report the
+    pixel's value, for the cursor readout
+    """
+
+    def __init__(self, image: CompressedImage, x: int, y: int):
+        super().__init__()
+        self.signals = PixelSignals()
+        self._image = image
+        self.x = x
+        self.y = y
+
+    def run(self) -> None:
+        try:
+            pixel = self._image.region(self.y, self.y + 1, self.x, self.x + 1)
+            value = float(pixel[0, 0])
+        except Exception as e:
+            self.signals.failed.emit(self.x, self.y, str(e))
+            return
+        self.signals.ready.emit(self.x, self.y, value)
+
+
+class CompressedSignals(QObject):
+    # job id, CompressedTiles
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class CompressedRenderJob(QRunnable):
+    """
+    Prepare a `CompressedTiles` source on a pool thread: decompress a strided
+    preview, estimate the stretch limits from it and render it to 8 bits
+    """
+
+    def __init__(self, job_id: int, image: CompressedImage, stretch: Stretch):
+        super().__init__()
+        self.job_id = job_id
+        self.signals = CompressedSignals()
+        self._image = image
+        self._stretch = stretch
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def run(self) -> None:
+        try:
+            height, width = self._image.shape
+            stride = preview_stride(self._image.shape)
+            with tracer.span(
+                "preview decompress", "render", stride=stride
+            ) as span:
+                raw = self._image.region(0, height, 0, width, stride)
+                span["tiles"] = self._image.decompressed
+            if self._cancel.is_set():
+                return
+            with tracer.span("normalize", "render", stretch=str(self._stretch.key)):
+                limits = compute_limits(raw, self._stretch)
+                preview = StretchEngine(raw).render(self._stretch, limits)
+            source = CompressedTiles(self._image, self._stretch, limits, preview, stride)
+            if not self._cancel.is_set():
+                self.signals.finished.emit(self.job_id, source)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
@@ -0,0 +1,235 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+from PyQt6.QtCore import QObject, QRunnable, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from TiledImageItem import gray8_to_qimage
+from opener import io_pool
+from profiling import tracer
+from stretch import Stretch, StretchEngine, compute_limits, sample_finite
+
+# Planes sampled to estimate one stretch for the whole cube
+LIMIT_SAMPLE_PLANES = 16
+
+
+class CubeStack:
+    """
+    Plane-at-a-time access to an image HDU with NAXIS 3 or 4.
+
+    Planes are read through `hdu.section`, so only the requested plane is
+    read from disk (and scaled, for BSCALE/BZERO data) and the cube is never
+    loaded as a whole. Leading axes of a 4D cube are flattened into one
+    plane index.
+    """
+
+    def __init__(self, hdu: fits.ImageHDU, shape: Tuple[int, ...]):
+        self._hdu = hdu
+        self._lead_shape = shape[:-2]
+        self.planeShape: Tuple[int, int] = shape[-2:]
+        self.count: int = int(np.prod(self._lead_shape))
+        # hdu.section seeks and reads on a shared file handle
+        self._lock = threading.Lock()
+        self._limits: Dict[tuple, Tuple[float, float]] = {}
+
+    def planeIndex(self, i: int) -> Tuple[int, ...]:
+        return tuple(int(n) for n in np.unravel_index(i, self._lead_shape))
+
+    def plane(self, i: int) -> np.ndarray:
+        with self._lock:
+            return self._hdu.section[self.planeIndex(i)]
+
+    def limits(self, stretch: Stretch) -> Tuple[float, float]:
+        """
+        Display limits shared by every plane, estimated from samples of up
+        to `LIMIT_SAMPLE_PLANES` evenly spaced planes
+        """
+        key = stretch.intervalKey
+        if key not in self._limits:
+            picks = np.unique(
+                np.linspace(0, self.count - 1, min(self.count, LIMIT_SAMPLE_PLANES))
+            ).astype(int)
+            size = max(1000, 250_000 // len(picks))
+            samples = [sample_finite(self.plane(i), size) for i in picks]
+            self._limits[key] = compute_limits(np.concatenate(samples), stretch)
+        return self._limits[key]
+
+    def render(self, i: int, stretch: Stretch) -> np.ndarray:
+        limits = self.limits(stretch)
+        return StretchEngine(self.plane(i)).render(stretch, limits)
+
+
+class PlaneSignals(QObject):
+    # generation, plane, 8-bit frame, QImage of it
+    ready = pyqtSignal(int, int, object, QImage)
+    failed = pyqtSignal(int, int, str)
+
+
+class PlaneJob(QRunnable):
+    def __init__(
+        self, generation: int, stack: CubeStack, plane: int, stretch: Stretch
+    ):
+        super().__init__()
+        self.signals = PlaneSignals()
+        self._generation = generation
+        self._stack = stack
+        self._plane = plane
+        self._stretch = stretch
+
+    def run(self) -> None:
+        try:
+            with tracer.span("cube plane", "cube", plane=self._plane):
+                frame = self._stack.render(self._plane, self._stretch)
+                image = gray8_to_qimage(frame)
+            self.signals.ready.emit(self._generation, self._plane, frame, image)
+        except Exception as e:
+            self.signals.failed.emit(self._generation, self._plane, str(e))
+
+
+class CubePlayer(QObject):
+    """
+    Serves rendered planes of a `CubeStack` and plays them back.
+
+    Rendered planes are kept in a ring buffer of `capacity` frames. Every
+    request also schedules the next `prefetch` planes in the playback
+    direction on the thread pool, so playback mostly finds its next frame
+    ready. A playback tick whose frame is not ready yet is skipped rather
+    than blocking the GUI.
+    """
+
+    planeReady = pyqtSignal(int, object, QImage)
+    failed = pyqtSignal(str)
+
+    def __init__(
+        self,
+        stack: CubeStack,
+        stretch: Stretch,
+        capacity: int = 16,
+        prefetch: int = 4,
+        parent: Optional[QObject] = None,
+    ):
+        super().__init__(parent)
+        self._stack = stack
+        self._stretch = stretch
+        self._capacity = capacity
+        self._prefetch = min(prefetch, capacity - 1)
+        self._buffer: OrderedDict = OrderedDict()
+        self._pending: set = set()
+        self._jobs: list = []
+        self._generation = 0
+        self._current = 0
+        self._wanted: Optional[int] = None
+        self._step = 1
+        self.stalledTicks = 0
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._tick)
+
+    @property
+    def count(self) -> int:
+        return self._stack.count
+
+    @property
+    def current(self) -> int:
+        return self._current
+
+    @property
+    def stack(self) -> CubeStack:
+        return self._stack
+
+    def isPlaying(self) -> bool:
+        return self._timer.isActive()
+
+    def setStretch(self, stretch: Stretch) -> None:
+        """
+        Switch stretch; buffered planes are dropped and the current plane is
+        rendered again
+        """
+        self._stretch = stretch
+        self._generation += 1
+        self._buffer.clear()
+        self._pending.clear()
+        self.showPlane(self._current)
+
+    def showPlane(self, i: int) -> None:
+        i %= self.count
+        self._current = i
+        self._wanted = i
+        if i in self._buffer:
+            self._deliver(i)
+        else:
+            self._schedule(i)
+        self._prefetchFrom(i)
+
+    def play(self, fps: float, step: int = 1) -> None:
+        self._step = step
+        self._timer.setInterval(max(1, int(1000 / fps)))
+        self._timer.start()
+        self._prefetchFrom(self._current)
+
+    def stop(self) -> None:
+        self._timer.stop()
+
+    def _tick(self) -> None:
+        nxt = (self._current + self._step) % self.count
+        if nxt not in self._buffer:
+            self.stalledTicks += 1
+            self._schedule(nxt)
+            return
+        self._current = nxt
+        self._deliver(nxt)
+        self._prefetchFrom(nxt)
+
+    def _deliver(self, i: int) -> None:
+        self._buffer.move_to_end(i)
+        frame, image = self._buffer[i]
+        self._wanted = None
+        self.planeReady.emit(i, frame, image)
+
+    def _prefetchFrom(self, i: int) -> None:
+        for k in range(1, self._prefetch + 1):
+            self._schedule((i + k * self._step) % self.count)
+
+    def _schedule(self, i: int) -> None:
+        if i in self._buffer or i in self._pending:
+            return
+        self._pending.add(i)
+        job = PlaneJob(self._generation, self._stack, i, self._stretch)
+        job.signals.ready.connect(self._onPlaneReady)
+        job.signals.failed.connect(self._onPlaneFailed)
+        # Keep the job (and its signals) alive until it reports back
+        self._jobs.append(job)
+        io_pool().start(job)
+
+    def _onPlaneReady(
+        self, generation: int, i: int, frame: np.ndarray, image: QImage
+    ) -> None:
+        self._jobs = [j for j in self._jobs if j.signals is not self.sender()]
+        if generation != self._generation:
+            return
+        self._pending.discard(i)
+        self._buffer[i] = (frame, image)
+        if self._wanted == i:
+            self._deliver(i)
+        self._evict()
+
+    def _onPlaneFailed(self, generation: int, i: int, error: str) -> None:
+        self._jobs = [j for j in self._jobs if j.signals is not self.sender()]
+        if generation != self._generation:
+            return
+        self._pending.discard(i)
+        self.stop()
+        self.failed.emit(error)
+
+    def _evict(self) -> None:
+        # Distance ahead of the playhead in playback direction; the plane just
+        # behind it is the furthest "ahead" and is dropped first
+        while len(self._buffer) > self._capacity:
+            furthest = max(
+                self._buffer,
+                key=lambda p: ((p - self._current) * self._step) % self.count,
+            )
+            del self._buffer[furthest]
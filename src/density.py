@@ -0,0 +1,138 @@
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from profiling import tracer
+
+# Rows binned per step, bounding the temporary copies to one chunk
+ROW_CHUNK = 1 << 20
+
+# Above this many rows a strided sample is binned and shown first
+SAMPLE_ROWS = 4_000_000
+
+
+class DensityGrid:
+    def __init__(
+        self,
+        counts: np.ndarray,
+        xrange: Tuple[float, float],
+        yrange: Tuple[float, float],
+        step: int = 1,
+    ):
+        self.counts = counts
+        self.xrange = xrange
+        self.yrange = yrange
+        # Every `step`-th row was binned; 1 for an exact grid
+        self.step = step
+
+    @property
+    def extent(self) -> Tuple[float, float, float, float]:
+        return (*self.xrange, *self.yrange)
+
+    @property
+    def points(self) -> int:
+        return int(self.counts.sum()) * self.step
+
+
+def bin_density(
+    x: np.ndarray,
+    y: np.ndarray,
+    xrange: Tuple[float, float],
+    yrange: Tuple[float, float],
+    shape: Tuple[int, int],
+    mask: Optional[np.ndarray] = None,
+    step: int = 1,
+    cancelled: Optional[threading.Event] = None,
+) -> Optional[DensityGrid]:
+    """
+    Count the points (x, y) falling in each cell of a `shape` (rows, columns)
+    grid spanning `xrange` by `yrange`.
+
+    The columns are walked in chunks of `ROW_CHUNK` rows, so memory use is
+    the grid plus one chunk whatever the table size. Rows outside the ranges,
+    non-finite values and rows where `mask` is False are skipped. With a
+    `step`, only every `step`-th row is binned. Returns None if `cancelled`
+    is set part way through.
+    """
+    ny, nx = shape
+    x0, x1 = xrange
+    y0, y1 = yrange
+    if x1 <= x0:
+        x1 = x0 + 1.0
+    if y1 <= y0:
+        y1 = y0 + 1.0
+    sx = nx / (x1 - x0)
+    sy = ny / (y1 - y0)
+
+    counts = np.zeros(nx * ny, dtype=np.int64)
+    chunk = ROW_CHUNK * step
+    for start in range(0, len(x), chunk):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        xc = x[start : start + chunk : step]
+        yc = y[start : start + chunk : step]
+        # Comparisons with NaN are False, so this also drops non-finite rows
+        inside = (xc >= x0) & (xc < x1) & (yc >= y0) & (yc < y1)
+        if mask is not None:
+            inside &= mask[start : start + chunk : step]
+
+        ix = np.subtract(xc[inside], x0, dtype=np.float64)
+        ix *= sx
+        ix = ix.astype(np.intp)
+        iy = np.subtract(yc[inside], y0, dtype=np.float64)
+        iy *= sy
+        iy = iy.astype(np.intp)
+        # Rounding can put a value just below the upper edge into the next cell
+        np.minimum(ix, nx - 1, out=ix)
+        np.minimum(iy, ny - 1, out=iy)
+        iy *= nx
+        iy += ix
+        counts += np.bincount(iy, minlength=nx * ny)
+
+    return DensityGrid(counts.reshape(ny, nx), (x0, x1), (y0, y1), step)
+
+
+class DensitySignals(QObject):
+    # generation, DensityGrid
+    binned = pyqtSignal(int, object)
+
+
+class DensityJob(QRunnable):
+    """
+    Bin two columns into a density grid on a pool thread. Large tables get a
+    quick pass over a strided sample first, followed by the exact grid.
+    """
+
+    def __init__(
+        self,
+        generation: int,
+        x: np.ndarray,
+        y: np.ndarray,
+        xrange: Tuple[float, float],
+        yrange: Tuple[float, float],
+        shape: Tuple[int, int],
+        mask: Optional[np.ndarray] = None,
+    ):
+        super().__init__()
+        self.generation = generation
+        self.signals = DensitySignals()
+        self._args = (x, y, xrange, yrange, shape, mask)
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def run(self) -> None:
+        rows = len(self._args[0])
+        steps = [1]
+        if rows > SAMPLE_ROWS:
+            steps.insert(0, -(-rows // SAMPLE_ROWS))
+
+        for step in steps:
+            with tracer.span("density bin", "plot", rows=rows, step=step):
+                grid = bin_density(*self._args, step=step, cancelled=self._cancel)
+            if grid is None or self._cancel.is_set():
+                return
+            self.signals.binned.emit(self.generation, grid)
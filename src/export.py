@@ -0,0 +1,441 @@
+import contextlib
+import os
+import struct
+import threading
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from profiling import tracer
+from stretch import Stretch, compute_limits, stretch_rows16
+from strips import (
+    ImageReader,
+    ImageSource,
+    create_fits,
+    image_header,
+    storage,
+    to_storage,
+)
+
+CHUNK_ROWS = 65536
+WRITE_BUFFER = 1 << 20
+
+# Image exports are read, stretched and written this many pixels at a time,
+# whatever the size of the image
+STRIP_PIXELS = 4 * 1024 * 1024
+
+# zlib level for PNG. Writing a large PNG is bound by compression, and
+# higher levels gain little on noisy astronomical data at several times the
+# cost.
+PNG_COMPRESSION = 1
+
+IMAGE_FORMATS = ("png", "tiff", "fits")
+
+# Backslashes are parked on a private-use placeholder first so that the braces
+# added by the other escapes are not escaped a second time.
+_BACKSLASH = "\ue000"
+LATEX_REPLACEMENTS = [
+    ("\\", _BACKSLASH),
+    ("&", "\\&"),
+    ("%", "\\%"),
+    ("$", "\\$"),
+    ("#", "\\#"),
+    ("_", "\\_"),
+    ("{", "\\{"),
+    ("}", "\\}"),
+    ("~", "\\textasciitilde{}"),
+    ("^", "\\textasciicircum{}"),
+    (_BACKSLASH, "\\textbackslash{}"),
+]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def escape_latex(text: str) -> str:
+    """
+    Escape LaTeX special characters
+    """
+    for char, escape in LATEX_REPLACEMENTS:
+        text = text.replace(char, escape)
+    return text
+
+
+def _format_chunk(values: np.ndarray, latex: bool = False) -> List[str]:
+    """
+    Format one column chunk to strings in a single vectorized pass
+    """
+    if values.ndim == 1:
+        if values.dtype.kind == "S":
+            out = np.char.decode(values, "utf-8", errors="ignore")
+        elif values.dtype.kind == "U":
+            out = values
+        else:
+            out = values.astype(str)
+        if latex and out.dtype.kind == "U":
+            for char, escape in LATEX_REPLACEMENTS:
+                out = np.char.replace(out, char, escape)
+        return out.tolist()
+
+    # Vector columns: every cell is itself an array
+    out = [str(value) for value in values]
+    if latex:
+        out = [escape_latex(value) for value in out]
+    return out
+
+
+def export_table(
+    data,
+    path: str,
+    fmt: str = "csv",
+    chunk_rows: int = CHUNK_ROWS,
+    progress: Optional[Callable[[int, int], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> int:
+    """
+    Stream a FITS_rec to `path` as csv, tsv or tex.
+
+    The table is processed column-wise in chunks of `chunk_rows`, so memory
+    stays bounded by the chunk size. `progress(done, total)` is called after
+    every chunk, and `cancelled()` is polled before each one; when it returns
+    True, `ExportCancelled` is raised. Returns the number of rows written.
+    """
+    col_names = list(data.names)
+    nrows = len(data)
+    latex = fmt == "tex"
+
+    if latex:
+        sep, end = " & ", " \\\\\n"
+    else:
+        sep, end = ("\t" if fmt == "tsv" else ","), "\n"
+
+    with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+        if latex:
+            f.write("\\begin{tabular}{" + " | ".join(["l"] * len(col_names)) + "}\n")
+            f.write("\\hline\n")
+            header = " & ".join(escape_latex(s) for s in col_names)
+            f.write(f"{header} \\\\\n\\hline\n")
+        else:
+            f.write(sep.join(col_names) + "\n")
+
+        for start in range(0, nrows, chunk_rows):
+            if cancelled is not None and cancelled():
+                raise ExportCancelled()
+
+            with tracer.span("export chunk", "export", start=start):
+                # Field conversion happens on the chunk only, bounding memory
+                chunk = data[start : start + chunk_rows]
+                cells = [
+                    _format_chunk(np.asarray(chunk.field(i)), latex)
+                    for i in range(len(col_names))
+                ]
+                stop = start + len(chunk)
+                f.write(end.join(map(sep.join, zip(*cells))))
+                f.write(end)
+
+            if progress is not None:
+                progress(stop, nrows)
+
+        if latex:
+            f.write("\\hline\n\\end{tabular}\n")
+
+    return nrows
+
+
+class TableExportWorker(QThread):
+    """
+    Runs `export_table` off the UI thread
+    """
+
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    succeeded = pyqtSignal(str)
+
+    def __init__(self, data, path: str, fmt: str, parent=None):
+        super().__init__(parent)
+        self._data = data
+        self._path = path
+        self._fmt = fmt
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def run(self) -> None:
+        try:
+            with tracer.span("export", "export", rss=True, format=self._fmt):
+                export_table(
+                    self._data,
+                    self._path,
+                    self._fmt,
+                    progress=self.progress.emit,
+                    cancelled=self._cancel.is_set,
+                )
+        except ExportCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(self._path)
+
+
+class _PngWriter:
+    """
+    16-bit grayscale PNG written one strip of rows at a time. Rows use the
+    Up filter, which suits smooth astronomical images, and are compressed
+    as they come.
+    """
+
+    def __init__(self, path: str, width: int, height: int):
+        self._f = open(path, "wb", buffering=WRITE_BUFFER)
+        self._f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 16, 0, 0, 0, 0))
+        self._zlib = zlib.compressobj(PNG_COMPRESSION)
+        self._previous = np.zeros(width * 2, dtype=np.uint8)
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._f.write(struct.pack(">I", len(data)))
+        self._f.write(kind)
+        self._f.write(data)
+        self._f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, strip: np.ndarray) -> None:
+        rows = strip.astype(">u2").view(np.uint8).reshape(len(strip), -1)
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        np.subtract(rows[0], self._previous, out=filtered[0, 1:])
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        self._previous = rows[-1].copy()
+        data = self._zlib.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self) -> None:
+        self._chunk(b"IDAT", self._zlib.flush())
+        self._chunk(b"IEND", b"")
+        self._f.close()
+
+
+class _TiffWriter:
+    """
+    16-bit grayscale TIFF with one uncompressed strip per strip of rows.
+    The strip table and directory go after the image data, once their
+    offsets are known. Files over 4 GiB are written as BigTIFF.
+    """
+
+    SHORT, LONG, LONG8 = 3, 4, 16
+
+    def __init__(self, path: str, width: int, height: int, rows_per_strip: int):
+        self._width = width
+        self._height = height
+        self._rows_per_strip = rows_per_strip
+        strips = -(-height // rows_per_strip)
+        self._big = width * height * 2 + strips * 16 + 4096 >= 2**32
+        self._f = open(path, "wb", buffering=WRITE_BUFFER)
+        self._f.write(b"\0" * (16 if self._big else 8))
+        self._offsets: List[int] = []
+        self._counts: List[int] = []
+
+    def write(self, strip: np.ndarray) -> None:
+        data = strip.astype("<u2").tobytes()
+        self._offsets.append(self._f.tell())
+        self._counts.append(len(data))
+        self._f.write(data)
+
+    def _entry(self, tag: int, kind: int, values: List[int]) -> bytes:
+        """
+        A directory entry; values that do not fit in it are written to the
+        file and referenced by offset
+        """
+        code = {self.SHORT: "H", self.LONG: "I", self.LONG8: "Q"}[kind]
+        data = struct.pack(f"<{len(values)}{code}", *values)
+        slot = 8 if self._big else 4
+        if len(data) > slot:
+            offset = self._f.tell()
+            self._f.write(data)
+            if offset % 2:
+                self._f.write(b"\0")
+            data = struct.pack("<Q" if self._big else "<I", offset)
+        data = data.ljust(slot, b"\0")
+        count = struct.pack("<Q" if self._big else "<I", len(values))
+        return struct.pack("<HH", tag, kind) + count + data
+
+    def close(self) -> None:
+        if self._f.tell() % 2:
+            self._f.write(b"\0")
+        offset_kind = self.LONG8 if self._big else self.LONG
+        entries = [
+            self._entry(256, self.LONG, [self._width]),
+            self._entry(257, self.LONG, [self._height]),
+            self._entry(258, self.SHORT, [16]),
+            self._entry(259, self.SHORT, [1]),
+            self._entry(262, self.SHORT, [1]),
+            self._entry(273, offset_kind, self._offsets),
+            self._entry(277, self.SHORT, [1]),
+            self._entry(278, self.LONG, [self._rows_per_strip]),
+            self._entry(279, offset_kind, self._counts),
+        ]
+        directory = self._f.tell()
+        if self._big:
+            self._f.write(struct.pack("<Q", len(entries)))
+            self._f.write(b"".join(entries))
+            self._f.write(struct.pack("<Q", 0))
+            header = b"II" + struct.pack("<HHHQ", 43, 8, 0, directory)
+        else:
+            self._f.write(struct.pack("<H", len(entries)))
+            self._f.write(b"".join(entries))
+            self._f.write(struct.pack("<I", 0))
+            header = b"II" + struct.pack("<HI", 42, directory)
+        self._f.seek(0)
+        self._f.write(header)
+        self._f.close()
+
+
+def export_image(
+    source: ImageSource,
+    path: str,
+    fmt: str = "png",
+    region: Optional[Tuple[int, int, int, int]] = None,
+    stretch: Optional[Stretch] = None,
+    limits: Optional[Tuple[float, float]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> int:
+    """
+    Export an image, or the (x0, y0, x1, y1) `region` of it, from its data.
+
+    png and tiff are 16-bit grayscale rendered with `stretch` between
+    `limits` (estimated from a sample of the image when not given). fits is
+    a cutout holding the stored values unchanged, with the header and WCS
+    of the source moved to the cutout's origin.
+
+    The image is read, converted and written in strips of rows of at most
+    `STRIP_PIXELS`, so memory stays the same for any image size.
+    `progress(done, total)` is called with the rows written; when
+    `cancelled()` returns True, `ExportCancelled` is raised. Returns the
+    number of rows written.
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"unsupported image format {fmt}")
+    height, width = source.shape
+    x0, y0, x1, y1 = region if region is not None else (0, 0, width, height)
+    x0, x1 = max(0, min(x0, x1)), min(width, max(x0, x1))
+    y0, y1 = max(0, min(y0, y1)), min(height, max(y0, y1))
+    if x0 >= x1 or y0 >= y1:
+        raise ValueError("empty region")
+    shape = (y1 - y0, x1 - x0)
+    step = max(1, STRIP_PIXELS // shape[1])
+
+    reader = ImageReader(source)
+    writer = None
+    try:
+        if fmt == "fits":
+            stored, bitpix, bzero = storage(reader.raw(y0, y0 + 1, x0, x0 + 1).dtype)
+            header = image_header(reader.header, shape, bitpix, (x0, y0))
+            for card in reader.scaling.cards:
+                header[card.keyword] = card.value
+            if bzero:
+                header["BZERO"] = bzero
+            header.add_history(
+                f"pyfitsexplorer: cutout [{x0 + 1}:{x1}, {y0 + 1}:{y1}] of "
+                f"{source.label}"
+            )
+            writer = create_fits(path, header, shape, stored)
+        else:
+            stretch = stretch or Stretch()
+            if limits is None:
+                with tracer.span("export limits", "export"):
+                    limits = compute_limits(reader.sample(), stretch)
+            if fmt == "png":
+                writer = _PngWriter(path, shape[1], shape[0])
+            else:
+                writer = _TiffWriter(path, shape[1], shape[0], step)
+
+        for start in range(y0, y1, step):
+            if cancelled is not None and cancelled():
+                raise ExportCancelled()
+            stop = min(y1, start + step)
+            with tracer.span("export strip", "export", start=start):
+                if fmt == "fits":
+                    writer[start - y0 : stop - y0] = to_storage(
+                        np.asarray(reader.raw(start, stop, x0, x1)), stored
+                    )
+                else:
+                    rows = reader.rows(start, stop, x0, x1)
+                    writer.write(stretch_rows16(rows, stretch, limits))
+            if progress is not None:
+                progress(stop - y0, shape[0])
+
+        if fmt == "fits":
+            writer.flush()
+        else:
+            writer.close()
+        writer = None
+    except BaseException:
+        if writer is not None and fmt != "fits":
+            writer.close()
+        writer = None
+        # The output may not exist yet when reading or setup failed
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        raise
+    finally:
+        reader.close()
+    return shape[0]
+
+
+class ImageExportWorker(QThread):
+    """
+    Runs `export_image` off the UI thread
+    """
+
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    succeeded = pyqtSignal(str)
+
+    def __init__(
+        self,
+        source: ImageSource,
+        path: str,
+        fmt: str,
+        region: Optional[Tuple[int, int, int, int]] = None,
+        stretch: Optional[Stretch] = None,
+        limits: Optional[Tuple[float, float]] = None,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self._source = source
+        self._path = path
+        self._fmt = fmt
+        self._region = region
+        self._stretch = stretch
+        self._limits = limits
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def run(self) -> None:
+        try:
+            with tracer.span("export", "export", rss=True, format=self._fmt):
+                export_image(
+                    self._source,
+                    self._path,
+                    self._fmt,
+                    self._region,
+                    self._stretch,
+                    self._limits,
+                    progress=self.progress.emit,
+                    cancelled=self._cancel.is_set,
+                )
+        except ExportCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(self._path)
@@ -1,15 +1,18 @@
-from enum import Enum
+import contextlib
+import itertools
 import os
-from typing import List
+import shutil
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 from astropy.io import fits
-from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtCore import QPointF, QThreadPool, QTimer, Qt, pyqtSignal
 from PyQt6.QtGui import (
     QAction,
     QGuiApplication,
     QImage,
     QKeySequence,
+    QPainterPath,
     QPixmap,
     QShortcut,
 )
@@ -17,53 +20,50 @@ from PyQt6.QtWidgets import (
     QApplication,
     QComboBox,
     QFileDialog,
+    QHBoxLayout,
     QLabel,
+    QLineEdit,
     QMainWindow,
     QMenu,
     QMessageBox,
+    QProgressDialog,
     QPushButton,
+    QSlider,
+    QSpinBox,
     QStackedWidget,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QTabWidget,
     QToolBar,
     QVBoxLayout,
     QWidget,
-    QDialog
+    QDialog,
+    QDockWidget,
 )
 
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-
 from GraphicsView import GraphicsView
+from hduindex import HDUInfo, HDUType
+from render import RenderJob
+from rendercache import file_key, render_cache
+from stretch import INTERVALS, TRANSFERS, Stretch, StretchEngine
+from profiling import tracer
+from PerfPanel import PerfPanel
+from cube import CubePlayer, CubeStack
+from compressed import CompressedImage, CompressedRenderJob, PixelJob
+from regionstats import RegionStats, RegionStatsJob
+from resources import array_bytes, resource_manager
+from opener import OpenJob, io_pool
+from ThumbnailBrowser import ThumbnailBrowser
+from HeaderPanel import HeaderPanel
+from headerindex import HeaderDocument, HeaderIndexJob
+from livewatch import LiveSession
+from imagemath import OPERATIONS, PAIR_OPERATIONS, ImageMathJob, result_path
+from strips import ImageSource
+from skygrid import VIEW_SAMPLE_SCREEN_PX, SkySamples, SkyWcs, WcsJob
 
 HOME = os.getenv("HOME")
 
-
-class HistogramWidget(QWidget):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-
-        self.canvas = FigureCanvas(Figure())
-        layout = QVBoxLayout()
-        layout.addWidget(self.canvas)
-        self.setLayout(layout)
-
-        self.ax = self.canvas.figure.add_subplot(111)
-
-    def plotHistogram(self, data, bins=256):
-        self.ax.clear()
-        self.ax.hist(data.flatten(), bins=bins, color="gray", edgecolor="black")
-        self.ax.set_title("Pixel Intensity Histogram")
-        self.ax.set_xlabel("Pixel Value")
-        self.ax.set_ylabel("Frequency")
-        self.canvas.draw()
-
-class HDUType(Enum):
-    NONE = (0,)
-    EMPTY = (1,)
-    IMAGE = (2,)
-    TABLE = (3,)
+# Identifies each View's file in the header index
+_document_ids = itertools.count()
 
 
 class TableData:
@@ -77,45 +77,257 @@ class TableData:
 class View(QWidget):
     hduListInsertRequested = pyqtSignal(fits.HDUList)
     HDUTypeChanged = pyqtSignal(HDUType)
+    opened = pyqtSignal()
+    # A new image is on screen (after opening, switching HDU or re-stretching)
+    imageShown = pyqtSignal()
+    loadFailed = pyqtSignal(str)
 
     def __init__(self, filePath: str):
         super().__init__()
 
         self._filePath: str = filePath
+        self.documentId: int = next(_document_ids)
         self._gview: GraphicsView = GraphicsView(self)
-        self._table: QTableWidget = QTableWidget()
+        # Created with the first table HDU, as is the table model machinery
+        self._table: QTableView = None
+        self._table_page: QWidget = None
+        self._table_model = None
+        self._render_job: RenderJob = None
+        self._render_id: int = 0
+        self._render_key: tuple = None
+        self._render_keep_view: bool = False
+        self._stretch: Stretch = Stretch()
+        self._stretch_engine: StretchEngine = None
+        # Display limits of a frame taken from the render cache
+        self._cached_limits: Optional[Tuple[float, float]] = None
+        self._cube: CubePlayer = None
+        self._cube_first_frame: bool = False
+        self._compressed: CompressedImage = None
+        # Decompresses the tile under the cursor when it is not cached yet
+        self._pixel_job: PixelJob = None
+        self._compressed_limits: tuple = None
+        # Region statistics tables of the image shown, built on first use
+        self._region_stats: RegionStats = None
+        self._region_stats_key: tuple = None
+        self._region_job: RegionStatsJob = None
+        self._region: tuple = None
+        self._probe_plane: tuple = None
+        # Celestial WCS of the image shown, built on the pool per HDU, and
+        # the samples over the view the readout and grid come from; the
+        # view is resampled only when its level of detail changes or it
+        # pans off the samples
+        self._sky: SkyWcs = None
+        self._sky_id: int = 0
+        self._sky_job: WcsJob = None
+        self._sky_samples: SkySamples = None
+        self._sky_lod: int = None
+        self._sky_extent: float = 0.0
+        self._sky_path: QPainterPath = None
+        self._sky_lines: list = []
+        # The readout while the cursor moves is interpolated; once it rests
+        # the coordinates are evaluated exactly
+        self._probe_text: str = ""
+        self._probe_point: tuple = None
+        self._sky_rest = QTimer(self)
+        self._sky_rest.setSingleShot(True)
+        self._sky_rest.setInterval(150)
+        self._sky_rest.timeout.connect(self._onCursorRested)
+        self._sky_view_timer = QTimer(self)
+        self._sky_view_timer.setSingleShot(True)
+        self._sky_view_timer.setInterval(50)
+        self._sky_view_timer.timeout.connect(self._refreshSky)
+        self._hdul: fits.HDUList = None
+        self._hdu_index: List[HDUInfo] = []
+        self._num_hdus = 0
+        self._current_hdu_index: int = 0
+        # Set while the file is closed by the resource manager or replaced by
+        # a new frame: the HDU to show once the file is open again, and
+        # whether to keep the zoom and pan
+        self._restore_hdu: int = None
+        self._restore_view: bool = False
+        # Errors are reported through loadFailed only, without dialogs
+        self.quiet: bool = False
         self._empty_widget = QWidget()
+        self._placeholder = QLabel(f"Opening {os.path.basename(filePath)}...")
+        self._placeholder.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self._toolbar = QToolBar()
         layout = QVBoxLayout()
         self._stackWidget = QStackedWidget()
 
-        self._table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-
         self.setLayout(layout)
         layout.addWidget(self._toolbar)
         layout.addWidget(self._stackWidget)
-
-        try:
-            self._hdul: fits.HDUList = fits.open(self._filePath)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to open FITS file: \n{str(e)}")
-            return
-
-        self._num_hdus = len(self._hdul)
-        self._current_hdu_index: int = 0
-
-        if len(self._hdul) != 0:
-            self.hduListInsertRequested.emit(self._hdul)
+        self._probe_label = QLabel()
+        layout.addWidget(self._probe_label)
 
         self.setContentsMargins(0, 0, 0, 0)
+        self._stackWidget.addWidget(self._placeholder)
         self._stackWidget.addWidget(self._empty_widget)
         self._stackWidget.addWidget(self._gview)
-        self._stackWidget.addWidget(self._table)
+        self._gview.cursorMoved.connect(self._onCursorMoved)
+        self._gview.regionChanged.connect(self._onRegionChanged)
+        self._gview.viewChanged.connect(self._sky_view_timer.start)
         self._initToolbar()
-        self._populateHDUListCombo()
+
+        # The file is opened and its headers scanned on the thread pool; the
+        # placeholder is shown until that reports back
+        self._startOpen()
 
         self.show()
 
+    def _startOpen(self) -> None:
+        self._open_job = OpenJob(self._filePath)
+        self._open_job.signals.opened.connect(self._onOpened)
+        self._open_job.signals.failed.connect(self._onOpenFailed)
+        io_pool().start(self._open_job)
+
+    def _onOpened(self, hdul: fits.HDUList, hdu_index: List[HDUInfo]) -> None:
+        self._open_job = None
+        # A file replaced by a new frame stays open until now, as its image
+        # is still on screen and probed
+        previous = self._hdul
+        self._hdul = hdul
+        self._hdu_index = hdu_index
+        self._num_hdus = len(hdu_index)
+
+        if self._num_hdus != 0:
+            self.hduListInsertRequested.emit(self._hdul)
+
+        if self._restore_hdu is not None:
+            # Reopened after a release: back to the HDU that was shown
+            index = min(self._restore_hdu, self._num_hdus - 1)
+            self._restore_hdu = None
+            self._current_hdu_index = -1
+            self._hdulist_combo.blockSignals(True)
+            self._hdulist_combo.clear()
+            self._populateHDUListCombo()
+            self._hdulist_combo.setCurrentIndex(index)
+            self._hdulist_combo.blockSignals(False)
+            self.loadHDU(index, self._restore_view)
+        else:
+            self.loadHDU(1)
+            self._populateHDUListCombo()
+        if previous is not None and previous is not hdul:
+            previous.close()
+        self.opened.emit()
+
+    def residentBytes(self) -> int:
+        """
+        Bytes of data held by this tab: loaded (or memory mapped) HDU data,
+        decompressed tiles, stretch indexes, table query columns and region
+        statistics tables
+        """
+        if self._hdul is None:
+            return 0
+        arrays = [hdu.__dict__.get("data") for hdu in self._hdul]
+        if self._stretch_engine is not None:
+            arrays += [self._stretch_engine.data, self._stretch_engine.index]
+        if self._table_model is not None:
+            arrays += self._table_model.query.arrays()
+        if self._probe_plane is not None:
+            arrays.append(self._probe_plane[1])
+        held = array_bytes(arrays)
+        if self._compressed is not None:
+            held += self._compressed.nbytes
+        if self._region_stats is not None:
+            held += self._region_stats.nbytes
+        return held
+
+    def release(self) -> None:
+        """
+        Close the file and drop everything read from it, keeping the HDU
+        shown so `reopen` can restore it
+        """
+        if self._hdul is None:
+            return
+        released_hdu = self._current_hdu_index
+        self._cancelRender()
+        self._closeCube()
+        self._clearRegion()
+        self._resetSky()
+        self._stretch_engine = None
+        self._cached_limits = None
+        self._compressed = None
+        self._compressed_limits = None
+        if self._table_model is not None:
+            self._table.setModel(None)
+            self._table_model.deleteLater()
+            self._table_model = None
+        self._gview.clearImage()
+        self._hdul.close()
+        self._hdul = None
+        self._restore_hdu = released_hdu
+        self._restore_view = False
+        self._placeholder.setText(f"Reopening {os.path.basename(self._filePath)}...")
+        self._stackWidget.setCurrentWidget(self._placeholder)
+
+    def reopen(self) -> None:
+        """
+        Open the file again after `release`
+        """
+        if self._restore_hdu is not None and self._open_job is None:
+            self._startOpen()
+
+    def replaceFile(self, filePath: str) -> None:
+        """
+        Show `filePath` in place of the current file, at the same HDU with
+        the same stretch, zoom and pan. The current image stays up, and its
+        file open for the cursor readout and re-stretching, until the new
+        one is ready.
+        """
+        hdu = self._restore_hdu if self._hdul is None else self._current_hdu_index
+        self._cancelRender()
+        self._filePath = filePath
+        self._restore_hdu = max(0, hdu or 0)
+        self._restore_view = True
+        self._startOpen()
+
+    def closeFile(self) -> None:
+        """
+        Close the file for good, when the tab is closed
+        """
+        self._restore_hdu = None
+        self._cancelRender()
+        self._closeCube()
+        if self._hdul is not None:
+            self._hdul.close()
+            self._hdul = None
+
+    def _onOpenFailed(self, error: str) -> None:
+        self._open_job = None
+        self._placeholder.setText(f"Failed to open {self._filePath}")
+        self.loadFailed.emit(error)
+        if not self.quiet:
+            QMessageBox.critical(self, "Error", f"Failed to open FITS file: \n{error}")
+
+    @property
+    def isOpen(self) -> bool:
+        return self._hdul is not None
+
+    @property
+    def filePath(self) -> str:
+        return self._filePath
+
+    def imageSources(self, label: str) -> List[ImageSource]:
+        """
+        The image HDUs of the file as image arithmetic inputs. A cube
+        contributes the plane on screen, or its first plane when not shown.
+        """
+        sources = []
+        for info in self._hdu_index:
+            if info.type != HDUType.IMAGE:
+                continue
+            name = f"{label} [{info.label}]"
+            plane = 0
+            if info.isCube:
+                if info.index == self._current_hdu_index and self._cube is not None:
+                    plane = self._cube.current
+                name += f" plane {plane + 1}"
+            sources.append(
+                ImageSource(self._filePath, info.index, info.shape, plane, name)
+            )
+        return sources
+
     def _initToolbar(self):
         self._hdulist_combo = QComboBox()
         self._hdulist_combo.currentIndexChanged.connect(
@@ -125,48 +337,123 @@ class View(QWidget):
         self._toolbar.addWidget(QLabel("HDU"))
         self._toolbar.addWidget(self._hdulist_combo)
 
-        self.loadHDU(1)
+        self._interval_combo = QComboBox()
+        self._interval_combo.addItems(INTERVALS)
+        self._transfer_combo = QComboBox()
+        self._transfer_combo.addItems(TRANSFERS)
+        self._interval_combo.currentTextChanged.connect(self._onStretchChanged)
+        self._transfer_combo.currentTextChanged.connect(self._onStretchChanged)
+
+        self._toolbar.addSeparator()
+        self._toolbar.addWidget(QLabel("Stretch"))
+        self._toolbar.addWidget(self._interval_combo)
+        self._toolbar.addWidget(self._transfer_combo)
+
+        # Cube navigation, shown only for NAXIS 3/4 image HDUs
+        self._plane_slider = QSlider(Qt.Orientation.Horizontal)
+        self._plane_slider.setMinimumWidth(150)
+        self._plane_label = QLabel()
+        self._play_button = QPushButton("Play")
+        self._play_button.setCheckable(True)
+        self._fps_spin = QSpinBox()
+        self._fps_spin.setRange(1, 60)
+        self._fps_spin.setValue(10)
+        self._fps_spin.setSuffix(" fps")
+
+        self._plane_slider.valueChanged.connect(self._onPlaneSliderChanged)
+        self._play_button.toggled.connect(self._onPlayToggled)
+        self._fps_spin.valueChanged.connect(self._onFpsChanged)
+
+        self._cube_actions = [self._toolbar.addSeparator()]
+        for widget in (
+            QLabel("Plane"),
+            self._plane_slider,
+            self._plane_label,
+            self._play_button,
+            self._fps_spin,
+        ):
+            self._cube_actions.append(self._toolbar.addWidget(widget))
+        self._showCubeControls(False)
+
+        self._toolbar.addSeparator()
+        self._region_action = self._toolbar.addAction("Region Stats")
+        self._region_action.setCheckable(True)
+        self._region_action.setToolTip("Drag a rectangle to measure the data under it")
+        self._region_action.toggled.connect(self._onRegionToggled)
+        self._grid_action = self._toolbar.addAction("WCS Grid")
+        self._grid_action.setCheckable(True)
+        self._grid_action.setEnabled(False)
+        self._grid_action.setToolTip("Draw a grid of sky coordinates from the WCS")
+        self._grid_action.toggled.connect(self._onGridToggled)
+
+    def getPixmap(self) -> Optional[QPixmap]:
+        """
+        Returns currently loaded pixmap (if any). None for compressed images
+        decompressed tile by tile; see `requestPixmap`.
+        """
+        return self._gview.pixmap()
 
-    def getPixmap(self) -> QPixmap:
+    def requestPixmap(self, callback: Callable[[Optional[QPixmap]], None]) -> None:
         """
-        Returns currently loaded pixmap (if any)
+        Call `callback` with the loaded pixmap, assembled on the thread pool
+        for compressed images decompressed tile by tile
         """
-        return self._gview.pix_item.pixmap()
+        self._gview.requestPixmap(callback)
 
     def getImageData(self) -> np.ndarray:
         hdu = self._hdul[self._current_hdu_index]
         return np.nan_to_num(hdu.data)
 
+    def getRawImageData(self) -> np.ndarray:
+        """
+        Returns the current HDU data as stored, without copying it. For a
+        cube this is the current plane.
+        """
+        if self._cube is not None:
+            return self._cube.stack.plane(self._cube.current)
+        return self._hdul[self._current_hdu_index].data
+
+    def dataKey(self) -> tuple:
+        """
+        Key identifying the data shown as it is on disk: the current HDU of
+        the file, and for a cube the current plane
+        """
+        plane = self._cube.current if self._cube is not None else None
+        return (*file_key(self._filePath), self._current_hdu_index, plane)
+
     def getTable(self) -> np.ndarray:
         """
         Returns currently loaded table (if any)
         """
         return TableData(self._hdul[self._current_hdu_index].data)
 
+    def tableModel(self):
+        """
+        Returns the model of the table shown (if any)
+        """
+        return self._table_model
+
     def currentHDUType(self) -> HDUType:
         """
         Get the HDU type for the current HDU index
         """
-        hdu = self._hdul[self._current_hdu_index]
-        if hdu.data is None:
+        if self._current_hdu_index >= self._num_hdus:
             return HDUType.EMPTY
-        if isinstance(hdu, (fits.TableHDU, fits.BinTableHDU)):
-            return HDUType.TABLE
-        if getattr(hdu.data, "ndim", 0) == 2:
-            return HDUType.IMAGE
-        return HDUType.EMPTY
+        return self._hdu_index[self._current_hdu_index].type
 
     def _onHDUCombolistIndexChanged(self, index: int) -> None:
         self.loadHDU(index)
 
     def _populateHDUListCombo(self) -> None:
-        for i, hdu in enumerate(self._hdul):
-            # print(f"HDU {i}:")
-            # print(f"  Type: {type(hdu).__name__}")
-            # print(f"  Name: {hdu.name}")
-            # print(f"  Shape: {getattr(hdu.data, 'shape', None)}")
-            # print(f"  Data type: {getattr(hdu.data, 'dtype', None)}")
-            self._hdulist_combo.addItem(hdu.name)
+        for info in self._hdu_index:
+            self._hdulist_combo.addItem(info.label)
+
+    def showHDU(self, index: int) -> None:
+        """
+        Select HDU `index` as if picked from the HDU list
+        """
+        if 0 <= index < self._num_hdus:
+            self._hdulist_combo.setCurrentIndex(index)
 
     @property
     def currentHDUIndex(self) -> int:
@@ -176,79 +463,584 @@ class View(QWidget):
     def hdul(self) -> fits.HDUList:
         return self._hdul
 
-    def loadHDU(self, index: int) -> None:
+    @property
+    def hduIndex(self) -> List[HDUInfo]:
+        return self._hdu_index
+
+    def loadHDU(self, index: int, keepView: bool = False) -> None:
         if index == self._current_hdu_index:
             return
 
         self._current_hdu_index = index
+        self._cancelRender()
+        self._stretch_engine = None
+        self._cached_limits = None
+        self._compressed = None
+        self._compressed_limits = None
+        self._closeCube()
+        self._clearRegion()
+        self._resetSky()
 
         if self._num_hdus == 0:
             self._stackWidget.setCurrentWidget(self._empty_widget)
             self.HDUTypeChanged.emit(HDUType.EMPTY)
             return
 
-        hdu = self._hdul[index]
-        data = hdu.data
+        if index >= self._num_hdus:
+            return
 
-        if data is None:
-            self._stackWidget.setCurrentWidget(self._empty_widget)
+        info = self._hdu_index[index]
+
+        match info.type:
+            case HDUType.TABLE:
+                self._loadTable(self._hdul[index].data)
+            case HDUType.IMAGE if info.isCube:
+                self._loadCube(self._hdul[index], info, keepView)
+            case HDUType.IMAGE:
+                self._loadPixmap(self._hdul[index], keepView)
+            case _ if info.hasData:
+                QMessageBox.warning(self, "Unsupported HDU", "Cannot display this HDU.")
+            case _:
+                self._stackWidget.setCurrentWidget(self._empty_widget)
+                self.HDUTypeChanged.emit(HDUType.EMPTY)
+
+        if info.type == HDUType.IMAGE:
+            self._startSky(index, info)
+
+    def _tableView(self) -> QTableView:
+        if self._table is None:
+            self._table = QTableView()
+            self._table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+            # Start unsorted; clicking a header sorts through the model
+            self._table.horizontalHeader().setSortIndicator(
+                -1, Qt.SortOrder.AscendingOrder
+            )
+            self._table.setSortingEnabled(True)
+
+            self._table_filter = QLineEdit()
+            self._table_filter.setPlaceholderText("Filter, e.g. MAG < 18 & FLAG == 0")
+            self._table_filter.setClearButtonEnabled(True)
+            self._table_filter.returnPressed.connect(self._applyTableFilter)
+            self._table_status = QLabel()
+
+            filter_bar = QHBoxLayout()
+            filter_bar.addWidget(self._table_filter)
+            filter_bar.addWidget(self._table_status)
+            layout = QVBoxLayout()
+            layout.setContentsMargins(0, 0, 0, 0)
+            layout.addLayout(filter_bar)
+            layout.addWidget(self._table)
+            self._table_page = QWidget()
+            self._table_page.setLayout(layout)
+            self._stackWidget.addWidget(self._table_page)
+        return self._table
+
+    def _applyTableFilter(self) -> None:
+        from tablequery import QueryError
+
+        if self._table_model is None:
+            return
+        try:
+            self._table_model.setFilter(self._table_filter.text())
+        except QueryError as e:
+            self._table_status.setText(str(e))
             return
+        self._updateTableStatus()
 
-        if isinstance(hdu, (fits.TableHDU, fits.BinTableHDU)):
-            self._loadTable(data)
-        elif getattr(data, "ndim", 0) == 2:
-            self._loadPixmap(data)
-        else:
-            QMessageBox.warning(self, "Unsupported HDU", "Cannot display this HDU.")
+    def _updateTableStatus(self) -> None:
+        model = self._table_model
+        self._table_status.setText(f"{model.shownRows:,} of {model.totalRows:,} rows")
 
     def _loadTable(self, data: fits.TableHDU) -> None:
-        col_names = data.names
-        n_rows = len(data)
-        n_cols = len(col_names)
+        from TableModel import FitsTableModel
+
+        # Cells are formatted lazily by the model as they scroll into view
+        old_model = self._table_model
+        with tracer.span("table model", "table", rss=True, rows=len(data)):
+            self._table_model = FitsTableModel(data, self)
+            self._tableView().setModel(self._table_model)
+        if old_model is not None:
+            old_model.deleteLater()
+        self._table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self._table_model.modelReset.connect(self._updateTableStatus)
+        self._table_filter.clear()
+        self._updateTableStatus()
+
+        self._stackWidget.setCurrentWidget(self._table_page)
+        self.HDUTypeChanged.emit(HDUType.TABLE)
 
-        self._table.setColumnCount(n_cols)
-        self._table.setRowCount(n_rows)
-        self._table.setHorizontalHeaderLabels(col_names)
+    def _cancelRender(self) -> None:
+        # Bumping the id also drops results already queued for delivery
+        self._render_id += 1
+        if self._render_job is not None:
+            self._render_job.cancel()
+            self._render_job = None
 
-        self._stackWidget.setCurrentWidget(self._table)
-        self.HDUTypeChanged.emit(HDUType.TABLE)
+    def _loadPixmap(self, hdu: fits.FitsHDU, keepView: bool = False) -> None:
+        """
+        Show `hdu` from the render cache, or start decoding it on the thread
+        pool. The image is shown when the job reports back; a job superseded
+        by a later load is cancelled and its results are ignored.
+        """
+        self._cancelRender()
+        self._stackWidget.setCurrentWidget(self._gview)
+        self.HDUTypeChanged.emit(HDUType.IMAGE)
 
-        # Fill table
-
-        for row in range(n_rows):
-            for col in range(n_cols):
-                value = data[row][col]
-                # Convert bytes to string if needed
-                if isinstance(value, bytes):
-                    value = value.decode(errors="ignore")
-                self._table.setItem(row, col, QTableWidgetItem(str(value)))
-
-    def _loadPixmap(self, data: fits.FitsHDU) -> None:
-        # Step 2: Normalize to 0-255
-        data = np.nan_to_num(data)  # Replace NaNs and infs with 0
-        data_min = np.min(data)
-        data_max = np.max(data)
-        if data_max == data_min:
-            norm_data = np.zeros_like(data, dtype=np.uint8)
-        else:
-            norm_data = 255 * (data - data_min) / (data_max - data_min)
-            norm_data = norm_data.astype(np.uint8)
-
-        # Step 3: Convert to QImage (grayscale format)
-        height, width = norm_data.shape
-        bytes_per_line = width
-        qimg = QImage(
-            norm_data.data,
-            width,
-            height,
-            bytes_per_line,
-            QImage.Format.Format_Grayscale8,
+        self._render_keep_view = keepView
+        if isinstance(hdu, fits.CompImageHDU):
+            self._loadCompressed(hdu, keepView)
+            return
+
+        self._render_key = render_cache.key(
+            self._filePath, self._current_hdu_index, self._stretch.key
         )
+        cached = render_cache.get(self._render_key)
+        self._cached_limits = cached.limits if cached is not None else None
+        if cached is not None:
+            with tracer.span("setPixmap", "render", cached=True):
+                self._gview.setImageData(cached.frame, cached.pixmap, keepView)
+            self.imageShown.emit()
+            return
+
+        shape = self._hdu_index[self._current_hdu_index].shape
+
+        job = RenderJob(
+            self._render_id,
+            hdu,
+            self._stretch,
+            not self._gview.wantsTiles(shape),
+            self._stretch_engine,
+        )
+        job.signals.preview.connect(self._onRenderPreview)
+        job.signals.finished.connect(self._onRenderFinished)
+        job.signals.failed.connect(self._onRenderFailed)
+        self._render_job = job
+        # Without an engine the job reads the data first
+        if self._stretch_engine is None:
+            io_pool().start(job)
+        else:
+            QThreadPool.globalInstance().start(job)
+
+    def _loadCompressed(self, hdu: fits.CompImageHDU, keepView: bool) -> None:
+        """
+        Show a tile-compressed image without decompressing all of it. A pool
+        job decompresses a strided preview to fix the stretch; after that
+        display tiles are decompressed as they come into view, and the
+        decompressed tiles are kept for re-stretching and panning.
+        """
+        if self._compressed is None:
+            shape = self._hdu_index[self._current_hdu_index].shape
+            self._compressed = CompressedImage(hdu, shape)
+
+        job = CompressedRenderJob(self._render_id, self._compressed, self._stretch)
+        job.signals.finished.connect(self._onCompressedFinished)
+        job.signals.failed.connect(self._onRenderFailed)
+        self._render_job = job
+        io_pool().start(job)
+
+    def _onCompressedFinished(self, job_id: int, source) -> None:
+        if job_id != self._render_id:
+            return
+        self._render_job = None
+        self._compressed_limits = source.limits
+        with tracer.span("setTileSource", "render", shape=str(source.shape)):
+            self._gview.setTileSource(source, self._render_keep_view)
+        self.imageShown.emit()
+
+    def _onRenderPreview(self, job_id: int, image: QImage, stride: int) -> None:
+        if job_id != self._render_id:
+            return
+        # A preview would reset the view; when keeping it, the previous
+        # image stays up until the full frame is ready
+        if not self._render_keep_view:
+            self._gview.setPreview(image, stride)
+
+    def _onRenderFinished(self, job_id: int, frame: np.ndarray, image: QImage) -> None:
+        if job_id != self._render_id:
+            return
+        self._stretch_engine = self._render_job.engine
+        self._render_job = None
+        with tracer.span("pixmap upload", "render"):
+            pixmap = None if image.isNull() else QPixmap.fromImage(image)
+        limits = self._stretch_engine.limits(self._stretch)
+        render_cache.put(self._render_key, frame, pixmap, limits)
+        with tracer.span("setPixmap", "render", shape=str(frame.shape)):
+            self._gview.setImageData(frame, pixmap, self._render_keep_view)
+        tracer.counter("render cache", **render_cache.stats())
+        self.imageShown.emit()
+
+    def _onRenderFailed(self, job_id: int, error: str) -> None:
+        if job_id != self._render_id:
+            return
+        self._render_job = None
+        self._onRenderFailedMessage(error)
+
+    def _onRenderFailedMessage(self, error: str) -> None:
+        self.loadFailed.emit(error)
+        if not self.quiet:
+            QMessageBox.critical(self, "Error", f"Failed to load HDU: \n{error}")
+
+    def _showCubeControls(self, state: bool) -> None:
+        for action in self._cube_actions:
+            action.setVisible(state)
+
+    def _loadCube(
+        self, hdu: fits.ImageHDU, info: HDUInfo, keepView: bool = False
+    ) -> None:
+        """
+        Show a data cube one plane at a time. Planes are read lazily and
+        prefetched by a CubePlayer using one stretch for the whole cube.
+        """
+        self._cube = CubePlayer(CubeStack(hdu, info.shape), self._stretch, parent=self)
+        self._cube.planeReady.connect(self._onPlaneReady)
+        self._cube.failed.connect(self._onRenderFailedMessage)
+        self._cube_first_frame = not keepView
+
+        self._plane_slider.blockSignals(True)
+        self._plane_slider.setRange(0, self._cube.count - 1)
+        self._plane_slider.setValue(0)
+        self._plane_slider.blockSignals(False)
+        self._plane_label.setText(f"1/{self._cube.count}")
+        self._showCubeControls(True)
 
-        pix = QPixmap.fromImage(qimg)
-        self._gview.setPixmap(pix)
         self._stackWidget.setCurrentWidget(self._gview)
         self.HDUTypeChanged.emit(HDUType.IMAGE)
+        self._cube.showPlane(0)
+
+    def _closeCube(self) -> None:
+        if self._cube is None:
+            return
+        self._cube.stop()
+        self._cube.planeReady.disconnect(self._onPlaneReady)
+        self._cube.failed.disconnect(self._onRenderFailedMessage)
+        self._cube.deleteLater()
+        self._cube = None
+        self._play_button.setChecked(False)
+        self._showCubeControls(False)
+
+    def _onPlaneReady(self, plane: int, frame: np.ndarray, image: QImage) -> None:
+        if self.sender() is not self._cube:
+            return  # queued by a player closed since
+        keep_view = not self._cube_first_frame
+        self._cube_first_frame = False
+        self._gview.setImageData(frame, QPixmap.fromImage(image), keep_view)
+        self.imageShown.emit()
+
+        self._plane_label.setText(f"{plane + 1}/{self._cube.count}")
+        # Region statistics follow the plane, but not while playing
+        if self._region is not None and not self._cube.isPlaying():
+            self._onRegionChanged(*self._region)
+        self._plane_slider.blockSignals(True)
+        self._plane_slider.setValue(plane)
+        self._plane_slider.blockSignals(False)
+
+    def _regionKey(self) -> tuple:
+        plane = self._cube.current if self._cube is not None else None
+        return (self._current_hdu_index, plane)
+
+    def _clearRegion(self) -> None:
+        self._region = None
+        self._region_stats = None
+        self._region_stats_key = None
+        self._probe_plane = None
+        self._gview.clearRegion()
+        self._probe_label.clear()
+
+    def _rawValue(self, x: int, y: int) -> Optional[float]:
+        """
+        Data value of pixel (x, y) of the image shown, or None while the
+        compressed tile holding it is decompressed on the pool
+        """
+        if self._region_stats_key == self._regionKey():
+            return self._region_stats.value(x, y)
+        if self._compressed is not None:
+            value = self._compressed.cachedValue(y, x)
+            if value is None and self._pixel_job is None:
+                self._pixel_job = PixelJob(self._compressed, x, y)
+                self._pixel_job.signals.ready.connect(self._onPixelReady)
+                self._pixel_job.signals.failed.connect(self._onPixelReady)
+                QThreadPool.globalInstance().start(self._pixel_job)
+            return value
+        if self._cube is not None:
+            # Planes are read whole, so the one under the cursor is kept
+            key = self._regionKey()
+            if self._probe_plane is None or self._probe_plane[0] != key:
+                self._probe_plane = (key, self.getRawImageData())
+            return float(self._probe_plane[1][y, x])
+        return float(self._hdul[self._current_hdu_index].data[y, x])
+
+    def _onCursorMoved(self, x: int, y: int) -> None:
+        if self._region is not None:
+            return
+        if x < 0 or self.currentHDUType() != HDUType.IMAGE:
+            self._probe_point = None
+            self._sky_rest.stop()
+            self._probe_label.clear()
+            return
+        # FITS pixel numbers start at 1
+        value = self._rawValue(x, y)
+        value = "..." if value is None else f"{value:.6g}"
+        self._probe_text = f"x {x + 1}, y {y + 1}: {value}"
+        self._probe_point = (x, y)
+        self._probe_label.setText(self._probe_text + self._skyText(x, y, False))
+        if self._sky is not None:
+            self._sky_rest.start()
+
+    def _onPixelReady(self, x: int, y: int, *_) -> None:
+        # The tile is cached now; the readout is refreshed for wherever the
+        # cursor has moved meanwhile, which may start the next job
+        self._pixel_job = None
+        if self._probe_point is not None and self._compressed is not None:
+            self._onCursorMoved(*self._probe_point)
+
+    def _onCursorRested(self) -> None:
+        if self._probe_point is None or self._region is not None:
+            return
+        self._probe_label.setText(
+            self._probe_text + self._skyText(*self._probe_point, True)
+        )
+
+    def _skyText(self, x: int, y: int, exact: bool) -> str:
+        """
+        Sky coordinates of pixel (x, y) for the readout, interpolated from
+        the samples unless `exact` or the samples cannot be interpolated
+        """
+        if self._sky is None:
+            return ""
+        world = None
+        if not exact:
+            for samples in (self._sky_samples, self._sky.base):
+                if samples is not None:
+                    world = samples.interpolate(x, y)
+                    if world is not None:
+                        break
+        if world is None:
+            world = self._sky.exact(x, y)
+        return "    " + self._sky.format(*world)
+
+    def _startSky(self, index: int, info: HDUInfo) -> None:
+        header = self._hdul[index].header
+        self._sky_job = WcsJob(self._sky_id, header, info.shape[-2:])
+        self._sky_job.signals.ready.connect(self._onSkyReady)
+        self._sky_job.signals.failed.connect(self._onSkyFailed)
+        QThreadPool.globalInstance().start(self._sky_job)
+
+    def _onSkyReady(self, job_id: int, sky: SkyWcs) -> None:
+        # Results for an HDU no longer shown are dropped
+        if self._sky_job is not None and self._sky_job.job_id == job_id:
+            self._sky_job = None
+        if job_id != self._sky_id:
+            return
+        self._sky = sky
+        self._grid_action.setEnabled(True)
+        self._refreshSky()
+
+    def _onSkyFailed(self, job_id: int, error: str) -> None:
+        # Images without a celestial WCS end here; they just have no readout
+        if self._sky_job is not None and self._sky_job.job_id == job_id:
+            self._sky_job = None
+
+    def _resetSky(self) -> None:
+        self._sky_id += 1
+        # A job not started yet is taken back; one running reports to the
+        # bumped id and is dropped
+        if self._sky_job is not None and QThreadPool.globalInstance().tryTake(
+            self._sky_job
+        ):
+            self._sky_job = None
+        self._sky = None
+        self._sky_samples = None
+        self._sky_lod = None
+        self._sky_path = None
+        self._sky_lines = []
+        self._probe_point = None
+        self._sky_rest.stop()
+        self._grid_action.setEnabled(False)
+        self._gview.clearOverlay()
+
+    def _onGridToggled(self, state: bool) -> None:
+        self._refreshSky()
+
+    def _refreshSky(self) -> None:
+        """
+        Resample the view when its level of detail changed or it moved off
+        the samples, and redraw the grid
+        """
+        if self._sky is None:
+            return
+        rect = self._gview.visibleImageRect()
+        if rect.isEmpty():
+            return
+        height, width = self._sky.shape
+        x0, y0 = rect.left(), rect.top()
+        x1, y1 = min(rect.right(), width - 1), min(rect.bottom(), height - 1)
+        lod = self._gview.levelOfDetail()
+        samples = self._sky_samples
+        if (
+            samples is None
+            or lod != self._sky_lod
+            or not samples.covers(x0, y0, x1, y1)
+        ):
+            # Half a view of margin on each side, so panning stays on the
+            # samples for a while
+            margin_x, margin_y = rect.width() / 2, rect.height() / 2
+            self._sky_samples = self._sky.sample(
+                max(0.0, x0 - margin_x),
+                max(0.0, y0 - margin_y),
+                min(width - 1.0, x1 + margin_x),
+                min(height - 1.0, y1 + margin_y),
+                VIEW_SAMPLE_SCREEN_PX * 2.0**lod,
+            )
+            self._sky_lod = lod
+            self._sky_extent = min(rect.width(), rect.height()) * self._sky.pixelScale
+            self._sky_path = None
+        if not self._grid_action.isChecked():
+            self._gview.clearOverlay()
+            return
+        if self._sky_path is None:
+            self._sky_lines = self._sky.gridLines(self._sky_samples, self._sky_extent)
+            self._sky_path = QPainterPath()
+            for _, _, segments in self._sky_lines:
+                # Segment ends are pixel indices; pixel i is drawn from i to
+                # i + 1
+                for (ax, ay), (bx, by) in (segments + 0.5).tolist():
+                    self._sky_path.moveTo(ax, ay)
+                    self._sky_path.lineTo(bx, by)
+        self._gview.setOverlay(self._sky_path, self._skyLabels(rect))
+
+    def _skyLabels(self, rect) -> list:
+        """
+        A label for each grid line on screen: longitudes along the bottom
+        of the view, latitudes along its left side
+        """
+        labels = []
+        for longitude, level, segments in self._sky_lines:
+            points = segments.reshape(-1, 2) + 0.5
+            inside = (
+                (points[:, 0] >= rect.left())
+                & (points[:, 0] <= rect.right())
+                & (points[:, 1] >= rect.top())
+                & (points[:, 1] <= rect.bottom())
+            )
+            points = points[inside]
+            if not len(points):
+                continue
+            x, y = points[points[:, 1].argmax() if longitude else points[:, 0].argmin()]
+            labels.append((QPointF(x, y), self._sky.label(longitude, level)))
+        return labels
+
+    def _onRegionToggled(self, state: bool) -> None:
+        self._gview.setRegionMode(state)
+        if not state:
+            self._region = None
+            self._probe_label.clear()
+
+    def _onRegionChanged(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        self._region = (x0, y0, x1, y1)
+        key = self._regionKey()
+        if self._region_stats_key == key:
+            self._showRegionStats()
+            return
+
+        self._probe_label.setText("Indexing region statistics...")
+        if self._region_job is not None and self._region_job.key == key:
+            return
+        # The data is read (or decompressed) on the pool thread
+        if self._cube is not None:
+            stack, plane = self._cube.stack, self._cube.current
+            load = lambda: stack.plane(plane)  # noqa: E731
+        else:
+            hdu = self._hdul[self._current_hdu_index]
+            load = lambda: hdu.data  # noqa: E731
+        self._region_job = RegionStatsJob(key, load)
+        self._region_job.signals.ready.connect(self._onRegionStatsReady)
+        self._region_job.signals.failed.connect(self._onRegionStatsFailed)
+        QThreadPool.globalInstance().start(self._region_job)
+
+    def _onRegionStatsReady(self, key: tuple, stats: RegionStats) -> None:
+        if self._region_job is not None and self._region_job.key == key:
+            self._region_job = None
+        if key != self._regionKey():
+            return
+        self._region_stats = stats
+        self._region_stats_key = key
+        self._probe_plane = None
+        if self._region is not None:
+            self._showRegionStats()
+
+    def _onRegionStatsFailed(self, key: tuple, error: str) -> None:
+        if self._region_job is not None and self._region_job.key == key:
+            self._region_job = None
+        self._probe_label.setText(f"Region statistics failed: {error}")
+
+    def _showRegionStats(self) -> None:
+        x0, y0, x1, y1 = self._region
+        summary = self._region_stats.region(x0, y0, x1, y1)
+        if summary is None:
+            self._probe_label.clear()
+            return
+        self._probe_label.setText(f"{x1 - x0} x {y1 - y0} px: {summary}")
+
+    def _onPlaneSliderChanged(self, plane: int) -> None:
+        if self._cube is not None:
+            self._cube.showPlane(plane)
+
+    def _onPlayToggled(self, state: bool) -> None:
+        self._play_button.setText("Pause" if state else "Play")
+        if self._cube is None:
+            return
+        if state:
+            self._cube.play(self._fps_spin.value())
+        else:
+            self._cube.stop()
+            if self._region is not None:
+                self._onRegionChanged(*self._region)
+
+    def _onFpsChanged(self, fps: int) -> None:
+        if self._cube is not None and self._cube.isPlaying():
+            self._cube.play(fps)
+
+    def _onStretchChanged(self) -> None:
+        self._stretch = Stretch(
+            self._interval_combo.currentText(), self._transfer_combo.currentText()
+        )
+        if self._cube is not None:
+            self._cube.setStretch(self._stretch)
+        elif self.currentHDUType() == HDUType.IMAGE:
+            self._loadPixmap(self._hdul[self._current_hdu_index], keepView=True)
+
+    @property
+    def stretch(self) -> Stretch:
+        return self._stretch
+
+    @property
+    def region(self) -> tuple:
+        """
+        The region selected for statistics as (x0, y0, x1, y1), if any
+        """
+        return self._region
+
+    def imageSource(self) -> ImageSource:
+        """
+        The image shown, as a source for exports: the current HDU, or the
+        current plane of a cube
+        """
+        info = self._hdu_index[self._current_hdu_index]
+        plane = self._cube.current if self._cube is not None else 0
+        return ImageSource(self._filePath, info.index, info.shape, plane)
+
+    def displayLimits(self) -> tuple:
+        """
+        The data limits of the stretch on screen, or None when they have
+        not been computed
+        """
+        if self._cube is not None:
+            return self._cube.stack.limits(self._stretch)
+        if self._compressed_limits is not None:
+            return self._compressed_limits
+        if self._stretch_engine is not None:
+            return self._stretch_engine.limits(self._stretch)
+        return self._cached_limits
 
     def zoomIn(self) -> None:
         if self._gview:
@@ -272,6 +1064,8 @@ class View(QWidget):
 
 
 class MainWindow(QMainWindow):
+    RESOURCE_CHECK_MS = 1000
+
     def __init__(self, files: List[str]):
         super().__init__()
 
@@ -303,6 +1097,21 @@ class MainWindow(QMainWindow):
         self.show()
 
         self._currentView: View = None
+        self._documents: Dict[int, View] = {}
+        self._live_sessions: Dict[int, LiveSession] = {}
+        # Image arithmetic results: document id -> temporary file
+        self._results: Dict[int, str] = {}
+        self._math_id = 0
+        self._math_job: ImageMathJob = None
+
+        # Resource usage in the status bar, checked against the limits on
+        # a timer as tabs load data
+        self._usageLabel = QLabel()
+        self.statusBar().addPermanentWidget(self._usageLabel)
+        self._usageTimer = QTimer(self)
+        self._usageTimer.setInterval(self.RESOURCE_CHECK_MS)
+        self._usageTimer.timeout.connect(self._enforceResources)
+        self._usageTimer.start()
 
         if len(files) != 0:
             self._openFiles(files)
@@ -347,18 +1156,31 @@ class MainWindow(QMainWindow):
 
         # File Menu
         self._openFileAction = QAction("Open")
+        self._browseAction = QAction("Browse Directory...")
+        self._watchAction = QAction("Watch Directory...")
+        self._saveFitsAction = QAction("Save As FITS...")
         self._exitAction = QAction("Exit")
         self._exitAction.triggered.connect(lambda: QGuiApplication.exit())
         self._openFileAction.triggered.connect(lambda: self._openFiles())
+        self._browseAction.triggered.connect(self._browseDirectory)
+        self._watchAction.triggered.connect(self._watchDirectory)
+        self._saveFitsAction.triggered.connect(self._saveAsFits)
         self._fileMenu.addAction(self._openFileAction)
+        self._fileMenu.addAction(self._browseAction)
+        self._fileMenu.addAction(self._watchAction)
+        self._fileMenu.addAction(self._saveFitsAction)
         self._fileMenu.addAction(self._exitAction)
 
         # Edit Menu
         self._exportAction = self._editMenu.addAction("Export")
         self._histogramAction = self._editMenu.addAction("Histogram")
+        self._plotAction = self._editMenu.addAction("Plot Columns")
+        self._mathAction = self._editMenu.addAction("Image Arithmetic...")
 
         self._exportAction.triggered.connect(self._export)
         self._histogramAction.triggered.connect(self._histogram)
+        self._plotAction.triggered.connect(self._plotColumns)
+        self._mathAction.triggered.connect(self._imageMath)
 
         # View Menu
         self._zoomInAction = self._viewMenu.addAction("Zoom In")
@@ -368,6 +1190,28 @@ class MainWindow(QMainWindow):
         self._zoomOutAction.triggered.connect(self._zoomOut)
         self._viewMenu.addSeparator()
 
+        self._perfDock = QDockWidget("Performance", self)
+        self._perfDock.setWidget(PerfPanel())
+        self._perfDock.hide()
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self._perfDock)
+        self._viewMenu.addAction(self._perfDock.toggleViewAction())
+
+        self._browser = ThumbnailBrowser()
+        self._browser.fileActivated.connect(lambda path: self._openFiles([path]))
+        self._browserDock = QDockWidget("Browser", self)
+        self._browserDock.setWidget(self._browser)
+        self._browserDock.hide()
+        self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, self._browserDock)
+        self._viewMenu.addAction(self._browserDock.toggleViewAction())
+
+        self._headerPanel = HeaderPanel()
+        self._headerPanel.matchActivated.connect(self._showHeaderMatch)
+        self._headerDock = QDockWidget("Headers", self)
+        self._headerDock.setWidget(self._headerPanel)
+        self._headerDock.hide()
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self._headerDock)
+        self._viewMenu.addAction(self._headerDock.toggleViewAction())
+
         self._menuBar.addMenu(self._fileMenu)
         self._menuBar.addMenu(self._editMenu)
         self._menuBar.addMenu(self._viewMenu)
@@ -396,18 +1240,13 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "No Image", "No image view is currently active.")
             return False
 
-        pix = self._currentView.getPixmap()
-        if pix is None or pix.isNull():
-            QMessageBox.warning(
-                self, "No Image", "The current view does not contain a valid image."
-            )
-            return False
-
-        exportFileName, _ = QFileDialog.getSaveFileName(
+        exportFileName, selectedFilter = QFileDialog.getSaveFileName(
             self,
             "Save Image As",
             "",
-            "PNG Files (*.png);;JPEG Files (*.jpg *.jpeg);;BMP Files (*.bmp);;TIFF Files (*.tiff *.tif);;All Files (*)",
+            "16-bit PNG (*.png);;16-bit TIFF (*.tiff *.tif);;"
+            "FITS Cutout (*.fits *.fit *.fts);;"
+            "Screenshot (*.png *.jpg *.jpeg *.bmp);;All Files (*)",
         )
 
         if not exportFileName:
@@ -415,10 +1254,83 @@ class MainWindow(QMainWindow):
 
         # Infer format from file extension
         ext = exportFileName.split(".")[-1].lower()
+        if "Screenshot" in selectedFilter or ext in {"jpg", "jpeg", "bmp"}:
+            return self._exportScreenshot(exportFileName, ext)
+
+        match ext:
+            case "png":
+                _format = "png"
+            case "tiff" | "tif":
+                _format = "tiff"
+            case "fits" | "fit" | "fts":
+                _format = "fits"
+            case _:
+                QMessageBox.warning(self, "Invalid Format", "Unsupported image format.")
+                return False
+
+        from export import ImageExportWorker
+
+        # Rendered from the data in strips with the stretch on screen; a
+        # selected region limits the export to it
+        view = self._currentView
+        source = view.imageSource()
+        region = view.region
+        rows = (region[3] - region[1]) if region is not None else source.shape[0]
+        self._exportWorker = ImageExportWorker(
+            source,
+            exportFileName,
+            _format,
+            region,
+            view.stretch,
+            view.displayLimits(),
+            self,
+        )
+        progress = QProgressDialog("Exporting image...", "Cancel", 0, rows, self)
+        progress.setWindowTitle("Export")
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(self._exportWorker.cancel)
+
+        self._exportWorker.progress.connect(lambda done, _: progress.setValue(done))
+        self._exportWorker.succeeded.connect(
+            lambda path: QMessageBox.information(
+                self, "Export Successful", f"Image saved to:\n{path}"
+            )
+        )
+        self._exportWorker.failed.connect(
+            lambda err: QMessageBox.critical(
+                self, "Export Failed", f"Could not save image:\n{err}"
+            )
+        )
+        self._exportWorker.finished.connect(progress.reset)
+        self._exportWorker.finished.connect(self._exportWorker.deleteLater)
+        self._exportWorker.start()
+        return True
+
+    def _exportScreenshot(self, exportFileName: str, ext: str) -> bool:
+        """
+        Save the 8-bit image on screen as it is. Images decompressed tile by
+        tile are assembled on the thread pool and saved once they are ready.
+        """
         if ext not in {"png", "jpg", "jpeg", "bmp", "tiff", "tif"}:
             QMessageBox.warning(self, "Invalid Format", "Unsupported image format.")
             return False
 
+        self.statusBar().showMessage("Assembling image...")
+        self._currentView.requestPixmap(
+            lambda pix: self._saveScreenshot(pix, exportFileName, ext)
+        )
+        return True
+
+    def _saveScreenshot(
+        self, pix: Optional[QPixmap], exportFileName: str, ext: str
+    ) -> bool:
+        self.statusBar().clearMessage()
+        if pix is None or pix.isNull():
+            QMessageBox.warning(
+                self, "No Image", "The current view does not contain a valid image."
+            )
+            return False
+
         try:
             success = pix.save(exportFileName, ext.upper())
             if success:
@@ -458,83 +1370,65 @@ class MainWindow(QMainWindow):
 
         if "TSV" in selectedFilter or exportFileName.endswith(".tsv"):
             _format = "tsv"
-            sep = "\t"
         elif "LaTeX" in selectedFilter or exportFileName.endswith(".tex"):
             _format = "tex"
         else:
             _format = "csv"
-            sep = ","
 
-        try:
-            with open(exportFileName, "w", encoding="utf-8") as f:
-                if _format == "tex":
-                    f.write(
-                        "\\begin{tabular}{" + " | ".join(["l"] * table.ncols) + "}\n"
-                    )
-                    f.write("\\hline\n")
-
-                    # Header
-                    header = " & ".join(self._escape_latex(s) for s in table.col_names)
-                    f.write(f"{header} \\\\\n\\hline\n")
-
-                    # Rows
-                    for row in range(table.nrows):
-                        row_data = []
-                        for col in table.col_names:
-                            val = table.data[col][row]
-                            if isinstance(val, bytes):
-                                val = val.decode(errors="ignore")
-                            row_data.append(self._escape_latex(str(val)))
-                        f.write(" & ".join(row_data) + " \\\\\n")
-                    f.write("\\hline\n\\end{tabular}\n")
-                else:
-                    # Write header
-                    f.write(sep.join(table.col_names) + "\n")
-
-                    # Write each row
-                    for row in range(table.nrows):
-                        row_data = []
-                        for col in table.col_names:
-                            val = table.data[col][row]
-                            # Handle bytes
-                            if isinstance(val, bytes):
-                                val = val.decode(errors="ignore")
-                            row_data.append(str(val))
-                        f.write(sep.join(row_data) + "\n")
-
-            QMessageBox.information(
-                self, "Export Successful", f"Table exported to:\n{exportFileName}"
+        from export import TableExportWorker
+
+        self._exportWorker = TableExportWorker(table.data, exportFileName, _format, self)
+        progress = QProgressDialog("Exporting table...", "Cancel", 0, table.nrows, self)
+        progress.setWindowTitle("Export")
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(self._exportWorker.cancel)
+
+        self._exportWorker.progress.connect(lambda done, _: progress.setValue(done))
+        self._exportWorker.succeeded.connect(
+            lambda path: QMessageBox.information(
+                self, "Export Successful", f"Table exported to:\n{path}"
             )
-            return True
-        except Exception as e:
-            QMessageBox.critical(
-                self, "Export Failed", f"Failed to export table:\n{str(e)}"
+        )
+        self._exportWorker.failed.connect(
+            lambda err: QMessageBox.critical(
+                self, "Export Failed", f"Failed to export table:\n{err}"
             )
-            return False
-
-    def _escape_latex(self, text: str) -> str:
-        """
-        Escape LaTeX special characters
-        """
-        replacements = {
-            "&": "\\&",
-            "%": "\\%",
-            "$": "\\$",
-            "#": "\\#",
-            "_": "\\_",
-            "{": "\\{",
-            "}": "\\}",
-            "~": "\\textasciitilde{}",
-            "^": "\\textasciicircum{}",
-            "\\": "\\textbackslash{}",
-        }
-        for char, escape in replacements.items():
-            text = text.replace(char, escape)
-        return text
+        )
+        self._exportWorker.finished.connect(progress.reset)
+        self._exportWorker.finished.connect(self._exportWorker.deleteLater)
+        self._exportWorker.start()
+        return True
 
     def _onTabChanged(self, index: int) -> None:
         self._currentView = self._tabWidget.widget(index)
+        if self._currentView is None:
+            self.handleHDUTypeChanged(HDUType.NONE)
+            self._headerPanel.setCurrent(None)
+            return
+
+        # A tab released to save memory reopens its file when it comes back
+        self._currentView.reopen()
+        resource_manager.touch(self._currentView.documentId)
+        self._enforceResources()
         self.handleHDUTypeChanged(self._currentView.currentHDUType())
+        self._headerPanel.setCurrent(
+            self._currentView.documentId, self._currentView.currentHDUIndex
+        )
+
+    def _enforceResources(self) -> None:
+        """
+        Release the least recently used tabs beyond the memory budget or
+        open file limit, and show current usage
+        """
+        active = self._currentView.documentId if self._currentView else None
+        resource_manager.enforce(active)
+        held, files = resource_manager.usage()
+        budget = resource_manager.memoryBudget
+        self._usageLabel.setText(
+            f"Data {held / 2**20:,.0f} / {budget / 2**20:,.0f} MB"
+            f" | Files {files} / {resource_manager.maxOpenFiles}"
+            f" | Released {resource_manager.releases}"
+        )
 
     def _openFiles(self, files: List[str] = []) -> bool:
         """
@@ -548,18 +1442,90 @@ class MainWindow(QMainWindow):
             if len(files) == 0:
                 return False
 
+        # Tabs are added at once; each View opens its file on the thread pool
+        # and fills in when done
         for file in files:
             if file.startswith("~"):
                 file = file.replace("~", HOME)
-            tab = View(file)
-            tab.HDUTypeChanged.connect(self.handleHDUTypeChanged)
-            basename = os.path.basename(file)
-            self._tabWidget.addTab(tab, basename)
+            tab = self._addView(file, os.path.basename(file))
 
         self._tabWidget.setCurrentWidget(tab)
 
         return True
 
+    def _addView(self, file: str, label: str) -> View:
+        tab = View(file)
+        tab.HDUTypeChanged.connect(self._onViewHDUTypeChanged)
+        tab.opened.connect(self._onViewOpened)
+        self._documents[tab.documentId] = tab
+        resource_manager.register(tab.documentId, tab)
+        self._tabWidget.addTab(tab, label)
+        return tab
+
+    def _watchDirectory(self) -> None:
+        """
+        Start a live view of the newest frame written to a directory
+        """
+        directory = QFileDialog.getExistingDirectory(self, "Watch Directory")
+        if not directory:
+            return
+        session = LiveSession(directory, parent=self)
+        session.viewRequested.connect(self._onLiveViewRequested)
+        session.statusChanged.connect(self.statusBar().showMessage)
+        mode = "polling" if session.watcher.polling else "watching"
+        self.statusBar().showMessage(f"Live: {mode} {directory} for new frames")
+
+    def _onLiveViewRequested(self, path: str) -> None:
+        session = self.sender()
+        label = f"Live: {os.path.basename(session.directory)}"
+        tab = self._addView(path, label)
+        session.attach(tab)
+        self._live_sessions[tab.documentId] = session
+        self._tabWidget.setCurrentWidget(tab)
+
+    def _browseDirectory(self) -> None:
+        directory = QFileDialog.getExistingDirectory(self, "Browse Directory")
+        if not directory:
+            return
+        self._browserDock.show()
+        self._browser.setDirectory(directory)
+
+    def _onViewHDUTypeChanged(self, type: HDUType) -> None:
+        # Views finish opening in the background; only the current one
+        # drives the menus
+        if self.sender() is self._currentView:
+            self.handleHDUTypeChanged(type)
+            self._headerPanel.setCurrent(
+                self._currentView.documentId, self._currentView.currentHDUIndex
+            )
+
+    def _onViewOpened(self) -> None:
+        # Headers are indexed for search on the thread pool as files open
+        view = self.sender()
+        job = HeaderIndexJob(view.documentId, [hdu.header for hdu in view.hdul])
+        job.signals.indexed.connect(self._onHeadersIndexed)
+        job.signals.failed.connect(self._onHeaderIndexFailed)
+        QThreadPool.globalInstance().start(job)
+        self._enforceResources()
+
+    def _onHeadersIndexed(self, doc: int, document: HeaderDocument) -> None:
+        view = self._documents.get(doc)
+        if view is None:
+            return
+        label = self._tabWidget.tabText(self._tabWidget.indexOf(view))
+        self._headerPanel.addDocument(doc, label, document)
+
+    def _onHeaderIndexFailed(self, doc: int, error: str) -> None:
+        # The file itself opened; only header search misses it
+        self.statusBar().showMessage(f"Header index failed: {error}", 5000)
+
+    def _showHeaderMatch(self, doc: int, hdu: int) -> None:
+        view = self._documents.get(doc)
+        if view is None:
+            return
+        self._tabWidget.setCurrentWidget(view)
+        view.showHDU(hdu)
+
     def handleHDUTypeChanged(self, type: HDUType) -> None:
         """
         Handle HDU type changed. This is used to update menu items depending on whether the HDU
@@ -586,7 +1552,7 @@ class MainWindow(QMainWindow):
         self._zoomOutAction.setVisible(state)
 
     def showTableActions(self, state: bool) -> None:
-        pass
+        self._plotAction.setVisible(state)
 
     def _zoomIn(self) -> None:
         self._currentView.zoomIn()
@@ -605,29 +1571,149 @@ class MainWindow(QMainWindow):
 
     def _closeTab(self, index: int) -> None:
         widget = self._tabWidget.widget(index)
+        self._documents.pop(widget.documentId, None)
+        self._headerPanel.removeDocument(widget.documentId)
+        resource_manager.unregister(widget.documentId)
+        session = self._live_sessions.pop(widget.documentId, None)
+        if session is not None:
+            session.stop()
+            session.deleteLater()
         self._tabWidget.removeTab(index)
+        widget.closeFile()
         widget.deleteLater()
-        if self._tabWidget.count() == 0:
-            self._hdulist_combo.clear()
-            self._currentView = None
+        result = self._results.pop(widget.documentId, None)
+        if result is not None:
+            # The temporary directory may have been cleaned meanwhile
+            with contextlib.suppress(OSError):
+                os.remove(result)
 
     def _histogram(self) -> None:
         if self._current_hdu_type != HDUType.IMAGE:
             return
 
-        data: np.ndarray = self._currentView.getImageData()
+        # Raw (possibly memmapped) data; the histogram engine skips NaNs itself
+        data: np.ndarray = self._currentView.getRawImageData()
 
         if data is None:
             QMessageBox.critical(self, "Histogram", "No image data found!")
             return
 
+        # matplotlib is only imported once a histogram is first opened
+        with tracer.span("import matplotlib", "startup"):
+            from HistogramWidget import HistogramWidget
+
         hist_dialog = QDialog(self)
         hist_dialog.setWindowTitle("Histogram")
         hist_widget = HistogramWidget()
-        hist_widget.plotHistogram(data)
+        hist_widget.plotHistogram(data, key=self._currentView.dataKey())
 
         layout = QVBoxLayout()
         layout.addWidget(hist_widget)
         hist_dialog.setLayout(layout)
         hist_dialog.resize(600, 400)
         hist_dialog.exec()
+
+    def _plotColumns(self) -> None:
+        if self._current_hdu_type != HDUType.TABLE:
+            return
+
+        model = self._currentView.tableModel()
+        if model is None:
+            QMessageBox.critical(self, "Plot", "No table data found!")
+            return
+
+        with tracer.span("import matplotlib", "startup"):
+            from ScatterWidget import ScatterWidget
+
+        # Plots the rows passing the table's filter
+        plot_dialog = QDialog(self)
+        plot_dialog.setWindowTitle("Plot Columns")
+        plot_widget = ScatterWidget(model.query, model.filterMask())
+
+        layout = QVBoxLayout()
+        layout.addWidget(plot_widget)
+        plot_dialog.setLayout(layout)
+        plot_dialog.resize(800, 600)
+        plot_dialog.exec()
+        plot_widget.close()
+
+    def _imageMath(self) -> None:
+        """
+        Combine images of the open tabs into a new one: a difference or
+        ratio of two, or a stack of several
+        """
+        sources = []
+        for i in range(self._tabWidget.count()):
+            view = self._tabWidget.widget(i)
+            sources += view.imageSources(self._tabWidget.tabText(i))
+        if len(sources) < 2:
+            QMessageBox.warning(
+                self, "Image Arithmetic", "Open at least two images to combine."
+            )
+            return
+
+        from ImageMathDialog import ImageMathDialog
+
+        dialog = ImageMathDialog(sources, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        operation = dialog.operation
+        inputs = dialog.selection()
+
+        self._math_id += 1
+        job = ImageMathJob(
+            self._math_id,
+            operation,
+            inputs,
+            result_path(operation),
+            dialog.sigma,
+            dialog.iterations,
+        )
+        title = OPERATIONS[operation]
+        if operation not in PAIR_OPERATIONS:
+            title += f" of {len(inputs)}"
+        height = inputs[0].shape[0]
+        progress = QProgressDialog(f"{title}...", "Cancel", 0, height, self)
+        progress.setWindowTitle("Image Arithmetic")
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(job.cancel)
+        job.signals.progress.connect(lambda _, done, __: progress.setValue(done))
+        job.signals.finished.connect(
+            lambda job_id, path: self._onImageMathFinished(job_id, path, title)
+        )
+        job.signals.failed.connect(
+            lambda _, error: QMessageBox.critical(
+                self, "Image Arithmetic", f"Failed to combine images:\n{error}"
+            )
+        )
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(lambda *_: progress.reset())
+        self._math_job = job
+        QThreadPool.globalInstance().start(job)
+
+    def _onImageMathFinished(self, job_id: int, path: str, title: str) -> None:
+        self._math_job = None
+        tab = self._addView(path, title)
+        self._results[tab.documentId] = path
+        self._tabWidget.setCurrentWidget(tab)
+
+    def _saveAsFits(self) -> None:
+        """
+        Save a copy of the file shown, e.g. an image arithmetic result
+        """
+        if self._currentView is None:
+            return
+        source = self._currentView.filePath
+        name = os.path.basename(source)
+        if self._currentView.documentId in self._results:
+            name = f"{self._tabWidget.tabText(self._tabWidget.currentIndex())}.fits"
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save As FITS", name, "FITS Files (*.fits *.fit *.fts)"
+        )
+        if not path:
+            return
+        try:
+            with tracer.span("save copy", "io", path=path):
+                shutil.copyfile(source, path)
+        except OSError as e:
+            QMessageBox.critical(self, "Save Failed", f"Could not save file:\n{e}")
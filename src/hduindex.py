@@ -0,0 +1,84 @@
+from enum import Enum
+from typing import List, Tuple
+
+from astropy.io import fits
+
+
+class HDUType(Enum):
+    NONE = (0,)
+    EMPTY = (1,)
+    IMAGE = (2,)
+    TABLE = (3,)
+
+
+class HDUInfo:
+    """
+    Summary of one HDU built from its header alone.
+
+    Building it never touches the data section of the file, so the index of
+    a multi-extension file costs one header read per extension.
+    """
+
+    def __init__(self, index: int, header: fits.Header, fileinfo: dict = None):
+        self.index = index
+        self.xtension: str = str(header.get("XTENSION", "PRIMARY")).strip()
+        self.name: str = header.get("EXTNAME", "PRIMARY" if index == 0 else "")
+        self.bitpix: int = header.get("BITPIX", 0)
+        naxis = header.get("NAXIS", 0)
+        # FITS orders axes fastest-first; numpy shapes are the reverse
+        self.shape: Tuple[int, ...] = tuple(
+            header.get(f"NAXIS{i}", 0) for i in range(naxis, 0, -1)
+        )
+
+        self.header_offset: int = -1
+        self.data_offset: int = -1
+        self.data_size: int = 0
+        if fileinfo is not None:
+            self.header_offset = fileinfo.get("hdrLoc", -1)
+            self.data_offset = fileinfo.get("datLoc", -1)
+            self.data_size = fileinfo.get("datSpan", 0)
+
+        self.type: HDUType = self._classify(header)
+
+    def _classify(self, header: fits.Header) -> HDUType:
+        if self.xtension in ("TABLE", "BINTABLE") and not header.get("ZIMAGE", False):
+            return HDUType.TABLE if header.get("TFIELDS", 0) > 0 else HDUType.EMPTY
+        if header.get("GROUPS", False):
+            return HDUType.EMPTY
+        # 2D images, and cubes (NAXIS 3 or 4) viewed one plane at a time
+        if len(self.shape) in (2, 3, 4) and 0 not in self.shape:
+            return HDUType.IMAGE
+        return HDUType.EMPTY
+
+    @property
+    def hasData(self) -> bool:
+        return len(self.shape) > 0 and 0 not in self.shape
+
+    @property
+    def isCube(self) -> bool:
+        return self.type == HDUType.IMAGE and len(self.shape) > 2
+
+    @property
+    def planeCount(self) -> int:
+        count = 1
+        for n in self.shape[:-2]:
+            count *= n
+        return count
+
+    @property
+    def label(self) -> str:
+        return self.name or f"HDU {self.index}"
+
+
+def build_hdu_index(hdul: fits.HDUList) -> List[HDUInfo]:
+    """
+    Build an `HDUInfo` for every HDU in `hdul` from headers only
+    """
+    index = []
+    for i, hdu in enumerate(hdul):
+        try:
+            fileinfo = hdul.fileinfo(i)
+        except Exception:
+            fileinfo = None
+        index.append(HDUInfo(i, hdu.header, fileinfo))
+    return index
@@ -0,0 +1,245 @@
+import fnmatch
+import re
+import warnings
+from typing import Dict, List, Optional, Set, Tuple
+
+from astropy.io import fits
+from astropy.io.fits.verify import VerifyError, VerifyWarning
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from profiling import tracer
+
+# Results returned by one query at most
+MAX_RESULTS = 2000
+
+_WORDS = re.compile(r"[^\W_]+")
+
+# KEYWORD = value, with an optional space around '=' and quotes on the value
+_KEY_VALUE = re.compile(r"^\s*([A-Za-z0-9_\-]+)\s*=\s*(.*?)\s*$")
+
+
+class HeaderCard:
+    def __init__(self, hdu: int, keyword: str, value: str, comment: str):
+        self.hdu = hdu
+        self.keyword = keyword
+        self.value = value
+        self.comment = comment
+
+
+class HeaderMatch:
+    def __init__(self, doc: int, card: HeaderCard):
+        self.doc = doc
+        self.hdu = card.hdu
+        self.keyword = card.keyword
+        self.value = card.value
+        self.comment = card.comment
+
+
+def _value_text(value) -> str:
+    if value is None or isinstance(value, fits.card.Undefined):
+        return ""
+    if isinstance(value, bool):
+        return "T" if value else "F"
+    return str(value)
+
+
+def _card_text(card: fits.Card) -> Tuple[object, str]:
+    """
+    Value and comment of a card. Cards astropy cannot parse, common in old
+    instrument files, fall back to the text of their (fixed up) image.
+    """
+    try:
+        return card.value, card.comment or ""
+    except (VerifyError, ValueError):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", VerifyWarning)
+            image = card.image
+        value, _, comment = image[10:].partition("/")
+        return value.strip().strip("'").strip(), comment.strip()
+
+
+def _tokens(card: HeaderCard) -> Set[str]:
+    """
+    Lowercase terms a card is found by: its keyword, its whole value and the
+    words of its value and comment
+    """
+    tokens = {card.keyword.lower()}
+    value = card.value.lower()
+    if value:
+        tokens.add(value)
+    tokens.update(_WORDS.findall(value))
+    tokens.update(_WORDS.findall(card.comment.lower()))
+    return tokens
+
+
+class HeaderDocument:
+    """
+    The cards of every HDU of one file and their postings (term -> card
+    numbers), built off the GUI thread and merged into a `HeaderIndex`
+    """
+
+    def __init__(self, headers: List[fits.Header]):
+        self.cards: List[HeaderCard] = []
+        self.postings: Dict[str, List[int]] = {}
+        for hdu, header in enumerate(headers):
+            for card in header.cards:
+                keyword = card.keyword
+                if not keyword:
+                    continue
+                value, comment = _card_text(card)
+                if keyword in ("COMMENT", "HISTORY"):
+                    value, comment = "", str(value)
+                entry = HeaderCard(hdu, keyword, _value_text(value), comment)
+                number = len(self.cards)
+                self.cards.append(entry)
+                for token in _tokens(entry):
+                    self.postings.setdefault(token, []).append(number)
+
+    def headerCards(self, hdu: int) -> List[HeaderCard]:
+        return [card for card in self.cards if card.hdu == hdu]
+
+
+def _normalize(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        value = value[1:-1]
+    return value.strip().lower()
+
+
+def _value_matches(value: str, wanted: str) -> bool:
+    value = value.strip().lower()
+    if any(c in wanted for c in "*?["):
+        return fnmatch.fnmatchcase(value, wanted)
+    if value == wanted:
+        return True
+    # EXPTIME=30 finds 30.0
+    try:
+        return float(value) == float(wanted)
+    except ValueError:
+        return False
+
+
+class HeaderIndex:
+    """
+    Inverted index of the header cards (keyword, value, comment) of every HDU
+    of a set of files.
+
+    Each file is a document added whole and removed whole. Queries are
+    either `KEYWORD=value` (exact keyword; the value is compared ignoring
+    case and quotes, numerically for numbers, and may hold `*` wildcards) or
+    plain text, where every whitespace separated term must appear as a
+    substring of some term of the card. Substrings are looked up in the
+    vocabulary of distinct terms, which is far smaller than the cards.
+    """
+
+    def __init__(self):
+        self._docs: Dict[int, HeaderDocument] = {}
+        self._postings: Dict[str, Dict[int, List[int]]] = {}
+        self._vocabulary: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return sum(len(doc.cards) for doc in self._docs.values())
+
+    @property
+    def documents(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc: int, document: HeaderDocument) -> None:
+        self.remove(doc)
+        self._docs[doc] = document
+        for token, cards in document.postings.items():
+            self._postings.setdefault(token, {})[doc] = cards
+        self._vocabulary = None
+
+    def remove(self, doc: int) -> None:
+        document = self._docs.pop(doc, None)
+        if document is None:
+            return
+        for token in document.postings:
+            docs = self._postings.get(token)
+            if docs is not None:
+                docs.pop(doc, None)
+                if not docs:
+                    del self._postings[token]
+        self._vocabulary = None
+
+    def headerCards(self, doc: int, hdu: int) -> List[HeaderCard]:
+        document = self._docs.get(doc)
+        return [] if document is None else document.headerCards(hdu)
+
+    def _terms(self, term: str) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        return [t for t in self._vocabulary if term in t]
+
+    def _lookup(self, token: str) -> Set[Tuple[int, int]]:
+        return {
+            (doc, card)
+            for doc, cards in self._postings.get(token, {}).items()
+            for card in cards
+        }
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> List[HeaderMatch]:
+        query = query.strip()
+        if not query:
+            return []
+
+        with tracer.span("header search", "headers", query=query) as span:
+            match = _KEY_VALUE.match(query)
+            if match:
+                keyword = match.group(1).upper()
+                wanted = _normalize(match.group(2))
+                hits = []
+                for doc, number in self._lookup(keyword.lower()):
+                    card = self._docs[doc].cards[number]
+                    if card.keyword != keyword:
+                        continue
+                    if not wanted or _value_matches(card.value, wanted):
+                        hits.append((doc, number))
+            else:
+                found = None
+                for term in query.lower().split():
+                    cards = set()
+                    for token in self._terms(term):
+                        cards |= self._lookup(token)
+                    found = cards if found is None else found & cards
+                    if not found:
+                        break
+                hits = list(found or ())
+            span["matches"] = len(hits)
+
+        hits.sort()
+        return [
+            HeaderMatch(doc, self._docs[doc].cards[number])
+            for doc, number in hits[:limit]
+        ]
+
+
+class HeaderIndexSignals(QObject):
+    # document id, HeaderDocument
+    indexed = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class HeaderIndexJob(QRunnable):
+    """
+    Index the headers of an opened file on a pool thread
+    """
+
+    def __init__(self, doc: int, headers: List[fits.Header]):
+        super().__init__()
+        self.signals = HeaderIndexSignals()
+        self._doc = doc
+        self._headers = headers
+
+    def run(self) -> None:
+        try:
+            with tracer.span(
+                "header index", "headers", hdus=len(self._headers)
+            ) as span:
+                document = HeaderDocument(self._headers)
+                span["cards"] = len(document.cards)
+        except Exception as e:
+            self.signals.failed.emit(self._doc, str(e))
+            return
+        self.signals.indexed.emit(self._doc, document)
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+import numpy as np
+
+from profiling import tracer
+
+# Rows binned per step, bounding the temporary copies to one chunk
+ROW_CHUNK = 512
+
+MAX_CACHED = 32
+
+
+class Histogram:
+    def __init__(self, counts: np.ndarray, edges: np.ndarray, nan_count: int):
+        self.counts = counts
+        self.edges = edges
+        self.nan_count = nan_count
+
+    @property
+    def range(self) -> Tuple[float, float]:
+        return float(self.edges[0]), float(self.edges[-1])
+
+
+def _rows(data: np.ndarray) -> np.ndarray:
+    return data.reshape(-1, data.shape[-1]) if data.ndim > 1 else data[None]
+
+
+def finite_range(data: np.ndarray) -> Tuple[float, float]:
+    """
+    Min and max of the finite values of `data`, streamed over row chunks
+    """
+    lo, hi = np.inf, -np.inf
+    rows = _rows(data)
+    for r in range(0, rows.shape[0], ROW_CHUNK):
+        block = rows[r : r + ROW_CHUNK]
+        if block.dtype.kind == "f":
+            block = block[np.isfinite(block)]
+        if block.size:
+            lo = min(lo, float(block.min()))
+            hi = max(hi, float(block.max()))
+    if lo > hi:
+        return 0.0, 0.0
+    return lo, hi
+
+
+def compute_histogram(
+    data: np.ndarray,
+    bins: int = 256,
+    value_range: Optional[Tuple[float, float]] = None,
+) -> Histogram:
+    """
+    Bin `data` into `bins` equal-width bins over `value_range` (the finite
+    min/max by default).
+
+    The array is walked in row chunks so a memmapped image is never copied
+    as a whole. Non-finite values are skipped and counted separately; values
+    outside `value_range` are ignored.
+    """
+    # Only an explicit range can leave values outside the bins
+    clip = value_range is not None
+    if value_range is None:
+        value_range = finite_range(data)
+    lo, hi = value_range
+    if hi <= lo:
+        hi = lo + 1.0
+    scale = bins / (hi - lo)
+
+    # Bin indices are computed in float32 unless the data needs more precision
+    itemsize = data.dtype.itemsize
+    if itemsize > 4 or (data.dtype.kind in "iu" and itemsize > 2):
+        work = np.float64
+    else:
+        work = np.float32
+
+    counts = np.zeros(bins, dtype=np.int64)
+    nan_count = 0
+    rows = _rows(data)
+    for r in range(0, rows.shape[0], ROW_CHUNK):
+        block = rows[r : r + ROW_CHUNK]
+        if block.dtype.kind == "f":
+            finite = np.isfinite(block)
+            nan_count += block.size - int(np.count_nonzero(finite))
+            block = block[finite]
+        else:
+            block = block.ravel()
+        if clip:
+            block = block[(block >= lo) & (block <= hi)]
+
+        index = np.subtract(block, lo, dtype=work)
+        index *= scale
+        index = index.astype(np.intp)
+        # The upper edge belongs to the last bin, as with np.histogram
+        np.minimum(index, bins - 1, out=index)
+        counts += np.bincount(index, minlength=bins)
+
+    edges = np.linspace(lo, hi, bins + 1)
+    return Histogram(counts, edges, nan_count)
+
+
+class HistogramCache:
+    """
+    Small LRU of computed histograms, keyed by the caller (typically file,
+    mtime and HDU index) plus bins and range
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED):
+        self._max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(
+        self,
+        key: Hashable,
+        data: np.ndarray,
+        bins: int = 256,
+        value_range: Optional[Tuple[float, float]] = None,
+    ) -> Histogram:
+        full_key = (key, bins, value_range)
+        hist = self._entries.get(full_key)
+        if hist is not None:
+            self._entries.move_to_end(full_key)
+            return hist
+
+        with tracer.span("histogram", "histogram", rss=True, bins=bins):
+            hist = compute_histogram(data, bins, value_range)
+        if key is not None:
+            self._entries[full_key] = hist
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return hist
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+histogram_cache = HistogramCache()
@@ -0,0 +1,314 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from profiling import tracer
+from strips import ImageReader, ImageSource, create_fits, image_header
+
+# Memory for the chunk buffers of all workers together. A chunk is the same
+# rows of every input; combining it takes up to `WORKING_COPIES` arrays of
+# the chunk's size (the stack, its sorted copy and two float64 running sums
+# for sigma clipping).
+MATH_MEMORY = int(os.getenv("PYFITSEXPLORER_MATH_MB", "256")) * 2**20
+WORKING_COPIES = 8
+WORKERS = min(4, os.cpu_count() or 1)
+
+OPERATIONS = {
+    "difference": "Difference A - B",
+    "ratio": "Ratio A / B",
+    "mean": "Mean stack",
+    "median": "Median stack",
+    "sigmaclip": "Sigma-clipped mean stack",
+}
+PAIR_OPERATIONS = ("difference", "ratio")
+
+_result_dir: Optional[str] = None
+
+
+class MathCancelled(Exception):
+    pass
+
+
+def result_path(name: str) -> str:
+    """
+    A new file for a result in a directory removed when the program exits
+    """
+    global _result_dir
+    if _result_dir is None:
+        _result_dir = tempfile.mkdtemp(prefix="pyfitsexplorer-")
+        atexit.register(shutil.rmtree, _result_dir, True)
+    fd, path = tempfile.mkstemp(suffix=".fits", prefix=f"{name}-", dir=_result_dir)
+    os.close(fd)
+    return path
+
+
+def _span(sorted_stack: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """
+    Elements at per-pixel positions `k` along the stack axis
+    """
+    return np.take_along_axis(sorted_stack, k[np.newaxis], axis=0)[0]
+
+
+def _median(sorted_stack: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    Median of sorted_stack[lo:hi] for every pixel
+    """
+    n = hi - lo
+    last = len(sorted_stack) - 1
+    low = _span(sorted_stack, np.clip(lo + (n - 1) // 2, 0, last))
+    high = _span(sorted_stack, np.clip(lo + n // 2, 0, last))
+    median = (low.astype(np.float64) + high) / 2
+    median[n == 0] = np.nan
+    return median
+
+
+def stack_mean(stack: np.ndarray) -> np.ndarray:
+    """
+    Mean over the first axis, ignoring NaNs
+    """
+    finite = np.isfinite(stack)
+    total = np.where(finite, stack, 0).sum(axis=0, dtype=np.float64)
+    count = finite.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / count
+
+
+def stack_median(stack: np.ndarray) -> np.ndarray:
+    """
+    Median over the first axis, ignoring NaNs. Non-finite values sort last,
+    so each pixel's valid values are the leading run of the sorted stack.
+    """
+    stack = np.where(np.isfinite(stack), stack, np.nan)
+    stack.sort(axis=0)
+    count = np.isfinite(stack).sum(axis=0)
+    return _median(stack, np.zeros_like(count), count)
+
+
+def stack_sigma_clip(
+    stack: np.ndarray, sigma: float = 3.0, iterations: int = 5
+) -> np.ndarray:
+    """
+    Mean over the first axis after iteratively rejecting values more than
+    `sigma` standard deviations from the median, ignoring NaNs.
+
+    Along the sorted stack the values kept for a pixel are always one run
+    [lo, hi), so each iteration only moves the two ends: the median is read
+    at the middle of the run and the mean and deviation come from cumulative
+    sums, with no per-pixel loop.
+    """
+    stack = np.where(np.isfinite(stack), stack, np.nan)
+    stack.sort(axis=0)
+    lo = np.zeros(stack.shape[1:], dtype=np.intp)
+    hi = np.isfinite(stack).sum(axis=0)
+
+    # Offsetting by the median keeps the variance of large values accurate
+    center = _median(stack, lo, hi)
+    offset = np.nan_to_num(center)
+    # Accumulated plane by plane; cumsum along the first axis strides
+    # through memory and is several times slower
+    sums = np.zeros((len(stack) + 1, *stack.shape[1:]))
+    squares = np.zeros_like(sums)
+    for k, plane in enumerate(stack):
+        value = np.nan_to_num(plane - offset, nan=0.0)
+        np.add(sums[k], value, out=sums[k + 1])
+        value *= value
+        np.add(squares[k], value, out=squares[k + 1])
+
+    def moments(lo, hi):
+        count = hi - lo
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (_span(sums, hi) - _span(sums, lo)) / count
+            square = (_span(squares, hi) - _span(squares, lo)) / count
+        return mean, np.sqrt(np.maximum(square - mean * mean, 0))
+
+    for _ in range(iterations):
+        _, std = moments(lo, hi)
+        median = _median(stack, lo, hi)
+        with np.errstate(invalid="ignore"):
+            new_lo = np.maximum(lo, (stack < median - sigma * std).sum(axis=0))
+            new_hi = np.minimum(hi, (stack <= median + sigma * std).sum(axis=0))
+        new_hi = np.maximum(new_hi, new_lo)
+        if np.array_equal(new_lo, lo) and np.array_equal(new_hi, hi):
+            break
+        lo, hi = new_lo, new_hi
+
+    mean, _ = moments(lo, hi)
+    return mean + offset
+
+
+def combine(
+    operation: str, stack: np.ndarray, sigma: float = 3.0, iterations: int = 5
+) -> np.ndarray:
+    """
+    Combine a chunk of the same rows of every input, stacked on the first
+    axis
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        match operation:
+            case "difference":
+                return stack[0] - stack[1]
+            case "ratio":
+                return stack[0] / stack[1]
+            case "mean":
+                return stack_mean(stack)
+            case "median":
+                return stack_median(stack)
+            case "sigmaclip":
+                return stack_sigma_clip(stack, sigma, iterations)
+    raise ValueError(f"unknown operation {operation}")
+
+
+def chunk_rows(count: int, width: int, workers: int = WORKERS) -> int:
+    """
+    Rows per chunk keeping all workers' buffers within `MATH_MEMORY`
+    """
+    per_row = count * width * 4 * WORKING_COPIES
+    return max(1, MATH_MEMORY // (workers * per_row))
+
+
+def image_math(
+    operation: str,
+    sources: List[ImageSource],
+    path: str,
+    sigma: float = 3.0,
+    iterations: int = 5,
+    progress=None,
+    cancelled=None,
+    workers: int = WORKERS,
+) -> str:
+    """
+    Combine `sources` with `operation` into a float32 FITS image at `path`.
+
+    The inputs are read in chunks of rows spread over `workers` threads and
+    each chunk's result is written straight into the memory mapped output,
+    so memory stays within `MATH_MEMORY` however many and however large the
+    inputs are. The output keeps the first input's header keywords.
+    `progress(done, total)` is called with the rows done; when `cancelled()`
+    returns True, `MathCancelled` is raised.
+    """
+    if operation in PAIR_OPERATIONS and len(sources) != 2:
+        raise ValueError(f"{OPERATIONS[operation]} needs two images")
+    if operation not in PAIR_OPERATIONS and len(sources) < 2:
+        raise ValueError(f"{OPERATIONS[operation]} needs at least two images")
+    shape = sources[0].shape
+    for source in sources[1:]:
+        if source.shape != shape:
+            raise ValueError(
+                f"{source.label} is {source.shape[1]}x{source.shape[0]}, "
+                f"{sources[0].label} is {shape[1]}x{shape[0]}"
+            )
+
+    readers = []
+    try:
+        for source in sources:
+            readers.append(ImageReader(source))
+
+        history = [f"pyfitsexplorer: {OPERATIONS[operation]} of"]
+        history += [f"  {source.label}" for source in sources]
+        if operation == "sigmaclip":
+            history.append(f"  sigma {sigma:g}, {iterations} iterations")
+        header = image_header(readers[0].header, shape, -32)
+        for line in history:
+            header.add_history(line)
+        out = create_fits(path, header, shape, ">f4")
+
+        height, width = shape
+        step = chunk_rows(len(sources), width, workers)
+        done = 0
+
+        def run_chunk(y0: int) -> int:
+            if cancelled is not None and cancelled():
+                return 0
+            y1 = min(height, y0 + step)
+            with tracer.span("math chunk", "math", rows=y1 - y0):
+                stack = np.stack([reader.rows(y0, y1) for reader in readers])
+                out[y0:y1] = combine(operation, stack, sigma, iterations)
+            return y1 - y0
+
+        with ThreadPoolExecutor(workers) as pool:
+            for rows in pool.map(run_chunk, range(0, height, step)):
+                done += rows
+                if progress is not None:
+                    progress(done, height)
+        if cancelled is not None and cancelled():
+            raise MathCancelled()
+        out.flush()
+        del out
+    except BaseException:
+        os.remove(path)
+        raise
+    finally:
+        for reader in readers:
+            reader.close()
+    return path
+
+
+class MathSignals(QObject):
+    # job id, rows done, rows
+    progress = pyqtSignal(int, int, int)
+    # job id, result path
+    finished = pyqtSignal(int, str)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+
+
+class ImageMathJob(QRunnable):
+    """
+    Run `image_math` on a pool thread
+    """
+
+    def __init__(
+        self,
+        job_id: int,
+        operation: str,
+        sources: List[ImageSource],
+        path: str,
+        sigma: float = 3.0,
+        iterations: int = 5,
+    ):
+        super().__init__()
+        self.signals = MathSignals()
+        self._job_id = job_id
+        self._operation = operation
+        self._sources = sources
+        self._path = path
+        self._sigma = sigma
+        self._iterations = iterations
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def run(self) -> None:
+        try:
+            with tracer.span(
+                "image math",
+                "math",
+                rss=True,
+                op=self._operation,
+                inputs=len(self._sources),
+            ):
+                image_math(
+                    self._operation,
+                    self._sources,
+                    self._path,
+                    self._sigma,
+                    self._iterations,
+                    progress=lambda done, total: self.signals.progress.emit(
+                        self._job_id, done, total
+                    ),
+                    cancelled=self._cancel.is_set,
+                )
+        except MathCancelled:
+            self.signals.cancelled.emit(self._job_id)
+        except Exception as e:
+            self.signals.failed.emit(self._job_id, str(e))
+        else:
+            self.signals.finished.emit(self._job_id, self._path)
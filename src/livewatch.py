@@ -0,0 +1,252 @@
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from hduindex import HDUType
+from profiling import tracer
+from utils import FITS_SUFFIXES
+
+# Interval between the size checks deciding that a new file is complete
+SETTLE_MS = 100
+
+# Directory scan interval when file system events are unavailable, e.g. on
+# network filesystems where inotify sees no remote writes
+POLL_MS = 500
+
+FITS_BLOCK = 2880
+
+# A frame not shown this long after it started loading is given up on, so
+# one bad frame cannot stall the session
+LOAD_TIMEOUT_MS = 10_000
+
+
+def _is_complete(path: str, size: int) -> bool:
+    """
+    Whether a file whose size has stopped changing looks fully written.
+    Uncompressed FITS files are a whole number of 2880 byte blocks.
+    """
+    if size == 0:
+        return False
+    return path.lower().endswith(".gz") or size % FITS_BLOCK == 0
+
+
+class DirectoryWatcher(QObject):
+    """
+    Report new FITS files in a directory once they are completely written.
+
+    Directory changes come from `QFileSystemWatcher` (inotify on Linux), or
+    from polling when it cannot watch the directory or `poll` is set. New
+    files are checked every `SETTLE_MS` until their size and mtime stop
+    changing. Of the files that complete together only the newest is
+    reported, so a burst of frames shows as one.
+    """
+
+    # path, time it was last written (seconds since the epoch), files skipped
+    frameReady = pyqtSignal(str, float, int)
+
+    def __init__(self, directory: str, poll: Optional[bool] = None, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self._known: Set[str] = set()
+        self._pending: Dict[str, Tuple[int, int]] = {}
+
+        self._settleTimer = QTimer(self)
+        self._settleTimer.setSingleShot(True)
+        self._settleTimer.setInterval(SETTLE_MS)
+        self._settleTimer.timeout.connect(self._checkPending)
+
+        if poll is None:
+            poll = bool(os.getenv("PYFITSEXPLORER_WATCH_POLL"))
+        self._watcher = QFileSystemWatcher(self)
+        self.polling = poll or not self._watcher.addPath(directory)
+        self._watcher.directoryChanged.connect(self._scan)
+        self._pollTimer = QTimer(self)
+        self._pollTimer.setInterval(POLL_MS)
+        self._pollTimer.timeout.connect(self._scan)
+        if self.polling:
+            self._pollTimer.start()
+
+        # Files already there are not new frames, except that the newest is
+        # shown to start with
+        entries = self._entries()
+        self._known.update(entries)
+        if entries:
+            newest = max(entries, key=lambda path: entries[path][1])
+            self._pending[newest] = (-1, -1)
+            self._known.discard(newest)
+            self._settleTimer.start()
+
+    def stop(self) -> None:
+        self._pollTimer.stop()
+        self._settleTimer.stop()
+        self._watcher.removePaths(self._watcher.directories())
+
+    def _entries(self) -> Dict[str, Tuple[int, int]]:
+        entries = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.lower().endswith(FITS_SUFFIXES):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        return entries
+
+    def _scan(self, *_) -> None:
+        entries = self._entries()
+        # Forget deleted files, so a frame written again under the same name
+        # counts as new
+        self._known &= entries.keys()
+        for path, stat in entries.items():
+            if path not in self._known and path not in self._pending:
+                self._pending[path] = stat
+        if self._pending and not self._settleTimer.isActive():
+            self._settleTimer.start()
+
+    def _checkPending(self) -> None:
+        done = []
+        for path, previous in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == previous and _is_complete(path, stat.st_size):
+                done.append((stat.st_mtime_ns, path))
+                del self._pending[path]
+                self._known.add(path)
+            else:
+                self._pending[path] = current
+
+        if done:
+            mtime, path = max(done)
+            tracer.counter("live", detect_ms=(time.time() - mtime / 1e9) * 1000)
+            self.frameReady.emit(path, mtime / 1e9, len(done) - 1)
+        if self._pending:
+            self._settleTimer.start()
+
+
+class LiveSession(QObject):
+    """
+    Show the frames a `DirectoryWatcher` reports in one reused view.
+
+    One frame is loaded at a time. A frame arriving while another is still
+    opening or rendering waits, replacing (and dropping) any frame already
+    waiting, so a slow render shows the newest frame next instead of falling
+    behind. The latency from a frame's last write to its display is
+    recorded.
+
+    Frames are shown at their first image HDU, e.g. past the empty primary
+    HDU of a multi-extension file; frames without one count as shown once
+    they are open.
+    """
+
+    # path, waiting for a view to show it in
+    viewRequested = pyqtSignal(str)
+    statusChanged = pyqtSignal(str)
+
+    def __init__(self, directory: str, poll: Optional[bool] = None, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.view = None
+        self.dropped = 0
+        self.shown = 0
+        self.lastLatency: Optional[float] = None
+        self._loading: Optional[Tuple[str, float]] = None
+        self._waiting: Optional[Tuple[str, float]] = None
+        self._timeout = QTimer(self)
+        self._timeout.setSingleShot(True)
+        self._timeout.setInterval(LOAD_TIMEOUT_MS)
+        self._timeout.timeout.connect(self._onTimeout)
+
+        self.watcher = DirectoryWatcher(directory, poll, self)
+        self.watcher.frameReady.connect(self._onFrameReady)
+
+    def attach(self, view) -> None:
+        """
+        Use `view` (a `View` opened on the first frame) for all frames
+        """
+        self.view = view
+        view.quiet = True
+        view.opened.connect(self._onOpened)
+        view.imageShown.connect(self._onShown)
+        view.loadFailed.connect(self._onFailed)
+
+    def stop(self) -> None:
+        self.watcher.stop()
+        self._timeout.stop()
+
+    def _onFrameReady(self, path: str, written: float, skipped: int) -> None:
+        self.dropped += skipped
+        if self._loading is not None:
+            if self._waiting is not None:
+                self.dropped += 1
+            self._waiting = (path, written)
+            return
+        self._load(path, written)
+
+    def _load(self, path: str, written: float) -> None:
+        self._loading = (path, written)
+        self._timeout.start()
+        if self.view is None:
+            self.viewRequested.emit(path)
+        else:
+            self.view.replaceFile(path)
+
+    def _next(self) -> None:
+        self._loading = None
+        self._timeout.stop()
+        if self._waiting is not None:
+            waiting, self._waiting = self._waiting, None
+            self._load(*waiting)
+
+    def _onOpened(self) -> None:
+        if self._loading is None or self.view.currentHDUType() == HDUType.IMAGE:
+            return
+        images = [
+            info.index for info in self.view.hduIndex if info.type == HDUType.IMAGE
+        ]
+        if images:
+            # Shown once its image is rendered
+            self.view.showHDU(images[0])
+        else:
+            self._onShown()
+
+    def _onShown(self) -> None:
+        if self._loading is None:
+            return
+        path, written = self._loading
+        self.shown += 1
+        self.lastLatency = time.time() - written
+        tracer.counter(
+            "live", latency_ms=self.lastLatency * 1000, dropped=self.dropped
+        )
+        self.statusChanged.emit(
+            f"Live {os.path.basename(path)}: {self.lastLatency * 1000:.0f} ms after "
+            f"write, {self.shown} shown, {self.dropped} dropped"
+        )
+        self._next()
+
+    def _onFailed(self, error: str) -> None:
+        if self._loading is None:
+            return
+        self.statusChanged.emit(f"Live {os.path.basename(self._loading[0])}: {error}")
+        self._next()
+
+    def _onTimeout(self) -> None:
+        if self._loading is None:
+            return
+        self.dropped += 1
+        self.statusChanged.emit(
+            f"Live {os.path.basename(self._loading[0])}: not shown after "
+            f"{LOAD_TIMEOUT_MS / 1000:.0f} s, skipped"
+        )
+        self._next()
@@ -1,11 +1,48 @@
+import time
+
+# Taken before anything heavy is imported, for the startup measurement
+_START = time.perf_counter()
+
+import os
 import sys
-from PyQt6.QtWidgets import QApplication
-from gui import MainWindow
+from profiling import tracer
+
+
+def _onFirstWindow(app) -> None:
+    """
+    Record the time from launch until the event loop runs with the window
+    shown, and quit right away when only startup is being measured
+    """
+    tracer.counter("startup", first_window_ms=(time.perf_counter() - _START) * 1000)
+    if os.getenv("PYFITSEXPLORER_EXIT_AFTER_START"):
+        app.quit()
+
 
 def main():
+    # `main.py batch ...` renders files headlessly, without any GUI
+    if sys.argv[1:2] == ["batch"]:
+        import batch
+
+        sys.exit(batch.main(sys.argv[2:]))
+
+    with tracer.span("import gui", "startup", rss=True):
+        from PyQt6.QtCore import QThreadPool, QTimer
+        from PyQt6.QtWidgets import QApplication
+        from gui import MainWindow
+        from opener import io_pool
+
     app = QApplication(sys.argv)
-    MainWindow(sys.argv[1:])
+    window = MainWindow(sys.argv[1:])  # noqa: F841
+    QTimer.singleShot(0, lambda: _onFirstWindow(app))
     app.exec()
+    # Let pool jobs finish before the views they report to are torn down
+    io_pool().waitForDone()
+    QThreadPool.globalInstance().waitForDone()
+
+    # Save the session's timing spans as a Chrome trace when asked to
+    trace_path = os.getenv("PYFITSEXPLORER_TRACE")
+    if trace_path:
+        tracer.dump(trace_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+import os
+from typing import Optional
+
+from astropy.io import fits
+from PyQt6.QtCore import QCoreApplication, QObject, QRunnable, QThreadPool, pyqtSignal
+
+from hduindex import build_hdu_index
+from profiling import tracer
+
+# Upper bound on pool jobs reading files at the same time, so opening many
+# files at once does not flood a network filesystem with requests
+MAX_CONCURRENT_IO = int(os.getenv("PYFITSEXPLORER_MAX_IO", "4"))
+
+_io_pool: Optional[QThreadPool] = None
+
+
+def io_pool() -> QThreadPool:
+    """
+    Thread pool for jobs that read files, with `MAX_CONCURRENT_IO` threads.
+    Reads queue here rather than waiting on threads of the global pool, which
+    stay free for rendering and indexing.
+    """
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = QThreadPool(QCoreApplication.instance())
+        _io_pool.setMaxThreadCount(MAX_CONCURRENT_IO)
+    return _io_pool
+
+
+class OpenSignals(QObject):
+    # HDUList, [HDUInfo]
+    opened = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+
+
+class OpenJob(QRunnable):
+    """
+    Open a FITS file and index its HDUs from their headers on a thread of the
+    `io_pool`
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.signals = OpenSignals()
+        self._path = path
+
+    def run(self) -> None:
+        try:
+            with tracer.span("open", "io", rss=True, path=self._path):
+                hdul = fits.open(self._path)
+            # Only headers are read here; data is loaded when an HDU is
+            # selected
+            with tracer.span("header scan", "io") as span:
+                index = build_hdu_index(hdul)
+                span["hdus"] = len(index)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.opened.emit(hdul, index)
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+MAX_EVENTS = 20000
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """
+    Current resident set size, or 0 where /proc is unavailable
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Tracer:
+    """
+    Collects timing spans and counters in a bounded ring buffer.
+
+    Spans are recorded as Chrome trace "complete" events, so `dump()` output
+    opens directly in chrome://tracing or Perfetto. Recording is thread-safe
+    and costs two clock reads and a deque append per span, plus a read of
+    /proc for spans that sample memory.
+    """
+
+    def __init__(self, max_events: int = MAX_EVENTS):
+        self.enabled = True
+        self._events: deque = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    @contextmanager
+    def span(self, name: str, category: str = "viewer", rss: bool = False, **args):
+        """
+        Time the enclosed block. Keyword arguments are stored with the span.
+        With `rss` the RSS after the block is added as `rss_mb`; meant for
+        coarse spans that load or build data, not per-block ones.
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = self._now_us()
+        try:
+            yield args
+        finally:
+            end = self._now_us()
+            if rss:
+                args["rss_mb"] = round(rss_bytes() / 2**20, 1)
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": end - start,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self._events.append(event)
+
+    def counter(self, name: str, **values) -> None:
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "ph": "C",
+            "ts": self._now_us(),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": values,
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def events(self) -> List[Dict]:
+        with self._lock:
+            return list(self._events)
+
+    def spans(self, last: int = 0) -> List[Dict]:
+        events = [e for e in self.events() if e["ph"] == "X"]
+        return events[-last:] if last else events
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+
+    def toChromeTrace(self) -> Dict:
+        return {"traceEvents": self.events(), "displayTimeUnit": "ms"}
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.toChromeTrace(), f)
+
+
+tracer = Tracer()
@@ -0,0 +1,249 @@
+import math
+import os
+from typing import Callable, Hashable, Optional, Tuple
+
+import numpy as np
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from profiling import tracer
+
+# Images up to this many pixels get pixel-resolution summed-area tables
+# (20 bytes per pixel); larger ones get tables over small blocks of pixels
+SAT_MAX_PIXELS = int(
+    os.getenv("PYFITSEXPLORER_SAT_MAX_PIXELS", str(16 * 1024 * 1024))
+)
+
+# Side of the blocks whose min and max are precomputed
+EXTREMA_BLOCK = 32
+
+# Image rows read per step while building, bounding the float64 copies
+ROW_CHUNK = 256
+
+
+class RegionSummary:
+    def __init__(
+        self,
+        count: int,
+        nan_count: int,
+        total: float,
+        mean: float,
+        std: float,
+        lo: float,
+        hi: float,
+    ):
+        self.count = count
+        self.nan_count = nan_count
+        self.sum = total
+        self.mean = mean
+        self.std = std
+        self.min = lo
+        self.max = hi
+
+    def __str__(self) -> str:
+        return (
+            f"sum {self.sum:.6g}, mean {self.mean:.6g}, std {self.std:.6g}, "
+            f"min {self.min:.6g}, max {self.max:.6g}, "
+            f"NaN {self.nan_count} of {self.count}"
+        )
+
+
+def _inner(a0: int, a1: int, block: int) -> Tuple[int, int]:
+    """
+    Range of whole blocks inside the pixel range [a0, a1)
+    """
+    return -(-a0 // block), a1 // block
+
+
+def _reduce_blocks(values: np.ndarray, block: int, ufunc, fill) -> np.ndarray:
+    """
+    Reduce a 2D array over `block` x `block` cells, padding partial edge
+    cells with `fill`
+    """
+    if block == 1:
+        return values.copy()
+    height, width = values.shape
+    ph, pw = -height % block, -width % block
+    if ph or pw:
+        values = np.pad(values, ((0, ph), (0, pw)), constant_values=fill)
+    h, w = values.shape
+    cells = values.reshape(h // block, block, w // block, block)
+    return ufunc.reduce(ufunc.reduce(cells, axis=3), axis=1)
+
+
+def _summed(values: np.ndarray) -> np.ndarray:
+    """
+    Summed-area table with a leading row and column of zeros, so the sum of
+    values[y0:y1, x0:x1] is t[y1, x1] - t[y0, x1] - t[y1, x0] + t[y0, x0]
+    """
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=values.dtype)
+    np.cumsum(values, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def _rect(table: np.ndarray, y0: int, y1: int, x0: int, x1: int):
+    return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+
+class RegionStats:
+    """
+    Statistics of rectangular regions of a 2D image in constant time.
+
+    Summed-area tables of the value, its square and a non-finite flag are
+    built once, so the sum, mean, std and NaN count of any rectangle take
+    four lookups each, however large it is. Values are offset by a sampled
+    reference level before squaring to keep the variance accurate.
+
+    Images over `SAT_MAX_PIXELS` get the tables over square blocks of pixels
+    instead; the partial blocks along a rectangle's edges are then summed
+    from the data, which is cheap next to the area. Min and max come from
+    precomputed per-block extrema in the same way.
+    """
+
+    def __init__(self, data: np.ndarray):
+        self._data = data
+        self.shape = data.shape
+        height, width = data.shape
+        self._block = max(1, math.ceil(math.sqrt(data.size / SAT_MAX_PIXELS)))
+        sample = np.asarray(data[:: max(1, height // 64), :: max(1, width // 64)], float)
+        sample = sample[np.isfinite(sample)]
+        self._offset = float(np.median(sample)) if sample.size else 0.0
+
+        # Rows are converted a chunk at a time (a multiple of both block
+        # sizes) so a memmapped image is never copied to float64 as a whole
+        step = ROW_CHUNK * self._block * EXTREMA_BLOCK
+        sums, squares, nans, lows, highs = [], [], [], [], []
+        for r in range(0, height, step):
+            values = np.asarray(data[r : r + step], dtype=np.float64)
+            finite = np.isfinite(values)
+            values = values - self._offset
+            values[~finite] = 0.0
+            sums.append(_reduce_blocks(values, self._block, np.add, 0.0))
+            squares.append(_reduce_blocks(values * values, self._block, np.add, 0.0))
+            nans.append(_reduce_blocks(~finite, self._block, np.add, 0).astype(np.int32))
+
+            values += self._offset
+            values[~finite] = np.inf
+            lows.append(_reduce_blocks(values, EXTREMA_BLOCK, np.minimum, np.inf))
+            values[~finite] = -np.inf
+            highs.append(_reduce_blocks(values, EXTREMA_BLOCK, np.maximum, -np.inf))
+
+        self._sum = _summed(np.concatenate(sums))
+        self._square = _summed(np.concatenate(squares))
+        self._nan = _summed(np.concatenate(nans))
+        self._low = np.concatenate(lows)
+        self._high = np.concatenate(highs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            a.nbytes for a in (self._sum, self._square, self._nan, self._low, self._high)
+        )
+
+    def _border(self, y0: int, y1: int, x0: int, x1: int, block: int):
+        """
+        Split the rectangle into the whole `block` cells inside it and the
+        pixel strips around them. Returns the block range (or None when no
+        whole block fits) and the strips.
+        """
+        by0, by1 = _inner(y0, y1, block)
+        bx0, bx1 = _inner(x0, x1, block)
+        if by0 >= by1 or bx0 >= bx1:
+            return None, [(y0, y1, x0, x1)]
+        iy0, iy1, ix0, ix1 = by0 * block, by1 * block, bx0 * block, bx1 * block
+        strips = [
+            (y0, iy0, x0, x1),
+            (iy1, y1, x0, x1),
+            (iy0, iy1, x0, ix0),
+            (iy0, iy1, ix1, x1),
+        ]
+        strips = [s for s in strips if s[0] < s[1] and s[2] < s[3]]
+        return (by0, by1, bx0, bx1), strips
+
+    def value(self, x: int, y: int) -> float:
+        return float(self._data[y, x])
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> Optional[RegionSummary]:
+        """
+        Statistics over data[y0:y1, x0:x1], clipped to the image; None for an
+        empty region
+        """
+        height, width = self.shape
+        x0, x1 = max(0, min(x0, x1)), min(width, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(height, max(y0, y1))
+        if x0 >= x1 or y0 >= y1:
+            return None
+
+        total = square = 0.0
+        nan_count = 0
+        inner, strips = self._border(y0, y1, x0, x1, self._block)
+        if inner is not None:
+            total = _rect(self._sum, *inner)
+            square = _rect(self._square, *inner)
+            nan_count = int(_rect(self._nan, *inner))
+        for sy0, sy1, sx0, sx1 in strips:
+            values = np.asarray(self._data[sy0:sy1, sx0:sx1], dtype=np.float64)
+            finite = np.isfinite(values)
+            values = values[finite] - self._offset
+            total += values.sum()
+            square += (values * values).sum()
+            nan_count += finite.size - int(np.count_nonzero(finite))
+
+        lo, hi = np.inf, -np.inf
+        inner, strips = self._border(y0, y1, x0, x1, EXTREMA_BLOCK)
+        if inner is not None:
+            by0, by1, bx0, bx1 = inner
+            lo = float(self._low[by0:by1, bx0:bx1].min())
+            hi = float(self._high[by0:by1, bx0:bx1].max())
+        for sy0, sy1, sx0, sx1 in strips:
+            values = np.asarray(self._data[sy0:sy1, sx0:sx1], dtype=np.float64)
+            values = values[np.isfinite(values)]
+            if values.size:
+                lo = min(lo, float(values.min()))
+                hi = max(hi, float(values.max()))
+
+        count = (y1 - y0) * (x1 - x0)
+        valid = count - nan_count
+        if valid == 0:
+            return RegionSummary(count, nan_count, 0.0, np.nan, np.nan, np.nan, np.nan)
+        mean = total / valid
+        variance = max(0.0, square / valid - mean * mean)
+        return RegionSummary(
+            count,
+            nan_count,
+            float(total + self._offset * valid),
+            float(mean + self._offset),
+            math.sqrt(variance),
+            lo,
+            hi,
+        )
+
+
+class RegionStatsSignals(QObject):
+    # key, RegionStats
+    ready = pyqtSignal(object, object)
+    failed = pyqtSignal(object, str)
+
+
+class RegionStatsJob(QRunnable):
+    """
+    Build the `RegionStats` tables of an image on a pool thread. `load`
+    returns the image and is called on the pool thread too, so reading or
+    decompressing it does not block the GUI.
+    """
+
+    def __init__(self, key: Hashable, load: Callable[[], np.ndarray]):
+        super().__init__()
+        self.key = key
+        self.signals = RegionStatsSignals()
+        self._load = load
+
+    def run(self) -> None:
+        try:
+            data = self._load()
+            with tracer.span("region tables", "stats", rss=True, shape=str(data.shape)):
+                stats = RegionStats(data)
+        except Exception as e:
+            self.signals.failed.emit(self.key, str(e))
+            return
+        self.signals.ready.emit(self.key, stats)
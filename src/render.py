@@ -0,0 +1,93 @@
+import threading
+from typing import Optional
+
+from astropy.io import fits
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from TiledImageItem import gray8_to_qimage
+from profiling import tracer
+from stretch import Stretch, StretchEngine
+
+# Frames whose longest side exceeds this get a strided preview first
+PREVIEW_SIZE = 1024
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class RenderSignals(QObject):
+    # job id, 8-bit preview image, preview stride
+    preview = pyqtSignal(int, QImage, int)
+    # job id, 8-bit frame, QImage of it (null when the view tiles it)
+    finished = pyqtSignal(int, object, QImage)
+    failed = pyqtSignal(int, str)
+
+
+class RenderJob(QRunnable):
+    """
+    Read, stretch and convert one image HDU on a pool thread. Jobs without an
+    `engine` read the data and belong on the `io_pool`.
+
+    Results come back through `signals`, tagged with `job_id` so the receiver
+    can drop results of jobs it has since superseded. `cancel()` stops the job
+    at the next stage boundary.
+    """
+
+    def __init__(
+        self,
+        job_id: int,
+        hdu: fits.FitsHDU,
+        stretch: Stretch,
+        build_image: bool = True,
+        engine: Optional[StretchEngine] = None,
+    ):
+        super().__init__()
+        self.job_id = job_id
+        self.signals = RenderSignals()
+        # Reusing the engine of the same HDU makes re-stretching a LUT lookup
+        self.engine = engine
+        self._hdu = hdu
+        self._stretch = stretch
+        self._build_image = build_image
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def _checkCancelled(self) -> None:
+        if self._cancel.is_set():
+            raise RenderCancelled()
+
+    def run(self) -> None:
+        try:
+            if self.engine is None:
+                # Memmapped data is read from disk while it is first touched
+                with tracer.span("data read", "render", rss=True):
+                    data = self._hdu.data
+                self._checkCancelled()
+
+                stride = max(data.shape) // PREVIEW_SIZE
+                if stride > 1:
+                    with tracer.span("preview", "render", stride=stride):
+                        preview = StretchEngine(data[::stride, ::stride])
+                        image = gray8_to_qimage(preview.render(self._stretch))
+                    self._checkCancelled()
+                    self.signals.preview.emit(self.job_id, image, stride)
+
+                with tracer.span("index", "render", rss=True, bytes=data.nbytes):
+                    self.engine = StretchEngine(data)
+
+            with tracer.span("normalize", "render", stretch=str(self._stretch.key)):
+                frame = self.engine.render(self._stretch)
+            self._checkCancelled()
+
+            with tracer.span("qimage build", "render", bytes=frame.nbytes):
+                image = gray8_to_qimage(frame) if self._build_image else QImage()
+            self._checkCancelled()
+            self.signals.finished.emit(self.job_id, frame, image)
+        except RenderCancelled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from PyQt6.QtGui import QPixmap
+
+# Budget for rendered frames kept across tab switches and re-opens
+DEFAULT_MAX_BYTES = int(os.getenv("PYFITSEXPLORER_RENDER_CACHE_MB", "512")) * 2**20
+
+
+class CacheEntry:
+    def __init__(
+        self,
+        frame: np.ndarray,
+        pixmap: Optional[QPixmap] = None,
+        limits: Optional[Tuple[float, float]] = None,
+    ):
+        self.frame = frame
+        self.pixmap = pixmap
+        # Data limits the frame was stretched with
+        self.limits = limits
+
+    @property
+    def nbytes(self) -> int:
+        size = self.frame.nbytes
+        if self.pixmap is not None and not self.pixmap.isNull():
+            size += self.pixmap.width() * self.pixmap.height() * self.pixmap.depth() // 8
+        return size
+
+
+def file_key(path: str) -> Tuple[str, float]:
+    """
+    Identify the on-disk version of `path` as (absolute path, mtime)
+    """
+    path = os.path.abspath(path)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = 0.0
+    return path, mtime
+
+
+class RenderCache:
+    """
+    LRU cache of rendered 8-bit frames, their pixmaps and display limits.
+
+    Keys are (path, mtime, hdu index, stretch key). Entries are evicted in
+    least-recently-used order once their total size exceeds `max_bytes`.
+    Storing a frame for a new mtime of a file drops every entry of its
+    older versions.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(path: str, hdu_index: int, stretch: Hashable = "linear") -> tuple:
+        return (*file_key(path), hdu_index, stretch)
+
+    @property
+    def maxBytes(self) -> int:
+        return self._max_bytes
+
+    def setMaxBytes(self, max_bytes: int) -> None:
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+        self,
+        key: tuple,
+        frame: np.ndarray,
+        pixmap: Optional[QPixmap] = None,
+        limits: Optional[Tuple[float, float]] = None,
+    ) -> None:
+        entry = CacheEntry(frame, pixmap, limits)
+        with self._lock:
+            self._drop(key)
+            self._dropStale(key[0], key[1])
+            if entry.nbytes > self._max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+
+    def invalidate(self, path: str) -> None:
+        """
+        Drop every entry for `path`, whatever its mtime
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _dropStale(self, path: str, mtime: float) -> None:
+        for key in [k for k in self._entries if k[0] == path and k[1] != mtime]:
+            self._drop(key)
+
+    def _evict(self) -> None:
+        while self._bytes > self._max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
+
+
+# Shared by every View so frames survive tab switches and re-opens
+render_cache = RenderCache()
@@ -0,0 +1,119 @@
+import os
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional, Protocol
+
+import numpy as np
+
+from profiling import tracer
+
+# Budget for data held by all open files together, and the most files kept
+# open at once. Tabs over either limit are released, least recently used
+# first.
+DEFAULT_MEMORY_BUDGET = int(os.getenv("PYFITSEXPLORER_MEMORY_MB", "2048")) * 2**20
+DEFAULT_MAX_OPEN_FILES = int(os.getenv("PYFITSEXPLORER_MAX_OPEN_FILES", "64"))
+
+
+class Resource(Protocol):
+    @property
+    def isOpen(self) -> bool: ...
+
+    def residentBytes(self) -> int: ...
+
+    def release(self) -> None: ...
+
+
+def array_bytes(arrays: Iterable[Optional[np.ndarray]]) -> int:
+    """
+    Total size of the distinct buffers behind `arrays`, so views of one
+    array (or the same array held twice) are counted once
+    """
+    seen = set()
+    total = 0
+    for array in arrays:
+        if array is None:
+            continue
+        base = array
+        while isinstance(getattr(base, "base", None), np.ndarray):
+            base = base.base
+        if id(base) in seen:
+            continue
+        seen.add(id(base))
+        total += base.nbytes
+    return total
+
+
+class ResourceManager:
+    """
+    Keeps the data held by open files within a memory budget and the number
+    of open files within a limit.
+
+    Owners (tabs) register under a key and report their size through
+    `residentBytes()`. Each `touch` marks an owner as most recently used.
+    `enforce` releases the least recently used owners, never the one in
+    use, until both limits hold again; a released owner reopens itself when
+    it is next used.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        max_open_files: int = DEFAULT_MAX_OPEN_FILES,
+    ):
+        self.memoryBudget = memory_budget
+        self.maxOpenFiles = max_open_files
+        self._owners: OrderedDict = OrderedDict()
+        self.releases = 0
+
+    def register(self, key: Hashable, owner: Resource) -> None:
+        self._owners[key] = owner
+        self._owners.move_to_end(key)
+
+    def unregister(self, key: Hashable) -> None:
+        self._owners.pop(key, None)
+
+    def touch(self, key: Hashable) -> None:
+        if key in self._owners:
+            self._owners.move_to_end(key)
+
+    def usage(self) -> tuple:
+        """
+        (bytes held, open files) over all registered owners
+        """
+        held = 0
+        files = 0
+        for owner in self._owners.values():
+            if owner.isOpen:
+                files += 1
+                held += owner.residentBytes()
+        return held, files
+
+    def enforce(self, active: Optional[Hashable] = None) -> int:
+        """
+        Release least recently used owners other than `active` until usage
+        is within both limits. Returns the number released.
+        """
+        sizes = {
+            key: owner.residentBytes()
+            for key, owner in self._owners.items()
+            if owner.isOpen
+        }
+        held = sum(sizes.values())
+        files = len(sizes)
+        released = 0
+        for key, size in sizes.items():
+            if held <= self.memoryBudget and files <= self.maxOpenFiles:
+                break
+            if key == active:
+                continue
+            with tracer.span("release", "resources", rss=True, bytes=size):
+                self._owners[key].release()
+            held -= size
+            files -= 1
+            released += 1
+        self.releases += released
+        if released:
+            tracer.counter("resources", held_mb=held / 2**20, open_files=files)
+        return released
+
+
+resource_manager = ResourceManager()
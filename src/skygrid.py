@@ -0,0 +1,363 @@
+import math
+import warnings
+from typing import List, Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from profiling import tracer
+
+# Samples along the longer side of the whole image; the cursor readout falls
+# back to these outside the samples taken for the view
+BASE_SAMPLES = 128
+
+# Spacing of the samples over the view in screen pixels, so grid lines are
+# straight between points this far apart at any zoom
+VIEW_SAMPLE_SCREEN_PX = 24
+
+# Largest interpolation error, in image pixels, for a cell of samples to be
+# used by the readout; wide-field projections curve enough within a cell to
+# need exact evaluation
+TOLERANCE = 0.1
+
+# Grid lines across the view aimed for at each level of detail
+GRID_LINES = 5
+
+# Candidate grid spacings in degrees: arcseconds, arcminutes, degrees
+GRID_STEPS = (
+    [s / 3600 for s in (1, 2, 5, 10, 15, 30)]
+    + [m / 60 for m in (1, 2, 5, 10, 15, 30)]
+    + [1, 2, 5, 10, 15, 30, 45, 90]
+)
+
+# The same for right ascension, in seconds, minutes and hours of time
+HOUR_STEPS = (
+    [s / 240 for s in (1, 2, 5, 10, 15, 30)]
+    + [m / 4 for m in (1, 2, 5, 10, 15, 30)]
+    + [h * 15 for h in (1, 2, 3, 4, 6)]
+)
+
+# Lines of one spacing drawn at most, whatever the view
+MAX_LEVELS = 40
+
+
+def format_angle(degrees: float, hours: bool = False, decimals: int = 1) -> str:
+    """
+    Sexagesimal text of an angle: hours, minutes and seconds of right
+    ascension, or signed degrees, arcminutes and arcseconds
+    """
+    if not math.isfinite(degrees):
+        return "-"
+    value = (degrees % 360) / 15 if hours else abs(degrees)
+    total = round(value * 3600, decimals)
+    whole, seconds = divmod(total, 60)
+    units, minutes = divmod(int(whole), 60)
+    width = 3 + decimals if decimals else 2
+    text = f"{units:02d}:{minutes:02d}:{seconds:0{width}.{decimals}f}"
+    if hours:
+        return text
+    return ("-" if degrees < 0 else "+") + text
+
+
+class SkySamples:
+    """
+    World coordinates sampled exactly on a regular grid of image pixels,
+    starting at (x0, y0) every `step` pixels.
+
+    Points between samples are interpolated bilinearly, longitude unwrapped
+    around each cell so the interpolation does not jump at 0/360, in the
+    cells marked `smooth`. Grid lines are contours of the sampled
+    coordinates, so drawing them needs no further WCS evaluation.
+    """
+
+    def __init__(
+        self,
+        x0: float,
+        y0: float,
+        step: float,
+        lon: np.ndarray,
+        lat: np.ndarray,
+        smooth: Optional[np.ndarray] = None,
+    ):
+        self.x0 = x0
+        self.y0 = y0
+        self.step = step
+        self.lon = lon
+        self.lat = lat
+        self.smooth = smooth
+
+    @property
+    def rect(self) -> Tuple[float, float, float, float]:
+        """
+        Area covered as (x0, y0, x1, y1) in image pixels
+        """
+        rows, cols = self.lon.shape
+        return (
+            self.x0,
+            self.y0,
+            self.x0 + (cols - 1) * self.step,
+            self.y0 + (rows - 1) * self.step,
+        )
+
+    def covers(self, x0: float, y0: float, x1: float, y1: float) -> bool:
+        cx0, cy0, cx1, cy1 = self.rect
+        return cx0 <= x0 and cy0 <= y0 and x1 <= cx1 and y1 <= cy1
+
+    def interpolate(self, x: float, y: float) -> Optional[Tuple[float, float]]:
+        """
+        World coordinates at image pixel (x, y), or None outside the samples
+        or where a cell is not smooth enough to interpolate
+        """
+        rows, cols = self.lon.shape
+        fx = (x - self.x0) / self.step
+        fy = (y - self.y0) / self.step
+        if not (0 <= fx <= cols - 1 and 0 <= fy <= rows - 1):
+            return None
+        i = min(int(fx), cols - 2)
+        j = min(int(fy), rows - 2)
+        if self.smooth is not None and not self.smooth[j, i]:
+            return None
+        tx, ty = fx - i, fy - j
+        # Plain floats: numpy calls on a 2x2 cell cost more than the
+        # arithmetic
+        lon = self.lon[j : j + 2, i : i + 2].tolist()
+        lat = self.lat[j : j + 2, i : i + 2].tolist()
+        corners = lon[0] + lon[1]
+        if not all(map(math.isfinite, corners + lat[0] + lat[1])):
+            return None
+        offsets = [(value - corners[0] + 180) % 360 - 180 for value in corners]
+        if max(map(abs, offsets)) > 90:
+            return None
+        weights = ((1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty)
+        return (
+            (corners[0] + sum(w * o for w, o in zip(weights, offsets))) % 360,
+            sum(w * v for w, v in zip(weights, lat[0] + lat[1])),
+        )
+
+    def _pixels(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return np.stack(
+            [self.x0 + cols * self.step, self.y0 + rows * self.step], axis=-1
+        )
+
+    def _segments(
+        self, field: np.ndarray, keep: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Line segments where `field` crosses zero, found cell by cell
+        (marching squares) and returned as an (n, 2, 2) array of image
+        pixel end points. `keep` masks the cells to use.
+        """
+        a = field[:-1, :-1]
+        b = field[:-1, 1:]
+        c = field[1:, 1:]
+        d = field[1:, :-1]
+        rows, cols = np.indices(a.shape, dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Crossings on the top, right, bottom and left edges of each cell
+            crossings = [
+                (a * b < 0, rows, cols + a / (a - b)),
+                (b * c < 0, rows + b / (b - c), cols + 1),
+                (d * c < 0, rows + 1, cols + d / (d - c)),
+                (a * d < 0, rows + a / (a - d), cols),
+            ]
+        crosses = np.stack([mask for mask, _, _ in crossings])
+        if keep is not None:
+            crosses &= keep
+        # (edge, row, col, xy)
+        points = np.stack([self._pixels(r, c) for _, r, c in crossings])
+        count = crosses.sum(axis=0)
+        # Crossed edges of each cell first, in edge order
+        order = np.argsort(~crosses, axis=0, kind="stable")
+        ends = np.take_along_axis(points, order[..., np.newaxis], axis=0)
+        segments = [np.stack([ends[0], ends[1]], axis=-2)[count >= 2]]
+        # A saddle cell is crossed on all four edges and holds two segments
+        segments.append(np.stack([ends[2], ends[3]], axis=-2)[count == 4])
+        return np.concatenate(segments)
+
+    def latitudeLines(self, spacing: float) -> List[Tuple[float, np.ndarray]]:
+        lat = self.lat
+        finite = lat[np.isfinite(lat)]
+        if finite.size == 0:
+            return []
+        first = math.ceil(max(-90.0, finite.min()) / spacing)
+        last = math.floor(min(90.0, finite.max()) / spacing)
+        lines = []
+        for k in range(first, min(last, first + MAX_LEVELS) + 1):
+            level = k * spacing
+            segments = self._segments(lat - level)
+            if len(segments):
+                lines.append((level, segments))
+        return lines
+
+    def longitudeLines(self, spacing: float) -> List[Tuple[float, np.ndarray]]:
+        lon = self.lon
+        finite = lon[np.isfinite(lon)]
+        if finite.size == 0:
+            return []
+        # Longitudes relative to a reference, so a range across 0/360 is
+        # one interval
+        reference = float(finite.flat[0])
+        offsets = (finite - reference + 180) % 360 - 180
+        first = math.ceil((reference + offsets.min()) / spacing)
+        last = math.floor((reference + offsets.max()) / spacing)
+        lines = []
+        radians = np.radians(lon)
+        for k in range(first, min(last, first + MAX_LEVELS) + 1):
+            level = (k * spacing) % 360
+            # Zeros of sin(lon - level) are the line and the one opposite
+            # it, told apart by the cosine
+            delta = radians - math.radians(level)
+            near = np.cos(delta) > 0
+            keep = near[:-1, :-1] & near[:-1, 1:] & near[1:, 1:] & near[1:, :-1]
+            segments = self._segments(np.sin(delta), keep)
+            if len(segments):
+                lines.append((level, segments))
+        return lines
+
+
+def grid_spacing(extent: float, hours: bool = False) -> float:
+    """
+    The grid step giving about `GRID_LINES` lines over `extent` degrees
+    """
+    steps = HOUR_STEPS if hours else GRID_STEPS
+    target = extent / GRID_LINES
+    for step in steps:
+        if step >= target:
+            return step
+    return steps[-1]
+
+
+class SkyWcs:
+    """
+    The celestial WCS of an image HDU, built once, with a coarse set of
+    samples over the whole image for fast approximate lookups.
+
+    `exact` evaluates the full transform (distortions included) for one
+    point; `sample` evaluates a grid of points in one vectorized call for
+    the interpolated readout and the grid overlay.
+    """
+
+    def __init__(self, header: fits.Header, shape: Tuple[int, int]):
+        from astropy.wcs import WCS, FITSFixedWarning
+        from astropy.wcs.utils import proj_plane_pixel_scales
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FITSFixedWarning)
+            wcs = WCS(header)
+        if not wcs.has_celestial:
+            raise ValueError("no celestial WCS")
+        self._wcs = wcs.celestial
+        self.shape = shape
+        ctype = self._wcs.wcs.ctype[0].upper()
+        # Right ascension is read in hours; galactic and ecliptic longitudes
+        # in degrees
+        self.hours = ctype.startswith("RA")
+        names = {"RA": ("RA", "Dec"), "GL": ("l", "b"), "EL": ("λ", "β")}
+        self.names = names.get(ctype[:2], (ctype.split("-")[0], "lat"))
+        # Mean size of a pixel on the sky in degrees, to space the grid
+        self.pixelScale = float(np.mean(proj_plane_pixel_scales(self._wcs)))
+
+        height, width = shape
+        step = max(1.0, max(shape) / BASE_SAMPLES)
+        self.base = self.sample(0, 0, width - 1, height - 1, step)
+
+    def exact(self, x: float, y: float) -> Tuple[float, float]:
+        lon, lat = self._wcs.all_pix2world([[x, y]], 0)[0]
+        return float(lon), float(lat)
+
+    def sample(
+        self, x0: float, y0: float, x1: float, y1: float, step: float
+    ) -> SkySamples:
+        """
+        Evaluate the samples covering image pixels [x0, x1] x [y0, y1], and
+        the cell centres to find the cells that interpolate within
+        `TOLERANCE`
+        """
+        cols = max(2, math.ceil((x1 - x0) / step) + 1)
+        rows = max(2, math.ceil((y1 - y0) / step) + 1)
+        xs = x0 + np.arange(cols) * step
+        ys = y0 + np.arange(rows) * step
+        with tracer.span("wcs sample", "wcs", points=cols * rows):
+            lon, lat = self._evaluate(*np.meshgrid(xs, ys))
+            mid_lon, mid_lat = self._evaluate(
+                *np.meshgrid(xs[:-1] + step / 2, ys[:-1] + step / 2)
+            )
+        with np.errstate(invalid="ignore"):
+            corners = [lon[:-1, :-1], lon[:-1, 1:], lon[1:, :-1], lon[1:, 1:]]
+            offsets = [(c - corners[0] + 180) % 360 - 180 for c in corners]
+            error_lon = (corners[0] + sum(offsets) / 4 - mid_lon + 180) % 360 - 180
+            error_lat = (lat[:-1, :-1] + lat[:-1, 1:] + lat[1:, :-1] + lat[1:, 1:]) / 4
+            error_lat -= mid_lat
+            error = np.hypot(error_lon * np.cos(np.radians(mid_lat)), error_lat)
+            smooth = (error < TOLERANCE * self.pixelScale) & (
+                np.max(np.abs(offsets), axis=0) <= 90
+            )
+        return SkySamples(x0, y0, step, lon, lat, smooth)
+
+    def _evaluate(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return self._wcs.all_pix2world(x, y, 0)
+
+    def gridLines(
+        self, samples: SkySamples, extent: float
+    ) -> List[Tuple[bool, float, np.ndarray]]:
+        """
+        Grid lines through `samples` as (is longitude, level, segments),
+        spaced for a view `extent` degrees across. Longitude lines are
+        spaced wider away from the equator, where they converge.
+        """
+        with tracer.span("wcs grid", "wcs", points=samples.lon.size):
+            lat = samples.lat[np.isfinite(samples.lat)]
+            if lat.size == 0:
+                return []
+            squeeze = max(math.cos(math.radians(float(np.median(lat)))), 1e-3)
+            lon_spacing = grid_spacing(extent / squeeze, self.hours)
+            return [
+                (True, level, segments)
+                for level, segments in samples.longitudeLines(lon_spacing)
+            ] + [
+                (False, level, segments)
+                for level, segments in samples.latitudeLines(grid_spacing(extent))
+            ]
+
+    def label(self, longitude: bool, level: float) -> str:
+        if longitude:
+            return format_angle(level, self.hours, 0)
+        return format_angle(level, False, 0)
+
+    def format(self, lon: float, lat: float, decimals: int = 2) -> str:
+        return (
+            f"{self.names[0]} {format_angle(lon, self.hours, decimals)} "
+            f"{self.names[1]} {format_angle(lat, False, max(0, decimals - 1))}"
+        )
+
+
+class WcsSignals(QObject):
+    # job id, SkyWcs
+    ready = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class WcsJob(QRunnable):
+    """
+    Build the `SkyWcs` of an image HDU on a pool thread. The first build
+    also imports astropy.wcs.
+    """
+
+    def __init__(self, job_id: int, header: fits.Header, shape: Tuple[int, int]):
+        super().__init__()
+        self.job_id = job_id
+        self.signals = WcsSignals()
+        self._header = header
+        self._shape = shape
+
+    def run(self) -> None:
+        try:
+            with tracer.span("wcs build", "wcs"):
+                sky = SkyWcs(self._header, self._shape)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+            return
+        self.signals.ready.emit(self.job_id, sky)
@@ -0,0 +1,269 @@
+import math
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+INTERVALS = ("minmax", "zscale", "percentile")
+TRANSFERS = ("linear", "sqrt", "log", "asinh")
+
+# Number of pixels used to estimate limits
+SAMPLE_SIZE = 250_000
+
+# Float images are quantized to this many levels between the limits
+LUT_SIZE = 65536
+
+# Rows processed at a time when quantizing, to bound float32 temporaries
+ROW_CHUNK = 256
+
+
+class Stretch:
+    """
+    Display stretch: an interval that picks the limits and a transfer
+    function applied between them
+    """
+
+    def __init__(
+        self,
+        interval: str = "minmax",
+        transfer: str = "linear",
+        percentile: float = 99.5,
+        log_a: float = 1000.0,
+        asinh_a: float = 0.1,
+    ):
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown stretch interval: {interval}")
+        if transfer not in TRANSFERS:
+            raise ValueError(f"Unknown stretch transfer: {transfer}")
+        self.interval = interval
+        self.transfer = transfer
+        self.percentile = percentile
+        self.log_a = log_a
+        self.asinh_a = asinh_a
+
+    @property
+    def intervalKey(self) -> tuple:
+        if self.interval == "percentile":
+            return (self.interval, self.percentile)
+        return (self.interval,)
+
+    @property
+    def key(self) -> tuple:
+        return (*self.intervalKey, self.transfer, self.log_a, self.asinh_a)
+
+    def curve(self, x: np.ndarray) -> np.ndarray:
+        """
+        Apply the transfer function to values in [0, 1], in place
+        """
+        match self.transfer:
+            case "sqrt":
+                np.sqrt(x, out=x)
+            case "log":
+                x *= self.log_a
+                np.log1p(x, out=x)
+                x /= math.log1p(self.log_a)
+            case "asinh":
+                x /= self.asinh_a
+                np.arcsinh(x, out=x)
+                x /= math.asinh(1 / self.asinh_a)
+        return x
+
+
+def sample_finite(data: np.ndarray, size: int = SAMPLE_SIZE) -> np.ndarray:
+    """
+    Return a strided subsample of the finite values of `data`
+    """
+    step = max(1, int(math.sqrt(data.size / size))) if data.size > size else 1
+    if data.ndim >= 2:
+        sample = data[..., ::step, ::step]
+    else:
+        sample = data[::step * step]
+    sample = np.asarray(sample).ravel()
+    if sample.dtype.kind == "f":
+        sample = sample[np.isfinite(sample)]
+    return sample
+
+
+def compute_limits(data: np.ndarray, stretch: Stretch) -> Tuple[float, float]:
+    """
+    Estimate display limits for `data` from a subsample
+    """
+    # astropy.visualization pulls in astropy.units and astropy.time, so it
+    # is imported on first use rather than at startup
+    from astropy.visualization import PercentileInterval, ZScaleInterval
+
+    sample = sample_finite(data)
+    if sample.size == 0:
+        return 0.0, 0.0
+
+    match stretch.interval:
+        case "zscale":
+            lo, hi = ZScaleInterval().get_limits(sample)
+        case "percentile":
+            lo, hi = PercentileInterval(stretch.percentile).get_limits(sample)
+        case _:
+            lo, hi = sample.min(), sample.max()
+            if sample.size < data.size:
+                # Min/max must not miss extremes the sample skipped; fmin/fmax
+                # reductions run without temporaries and skip NaNs
+                full_lo = np.fmin.reduce(data, axis=None)
+                full_hi = np.fmax.reduce(data, axis=None)
+                if np.isfinite(full_lo) and np.isfinite(full_hi):
+                    lo, hi = full_lo, full_hi
+    return float(lo), float(hi)
+
+
+class StretchEngine:
+    """
+    Maps one image to 8 bits for any `Stretch`.
+
+    The image is turned once into an index array and every stretch becomes a
+    lookup table applied to it. Integer images with at most `LUT_SIZE`
+    distinct levels are indexed by value, so no stretch change ever touches
+    the source again. Float images are quantized between the current limits
+    in float32 row chunks; changing only the transfer function re-maps the
+    LUT, changing the limits re-quantizes.
+    """
+
+    def __init__(self, data: np.ndarray):
+        self._data = data
+        self._lock = threading.Lock()
+        self._limits: dict = {}
+        self._index: Optional[np.ndarray] = None
+        self._index_limits: Optional[Tuple[float, float]] = None
+
+        # Integer data with few enough levels is indexed directly by value
+        self._base: Optional[int] = None
+        if data.dtype.kind in "iu" and data.size:
+            lo, hi = int(data.min()), int(data.max())
+            if data.dtype.kind == "u" and data.dtype.itemsize <= 2:
+                lo = 0
+            if hi - lo < LUT_SIZE:
+                self._base = lo
+                self._span = hi - lo + 1
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+
+    @property
+    def index(self) -> Optional[np.ndarray]:
+        """
+        The per-pixel lookup index built for re-stretching, if any
+        """
+        return self._index
+
+    def limits(self, stretch: Stretch) -> Tuple[float, float]:
+        key = stretch.intervalKey
+        if key not in self._limits:
+            self._limits[key] = compute_limits(self._data, stretch)
+        return self._limits[key]
+
+    def render(
+        self, stretch: Stretch, limits: Optional[Tuple[float, float]] = None
+    ) -> np.ndarray:
+        """
+        Map the image to 8 bits. `limits` overrides the limits estimated
+        from this image, e.g. to share one stretch across a cube.
+        """
+        with self._lock:
+            lo, hi = limits if limits is not None else self.limits(stretch)
+            if self._base is not None:
+                return self._renderByValue(stretch, lo, hi)
+            return self._renderQuantized(stretch, lo, hi)
+
+    def _renderByValue(self, stretch: Stretch, lo: float, hi: float) -> np.ndarray:
+        if self._index is None:
+            self._index = self._valueIndex()
+        values = np.arange(self._base, self._base + self._span, dtype=np.float32)
+        return self._lut(stretch, values, lo, hi)[self._index]
+
+    def _valueIndex(self) -> np.ndarray:
+        """
+        Offset the image so its values index the LUT. 8 and 16 bit unsigned
+        images are used as they are.
+        """
+        data = self._data
+        if self._base == 0 and data.dtype.kind == "u" and data.dtype.itemsize <= 2:
+            return data
+        out = np.empty(data.shape, dtype=np.uint16)
+        rows, flat_out = self._rows(data), out.reshape(-1, data.shape[-1])
+        for r in range(0, rows.shape[0], ROW_CHUNK):
+            flat_out[r : r + ROW_CHUNK] = rows[r : r + ROW_CHUNK] - self._base
+        return out
+
+    @staticmethod
+    def _rows(data: np.ndarray) -> np.ndarray:
+        return data.reshape(-1, data.shape[-1]) if data.ndim > 1 else data[None]
+
+    def _renderQuantized(self, stretch: Stretch, lo: float, hi: float) -> np.ndarray:
+        if self._index_limits != (lo, hi):
+            self._index = self._quantize(lo, hi)
+            self._index_limits = (lo, hi)
+        levels = np.linspace(0, 1, LUT_SIZE, dtype=np.float32)
+        return self._lut(stretch, levels, 0.0, 1.0)[self._index]
+
+    def _quantize(self, lo: float, hi: float) -> np.ndarray:
+        """
+        Quantize the image to uint16 levels between `lo` and `hi`. NaNs go to
+        level 0.
+        """
+        data = self._data
+        out = np.empty(data.shape, dtype=np.uint16)
+        scale = (LUT_SIZE - 1) / (hi - lo) if hi > lo else 0.0
+        rows = self._rows(data)
+        flat_out = out.reshape(rows.shape)
+        for r in range(0, rows.shape[0], ROW_CHUNK):
+            block = rows[r : r + ROW_CHUNK].astype(np.float32)
+            block -= lo
+            block *= scale
+            np.clip(block, 0, LUT_SIZE - 1, out=block)
+            np.nan_to_num(block, copy=False, nan=0.0)
+            flat_out[r : r + ROW_CHUNK] = block
+        return out
+
+    @staticmethod
+    def _lut(stretch: Stretch, values: np.ndarray, lo: float, hi: float) -> np.ndarray:
+        """
+        Build the 8-bit lookup table for `values` under `stretch`
+        """
+        if hi > lo:
+            values -= lo
+            values *= 1 / (hi - lo)
+            np.clip(values, 0, 1, out=values)
+        else:
+            values[:] = 0
+        stretch.curve(values)
+        values *= 255
+        values += 0.5
+        return values.astype(np.uint8)
+
+
+def stretch_rows16(
+    rows: np.ndarray, stretch: Stretch, limits: Tuple[float, float]
+) -> np.ndarray:
+    """
+    Map rows of an image to 16 bits with `stretch` between `limits`. Unlike
+    `StretchEngine`, values are not quantized through a LUT first, so the
+    output keeps the full 16 bit precision. NaNs go to 0.
+    """
+    lo, hi = limits
+    values = np.array(rows, dtype=np.float32)
+    if hi > lo:
+        values -= lo
+        values *= 1 / (hi - lo)
+        np.clip(values, 0, 1, out=values)
+    else:
+        values[:] = 0
+    np.nan_to_num(values, copy=False, nan=0.0)
+    stretch.curve(values)
+    values *= 65535
+    values += 0.5
+    return values.astype(np.uint16)
+
+
+def stretch_image(data: np.ndarray, stretch: Optional[Stretch] = None) -> np.ndarray:
+    """
+    One-shot 8-bit rendering of `data` with `stretch` (linear min/max by default)
+    """
+    return StretchEngine(data).render(stretch or Stretch())
@@ -0,0 +1,221 @@
+import math
+import os
+import re
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+
+from stretch import SAMPLE_SIZE
+
+# Keywords describing the layout of the stored data rather than what it shows
+STRUCTURAL = {
+    "SIMPLE",
+    "XTENSION",
+    "BITPIX",
+    "EXTEND",
+    "PCOUNT",
+    "GCOUNT",
+    "BSCALE",
+    "BZERO",
+    "BLANK",
+    "CHECKSUM",
+    "DATASUM",
+    "END",
+}
+
+# Reference pixel keywords of the two image axes, in any alternate WCS, and
+# IRAF's physical offsets; shifted when an image is cut out
+_ORIGIN = re.compile(r"^(CRPIX|LTV)([12])([A-Z]?)$")
+
+FITS_BLOCK = 2880
+
+_BITPIX = {"u1": 8, "i2": 16, "i4": 32, "i8": 64, "f4": -32, "f8": -64}
+
+
+class ImageSource:
+    """
+    One image to read: an image HDU of a file, and the plane of a cube
+    """
+
+    def __init__(
+        self,
+        path: str,
+        hdu: int,
+        shape: Tuple[int, ...],
+        plane: int = 0,
+        label: str = "",
+    ):
+        self.path = path
+        self.hdu = hdu
+        self.shape = tuple(shape[-2:])
+        self.leadShape = tuple(shape[:-2])
+        self.plane = plane
+        self.label = label or f"{os.path.basename(path)}[{hdu}]"
+
+
+class ImageReader:
+    """
+    Strips of rows of an `ImageSource`, read through a file handle of its
+    own so the tab showing the image can close its file meanwhile.
+
+    Data is read unscaled and scaled a strip at a time. Uncompressed images
+    are memory mapped, which lets any number of threads read them at once
+    without loading the whole image. Tile-compressed images are read
+    through `hdu.section`, decompressing only the tiles a strip falls in.
+    """
+
+    def __init__(self, source: ImageSource):
+        self.source = source
+        self._hdul = fits.open(source.path, memmap=True, do_not_scale_image_data=True)
+        self._hdu = self._hdul[source.hdu]
+        self.header = self._hdu.header
+        self._lead = (
+            tuple(int(n) for n in np.unravel_index(source.plane, source.leadShape))
+            if source.leadShape
+            else ()
+        )
+        self._compressed = isinstance(self._hdu, fits.CompImageHDU)
+        # hdu.section seeks and reads on a shared file handle
+        self._lock = threading.Lock()
+        if self._compressed:
+            self._raw = None
+        else:
+            raw = self._hdu.data
+            self._raw = raw[self._lead] if self._lead else raw
+        self._scale = float(self.header.get("BSCALE", 1.0))
+        self._zero = float(self.header.get("BZERO", 0.0))
+        self._blank = self.header.get("BLANK")
+
+    def raw(
+        self, y0: int, y1: int, x0: int = 0, x1: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Values of data[y0:y1, x0:x1] as stored, before the scaling given by
+        `scaling`
+        """
+        if self._compressed:
+            with self._lock:
+                return self._hdu.section[(*self._lead, slice(y0, y1), slice(x0, x1))]
+        return self._raw[y0:y1, x0:x1]
+
+    @property
+    def scaling(self) -> fits.Header:
+        """
+        The BSCALE, BZERO and BLANK cards that apply to `raw` values
+        """
+        header = fits.Header()
+        for keyword in ("BSCALE", "BZERO", "BLANK"):
+            if keyword in self.header:
+                header[keyword] = self.header[keyword]
+        return header
+
+    def rows(
+        self, y0: int, y1: int, x0: int = 0, x1: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Physical values of data[y0:y1, x0:x1] as float32, with BLANK pixels
+        as NaN
+        """
+        raw = self.raw(y0, y1, x0, x1)
+        rows = raw.astype(np.float32)
+        if self._scale != 1.0 or self._zero != 0.0:
+            rows *= self._scale
+            rows += self._zero
+        if self._blank is not None and raw.dtype.kind in "iu":
+            rows[raw == self._blank] = np.nan
+        return rows
+
+    def sample(self, size: int = SAMPLE_SIZE) -> np.ndarray:
+        """
+        About `size` values on a regular grid over the image, read row by
+        row
+        """
+        height, width = self.source.shape
+        step = max(1, int(math.sqrt(height * width / size)))
+        return np.concatenate(
+            [self.rows(y, y + 1)[0, ::step] for y in range(0, height, step)]
+        )
+
+    def close(self) -> None:
+        self._raw = None
+        self._hdul.close()
+
+
+def image_header(
+    source: fits.Header,
+    shape: Tuple[int, int],
+    bitpix: int,
+    origin: Tuple[int, int] = (0, 0),
+) -> fits.Header:
+    """
+    Primary header for a 2D image of `shape` keeping the keywords of
+    `source` (WCS, date, instrument) under a new data layout. `origin` is
+    the (x, y) pixel of the source at which the new image starts, and moves
+    the WCS reference pixel to match.
+    """
+    header = fits.Header()
+    header["SIMPLE"] = True
+    header["BITPIX"] = bitpix
+    header["NAXIS"] = 2
+    header["NAXIS1"] = shape[1]
+    header["NAXIS2"] = shape[0]
+    compressed = source.get("ZIMAGE", False)
+    for card in source.cards:
+        keyword = card.keyword
+        if (
+            not keyword
+            or keyword in STRUCTURAL
+            or keyword.startswith("NAXIS")
+            or (compressed and keyword.startswith("Z"))
+        ):
+            continue
+        match = _ORIGIN.match(keyword)
+        if match and any(origin):
+            shift = origin[int(match.group(2)) - 1]
+            header.append((keyword, card.value - shift, card.comment))
+            continue
+        header.append(card)
+    return header
+
+
+def storage(dtype: np.dtype) -> Tuple[np.dtype, int, int]:
+    """
+    Big-endian dtype, BITPIX and BZERO storing values of `dtype` in FITS.
+    Unsigned integers wider than a byte are stored signed with an offset.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == "u" and dtype.itemsize > 1:
+        signed = np.dtype(f">i{dtype.itemsize}")
+        return signed, _BITPIX[signed.str[1:]], 1 << (8 * dtype.itemsize - 1)
+    if dtype.kind == "b":
+        dtype = np.dtype("u1")
+    stored = dtype.newbyteorder(">") if dtype.itemsize > 1 else dtype
+    return stored, _BITPIX[stored.str[1:]], 0
+
+
+def to_storage(values: np.ndarray, stored: np.dtype) -> np.ndarray:
+    """
+    `values` converted to the `stored` dtype chosen by `storage`
+    """
+    if values.dtype.kind == "u" and values.dtype.itemsize > 1:
+        bits = 8 * values.dtype.itemsize
+        values = values ^ values.dtype.type(1 << (bits - 1))
+        return values.view(f"i{values.dtype.itemsize}").astype(stored)
+    return values.astype(stored)
+
+
+def create_fits(
+    path: str, header: fits.Header, shape: Tuple[int, int], dtype: np.dtype
+) -> np.memmap:
+    """
+    Write `header` and space for its data, padded to whole FITS blocks, and
+    map the data for writing, so an image can be filled a strip at a time
+    """
+    header.tofile(path, overwrite=True)
+    offset = os.path.getsize(path)
+    size = shape[0] * shape[1] * np.dtype(dtype).itemsize
+    with open(path, "r+b") as f:
+        f.truncate(offset + size + (-size % FITS_BLOCK))
+    return np.memmap(path, dtype=dtype, mode="r+", offset=offset, shape=shape)
@@ -0,0 +1,318 @@
+import ast
+import io
+import threading
+import tokenize
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class QueryError(Exception):
+    pass
+
+
+class ColumnStats:
+    def __init__(
+        self,
+        count: int,
+        nan_count: int,
+        lo,
+        hi,
+        mean: float,
+        finite_lo=None,
+        finite_hi=None,
+    ):
+        self.count = count
+        self.nan_count = nan_count
+        self.min = lo
+        self.max = hi
+        self.mean = mean
+        # Range of the finite values, without infinities
+        self.finite_min = lo if finite_lo is None else finite_lo
+        self.finite_max = hi if finite_hi is None else finite_hi
+
+    def __str__(self) -> str:
+        return (
+            f"min {self.min:.6g}, max {self.max:.6g}, mean {self.mean:.6g}, "
+            f"NaN {self.nan_count} of {self.count}"
+        )
+
+
+# Functions allowed in filter expressions
+FUNCTIONS = {
+    "abs": np.abs,
+    "isnan": np.isnan,
+    "isfinite": np.isfinite,
+    "log10": np.log10,
+    "sqrt": np.sqrt,
+}
+
+_BINOPS = {
+    ast.BitXor: np.logical_xor,
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+}
+
+_COMPARISONS = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+class TableQuery:
+    """
+    Sorting, filtering and column summaries over a FITS_rec.
+
+    Columns are converted once on first use and kept, as are their argsort
+    orders and summaries. Every query result is an array of row indices into
+    the original table (a permutation, a mask's nonzero rows, or both), so
+    the table itself is never copied or reordered.
+
+    Filter expressions combine columns with comparisons, arithmetic and
+    `&`, `|`, `~`, e.g. ``MAG < 18 & FLAG == 0``. As in pandas queries the
+    logical operators bind looser than comparisons, and `and`/`or`/`not`
+    are accepted for them. Column names are matched case-insensitively.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._names = {name.upper(): name for name in data.names}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._orders: Dict[str, np.ndarray] = {}
+        self._stats: Dict[str, ColumnStats] = {}
+        self._masks: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def arrays(self) -> List[np.ndarray]:
+        """
+        The columns, orders and mask kept by the query
+        """
+        return [
+            *self._columns.values(),
+            *self._orders.values(),
+            *self._masks.values(),
+        ]
+
+    def columnName(self, name: str) -> str:
+        try:
+            return self._names[name.upper()]
+        except KeyError:
+            raise QueryError(f"No column named {name}") from None
+
+    def numericColumns(self) -> List[str]:
+        """
+        Names of the scalar numeric columns
+        """
+        dtype = self._data.dtype
+        return [
+            name
+            for name in self._data.names
+            if dtype[name].kind in "iuf" and dtype[name].shape == ()
+        ]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Column `name` as a plain array: numeric columns in native byte
+        order, which numpy sorts and compares several times faster than
+        FITS big-endian data, and string columns as their raw bytes, which
+        skips FITS_rec's per-row decoding to str
+        """
+        name = self.columnName(name)
+        values = self._columns.get(name)
+        if values is None:
+            raw = self._data.view(np.ndarray)[name]
+            if raw.dtype.kind == "S" and raw.ndim == 1:
+                values = raw
+                # FITS pads strings with spaces, numpy only ignores NULs
+                if values.size and np.any(np.char.endswith(values, b" ")):
+                    values = np.char.rstrip(values)
+            else:
+                values = np.asarray(self._data.field(name))
+                if values.dtype.kind in "iuf" and not values.dtype.isnative:
+                    values = values.astype(values.dtype.newbyteorder("="))
+            self._columns[name] = values
+        return values
+
+    def _scalarColumn(self, name: str, operation: str) -> np.ndarray:
+        """
+        Column `name`, which `operation` ("sorted", "filtered") needs to
+        hold one value per row
+        """
+        values = self.column(name)
+        if values.ndim != 1:
+            raise QueryError(f"Column {name} holds arrays and cannot be {operation}")
+        return values
+
+    def order(self, name: str) -> np.ndarray:
+        """
+        Row indices sorting column `name` in ascending order; NaNs go last
+        """
+        name = self.columnName(name)
+        with self._lock:
+            order = self._orders.get(name)
+            if order is None:
+                values = self._scalarColumn(name, "sorted")
+                if values.dtype.kind == "f":
+                    # argsort is several times slower on data holding NaNs,
+                    # so only the other rows are sorted
+                    nan = np.isnan(values)
+                    rows = np.flatnonzero(~nan)
+                    order = rows[np.argsort(values[rows])]
+                    order = np.concatenate([order, np.flatnonzero(nan)])
+                else:
+                    order = np.argsort(values)
+                self._orders[name] = order
+        return order
+
+    def mask(self, expression: str) -> np.ndarray:
+        """
+        Evaluate a filter expression to a boolean row mask
+        """
+        expression = expression.strip()
+        mask = self._masks.get(expression)
+        if mask is not None:
+            return mask
+        try:
+            tree = ast.parse(_logical_operators(expression), mode="eval")
+        except (SyntaxError, tokenize.TokenError) as e:
+            raise QueryError(f"Invalid filter: {e.args[0]}") from None
+        try:
+            with np.errstate(all="ignore"):
+                mask = np.asarray(self._eval(tree.body))
+        except (TypeError, ValueError) as e:
+            # numpy's errors for operands that do not fit, e.g. a string
+            # column compared to a number (UFuncTypeError is a TypeError)
+            raise QueryError(f"Invalid filter: {e}") from None
+        if mask.dtype != bool or mask.shape != (len(self),):
+            raise QueryError("Filter must be a comparison on scalar columns")
+        self._masks = {expression: mask}
+        return mask
+
+    def rows(
+        self,
+        sort: Optional[str] = None,
+        descending: bool = False,
+        expression: str = "",
+    ) -> Optional[np.ndarray]:
+        """
+        Row indices of the sorted and filtered view, or None when the view is
+        the table as it is
+        """
+        mask = self.mask(expression) if expression.strip() else None
+        if sort is None:
+            return None if mask is None else np.flatnonzero(mask)
+
+        order = self.order(sort)
+        if descending:
+            order = order[::-1]
+        if mask is not None:
+            order = order[mask[order]]
+        return order
+
+    def stats(self, name: str) -> ColumnStats:
+        name = self.columnName(name)
+        stats = self._stats.get(name)
+        if stats is not None:
+            return stats
+
+        values = self.column(name)
+        if values.dtype.kind not in "iufb":
+            raise QueryError(f"Column {name} is not numeric")
+        count = values.size
+        if count == 0:
+            # Reductions have no identity for min/max on an empty table
+            return ColumnStats(0, 0, np.nan, np.nan, np.nan)
+        if values.dtype.kind == "f":
+            nan_count = int(np.count_nonzero(np.isnan(values)))
+            # fmin/fmax skip NaNs without making a filtered copy
+            lo = np.fmin.reduce(values, axis=None)
+            hi = np.fmax.reduce(values, axis=None)
+            finite = values[np.isfinite(values)]
+            if finite.size:
+                mean = float(finite.mean(dtype=np.float64))
+                finite_lo, finite_hi = finite.min(), finite.max()
+            else:
+                mean = finite_lo = finite_hi = np.nan
+        else:
+            nan_count = 0
+            lo, hi = values.min(), values.max()
+            finite_lo, finite_hi = lo, hi
+            mean = float(values.mean(dtype=np.float64))
+        stats = ColumnStats(count, nan_count, lo, hi, mean, finite_lo, finite_hi)
+        self._stats[name] = stats
+        return stats
+
+    def _eval(self, node: ast.AST):
+        match node:
+            case ast.Name(id=name):
+                if name.upper() in self._names:
+                    return self._scalarColumn(name, "filtered")
+                raise QueryError(f"No column named {name}")
+            case ast.Constant(value=value) if isinstance(value, (int, float, str)):
+                return value
+            case ast.BinOp(left=left, op=op, right=right) if type(op) in _BINOPS:
+                return _BINOPS[type(op)](self._eval(left), self._eval(right))
+            case ast.BoolOp(op=ast.And(), values=values):
+                return np.logical_and.reduce([self._eval(v) for v in values])
+            case ast.BoolOp(op=ast.Or(), values=values):
+                return np.logical_or.reduce([self._eval(v) for v in values])
+            case ast.UnaryOp(op=ast.Invert() | ast.Not(), operand=operand):
+                return np.logical_not(self._eval(operand))
+            case ast.UnaryOp(op=ast.USub(), operand=operand):
+                return np.negative(self._eval(operand))
+            case ast.Compare(left=left, ops=ops, comparators=comparators):
+                # Chained comparisons such as 10 < MAG < 18
+                result = None
+                lhs = self._eval(left)
+                for op, comparator in zip(ops, comparators):
+                    if type(op) not in _COMPARISONS:
+                        raise QueryError("Unsupported comparison")
+                    rhs = self._eval(comparator)
+                    part = _COMPARISONS[type(op)](*_match_strings(lhs, rhs))
+                    result = part if result is None else np.logical_and(result, part)
+                    lhs = rhs
+                return result
+            case ast.Call(func=ast.Name(id=func), args=args) if func in FUNCTIONS:
+                return FUNCTIONS[func](*[self._eval(a) for a in args])
+        raise QueryError(f"Unsupported filter syntax: {ast.unparse(node)}")
+
+
+def _match_strings(lhs, rhs):
+    """
+    Encode a str constant compared against a bytes column
+    """
+    if isinstance(rhs, str) and getattr(lhs, "dtype", None) is not None:
+        if lhs.dtype.kind == "S":
+            rhs = rhs.encode()
+    if isinstance(lhs, str) and getattr(rhs, "dtype", None) is not None:
+        if rhs.dtype.kind == "S":
+            lhs = lhs.encode()
+    return lhs, rhs
+
+
+_LOGICAL = {"&": "and", "|": "or", "~": "not"}
+
+
+def _logical_operators(expression: str) -> str:
+    """
+    Rewrite `&`, `|` and `~` as `and`, `or` and `not`, which Python parses
+    with lower precedence than comparisons, so `A < 1 & B == 0` groups as
+    `(A < 1) and (B == 0)`
+    """
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(expression).readline):
+        if tok.type == tokenize.OP and tok.string in _LOGICAL:
+            tok = (tokenize.NAME, _LOGICAL[tok.string])
+        else:
+            tok = (tok.type, tok.string)
+        tokens.append(tok)
+    return tokenize.untokenize(tokens)
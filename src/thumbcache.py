@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+from typing import Optional
+
+from PyQt6.QtGui import QImage
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "pyfitsexplorer", "thumbnails")
+
+
+class ThumbnailCache:
+    """
+    Persistent on-disk cache of thumbnail PNGs.
+
+    An entry is keyed by the absolute path, byte size and mtime of the FITS
+    file plus the thumbnail size and stretch, so an edited file simply misses
+    and its old entry ages out. Hits refresh the entry's mtime; once the
+    directory grows past `max_bytes` the least recently used entries are
+    deleted. Safe to use from several worker threads.
+    """
+
+    def __init__(
+        self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.directory = directory or default_cache_dir()
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _entryPath(self, path: str, size: int, stretch: tuple) -> Optional[str]:
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = f"{path}\0{st.st_size}\0{st.st_mtime_ns}\0{size}\0{stretch}"
+        digest = hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".png")
+
+    def get(self, path: str, size: int, stretch: tuple = ()) -> Optional[QImage]:
+        entry = self._entryPath(path, size, stretch)
+        image = QImage(entry) if entry and os.path.exists(entry) else QImage()
+        with self._lock:
+            if image.isNull():
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return image
+
+    def put(self, path: str, size: int, image: QImage, stretch: tuple = ()) -> None:
+        entry = self._entryPath(path, size, stretch)
+        if entry is None:
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Write under a temporary name so readers never see a partial PNG
+        tmp = f"{entry}.{threading.get_ident()}.tmp"
+        if not image.save(tmp, "PNG"):
+            return
+        size = os.path.getsize(tmp)
+
+        with self._lock:
+            # An entry already there, e.g. written by another thread, is replaced
+            try:
+                replaced = os.path.getsize(entry)
+            except OSError:
+                replaced = 0
+            os.replace(tmp, entry)
+            if self._bytes is None:
+                self._bytes = self._scan()
+            else:
+                self._bytes += size - replaced
+            if self._bytes > self._max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for dirpath, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".png"):
+                    yield os.path.join(dirpath, name)
+
+    def _scan(self) -> int:
+        total = 0
+        for entry in self._entries():
+            try:
+                total += os.path.getsize(entry)
+            except OSError:
+                pass
+        return total
+
+    def _evict(self) -> None:
+        """
+        Delete least recently used entries until the cache is back under
+        90% of its budget, so eviction does not run on every insert
+        """
+        entries = []
+        for entry in self._entries():
+            try:
+                st = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self._max_bytes * 0.9
+        for _, size, entry in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(entry)
+                total -= size
+            except OSError:
+                pass
+        self._bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in list(self._entries()):
+                try:
+                    os.remove(entry)
+                except OSError:
+                    pass
+            self._bytes = 0
+
+    def setMaxBytes(self, max_bytes: int) -> None:
+        with self._lock:
+            self._max_bytes = max_bytes
+            if self._bytes is not None and self._bytes > max_bytes:
+                self._evict()
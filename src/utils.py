@@ -1,35 +1,87 @@
-from astropy.io import fits
+from typing import Optional
+
 import numpy as np
+from astropy.io import fits
+from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QImage, QPixmap
 import os
 
+from compressed import CompressedImage
+from hduindex import HDUType, build_hdu_index
+from stretch import Stretch, StretchEngine, stretch_image
+from TiledImageItem import gray8_to_qimage
+
 HOME = os.getenv("HOME")
 
-def fits_to_qpixmap(fits_path: str, hdu_index: int = 0) -> QPixmap:
+FITS_SUFFIXES = (".fits", ".fit", ".fts", ".fits.gz", ".fit.gz", ".fits.fz")
+
+def fits_to_qpixmap(
+    fits_path: str, hdu_index: int = 0, stretch: Stretch = None
+) -> QPixmap:
     # Step 1: Open FITS file
     with fits.open(fits_path) as hdul:
         data = hdul[hdu_index].data
 
-    # Handle 2D image only
-    if data is None or data.ndim != 2:
-        raise ValueError("FITS file does not contain a 2D image.")
-
-    # Step 2: Normalize to 0-255
-    data = np.nan_to_num(data)  # Replace NaNs and infs with 0
-    data_min = np.min(data)
-    data_max = np.max(data)
-    if data_max == data_min:
-        norm_data = np.zeros_like(data, dtype=np.uint8)
-    else:
-        norm_data = 255 * (data - data_min) / (data_max - data_min)
-        norm_data = norm_data.astype(np.uint8)
-
-    # Step 3: Convert to QImage (grayscale format)
-    height, width = norm_data.shape
-    bytes_per_line = width
-    qimg = QImage(
-        norm_data.data, width, height, bytes_per_line, QImage.Format.Format_Grayscale8
-    )
-
-    # Step 4: Convert to QPixmap
-    return QPixmap.fromImage(qimg)
+        # Handle 2D image only
+        if data is None or data.ndim != 2:
+            raise ValueError("FITS file does not contain a 2D image.")
+
+        # Step 2: Stretch to 0-255 (linear min/max unless told otherwise)
+        norm_data = stretch_image(data, stretch)
+
+    # Step 3: Convert to QImage (grayscale format) and then QPixmap
+    return QPixmap.fromImage(gray8_to_qimage(norm_data))
+
+
+def select_image_hdu(hdul: fits.HDUList, hdu: Optional[str] = None) -> int:
+    """
+    Resolve `hdu` (an index or EXTNAME) to an HDU index, defaulting to the
+    first image HDU of the file
+    """
+    if hdu is not None:
+        return int(hdu) if str(hdu).isdigit() else hdul.index_of(hdu)
+    for info in build_hdu_index(hdul):
+        if info.type == HDUType.IMAGE:
+            return info.index
+    raise ValueError("no image HDU")
+
+
+def fits_to_preview(
+    fits_path: str, hdu: Optional[str] = None, stretch: Stretch = None, size: int = 0
+) -> QImage:
+    """
+    Render an image HDU to an 8-bit QImage whose longer side is at most
+    `size` pixels (0 keeps full resolution). Cubes are previewed by their
+    first plane. Needs no QApplication, so it is safe in worker processes.
+    """
+    with fits.open(fits_path) as hdul:
+        index = select_image_hdu(hdul, hdu)
+        shape = build_hdu_index(hdul)[index].shape
+        if len(shape) < 2:
+            raise ValueError(f"HDU {index} is not an image")
+
+        # The plane is read whole (a strided `section` read seeks per pixel
+        # and is far slower), then every k-th pixel is kept when the output
+        # is much smaller than the image; the final resize smooths the rest.
+        # Tile-compressed images only decompress the tiles holding sampled
+        # pixels.
+        lead = (0,) * (len(shape) - 2)
+        step = max(1, max(shape[-2:]) // (2 * size)) if size else 1
+        image_hdu = hdul[index]
+        if isinstance(image_hdu, fits.CompImageHDU) and not lead:
+            compressed = CompressedImage(image_hdu, shape)
+            data = compressed.region(0, shape[0], 0, shape[1], step)
+        else:
+            plane = image_hdu.section[lead] if lead else image_hdu.data
+            data = np.ascontiguousarray(plane[::step, ::step])
+
+    frame = StretchEngine(data).render(stretch or Stretch())
+    image = gray8_to_qimage(frame)
+    if size and max(image.width(), image.height()) > size:
+        image = image.scaled(
+            size,
+            size,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation,
+        )
+    return image